@@ -1194,6 +1194,8 @@ def demote(self, event=None):
     for child in followingSibs:
         child.parents.remove(parent_v)
         child.parents.append(p.v)
+    parent_v.childrenModified()
+    p.v.childrenModified()
     p.expand()
     # Even if p is an @ignore node there is no need to mark the demoted children dirty.
     dirtyVnodeList = p.setAllAncestorAtFileNodesDirty()
@@ -1452,6 +1454,7 @@ def sortSiblings(self, event=None,
     c.setChanged(True)
     bunch = u.beforeSort(p, undoType, oldChildren, newChildren, sortChildren)
     parent_v.children = newChildren
+    parent_v.childrenModified()
     if parent:
         dirtyVnodeList = parent.setAllAncestorAtFileNodesDirty()
     else:
@@ -71,6 +71,26 @@ class ControlCommandsClass(BaseEditCommandsClass):
         that enables the plugin.
         '''
         g.app.pluginsController.printPluginsInfo(self.c)
+    #@+node:dev.20261018330000.4: *3* plugin hook timing...
+    @cmd('show-plugin-hook-times')
+    def printPluginHookTimes(self, event=None):
+        '''
+        Print the number of calls, total time and maximum time of each plugin's
+        hook handlers, slowest first. Use toggle-plugin-hook-timing first.
+        '''
+        g.app.pluginsController.printHookTimes(self.c)
+
+    @cmd('toggle-plugin-hook-timing')
+    def togglePluginHookTiming(self, event=None):
+        '''
+        Start or stop timing all calls to plugin hook handlers.
+        Starting clears all previous times.
+        '''
+        pc = g.app.pluginsController
+        pc.timeHooks = not pc.timeHooks
+        if pc.timeHooks:
+            pc.hookTimes = {}
+        g.es('plugin hook timing %s' % ('on' if pc.timeHooks else 'off'))
     #@+node:ekr.20150514063305.93: *3* setSilentMode
     @cmd('set-silent-mode')
     def setSilentMode(self, event=None):
@@ -235,6 +235,8 @@ class LeoApp(object):
             # The singleton global db, managed by g.app.global_cacher.
         self.externalFilesController = None
             # The singleton ExternalFilesController instance.
+        self.fullTextIndex = None
+            # The singleton leoFullTextIndex.FullTextIndex instance, or None.
         self.global_cacher = None
             # The singleton leoCacher.GlobalCacher instance.
         self.idleTimeManager = None
@@ -1100,6 +1102,10 @@ class LeoApp(object):
         g.app.db = g.app.global_cacher.db
         g.app.commander_cacher = leoCache.CommanderCacher()
         g.app.commander_db = g.app.commander_cacher.db
+        # Write pending cache changes at idle time.
+        itm = g.app.idleTimeManager
+        if itm and leoCache.flush_caches not in itm.callback_list:
+            itm.add_callback(leoCache.flush_caches)
     #@+node:ekr.20031218072017.1978: *4* app.setLeoID & helpers
     def setLeoID(self, useDialog=True, verbose=True):
         '''Get g.app.leoID from various sources.'''
@@ -1591,6 +1597,12 @@ class LoadManager(object):
             # A g.TypedDict: the join of settings in leoSettings.leo & myLeoSettings.leo
         self.globalBindingsDict = None
             # A g.TypedDictOfLists: the join of shortcuts in leoSettings.leo & myLeoSettings.leo.
+        self.globalSettingsKey = None
+            # The snapshot key of the global settings, or None.
+            # Set by LM.readGlobalSettingsFiles.
+        self.pluginManifest = None
+            # A list of (kind, sfn, d) entries describing importer and writer plugins.
+            # Set by LM.createAllImporetersData.
         #
         # LoadManager ivars corresponding to user options...
         #
@@ -1975,6 +1987,12 @@ class LoadManager(object):
         isLeoSettings = g.shortFileName(fn).lower() == 'leosettings.leo'
         exists = g.os_path_exists(fn)
         if fn and exists and lm.isLeoFile(fn) and not isLeoSettings:
+            key = lm.computeSettingsSnapshotKey(fn, [fn])
+            data = lm.readSettingsSnapshot(key)
+            if data:
+                d1, d2 = data
+                return PreviousSettings(d1, d2)
+            state = lm.getConfigState()
             # Open the file usinging a null gui.
             try:
                 g.app.preReadFlag = True
@@ -1989,6 +2007,7 @@ class LoadManager(object):
                     # d1 and d2 are copies.
             d1.setName(settingsName)
             d2.setName(shortcutsName)
+            lm.writeSettingsSnapshot(key, state, (d1, d2))
             return PreviousSettings(d1, d2)
         #
         # The file does not exist, or is not valid.
@@ -2165,27 +2184,45 @@ class LoadManager(object):
         # Important: their commanders do not exist outside this method!
         paths = [lm.computeLeoSettingsPath(), lm.computeMyLeoSettingsPath()]
         old_commanders = g.app.commanders()
-        commanders = [lm.openSettingsFile(path) for path in paths]
-        commanders = [z for z in commanders if z]
-        settings_d, bindings_d = lm.createDefaultSettingsDicts()
-        for c in commanders:
-            # Merge the settings dicts from c's outline into
-            # *new copies of* settings_d and bindings_d.
-            settings_d, bindings_d = lm.computeLocalSettings(
-                c, settings_d, bindings_d, localFlag=False)
-        # Adjust the name.
-        bindings_d.setName('lm.globalBindingsDict')
+        commanders = []
+        lm.globalSettingsKey = None
+        key = lm.computeSettingsSnapshotKey('global', paths)
+        data = lm.readSettingsSnapshot(key)
+        if data:
+            settings_d, bindings_d = data
+        else:
+            state = lm.getConfigState()
+            commanders = [lm.openSettingsFile(path) for path in paths]
+            commanders = [z for z in commanders if z]
+            settings_d, bindings_d = lm.createDefaultSettingsDicts()
+            for c in commanders:
+                # Merge the settings dicts from c's outline into
+                # *new copies of* settings_d and bindings_d.
+                settings_d, bindings_d = lm.computeLocalSettings(
+                    c, settings_d, bindings_d, localFlag=False)
+            # Adjust the name.
+            bindings_d.setName('lm.globalBindingsDict')
+            lm.writeSettingsSnapshot(key, state, (settings_d, bindings_d))
+        lm.globalSettingsKey = key
         lm.globalSettingsDict = settings_d
         lm.globalBindingsDict = bindings_d
         # Add settings from --theme or @string theme-name files.
         # This must be done *after* reading myLeoSettigns.leo.
         theme_path = lm.computeThemeFilePath()
         if theme_path:
-            theme_c = lm.openSettingsFile(theme_path)
-            if theme_c:
-                # Merge theme_c's settings into globalSettingsDict.
-                settings_d, junk_shortcuts_d = lm.computeLocalSettings(
-                    theme_c, settings_d, bindings_d, localFlag=False)
+            key = lm.computeSettingsSnapshotKey('theme', [theme_path])
+            data = lm.readSettingsSnapshot(key)
+            if data is None:
+                state = lm.getConfigState()
+                theme_c = lm.openSettingsFile(theme_path)
+                if theme_c:
+                    # Merge theme_c's settings into globalSettingsDict.
+                    data, junk_shortcuts_d = lm.computeLocalSettings(
+                        theme_c, settings_d, bindings_d, localFlag=False)
+                    lm.writeSettingsSnapshot(key, state, data)
+                    commanders.append(theme_c)
+            if data:
+                settings_d = data
                 lm.globalSettingsDict = settings_d
                 # Set global vars
                 g.app.theme_directory = g.os_path_dirname(theme_path)
@@ -2207,6 +2244,105 @@ class LoadManager(object):
         for c in commanders:
             if c not in old_commanders:
                 g.app.forgetOpenFile(c.fileName())
+    #@+node:dev.20261018200000.1: *4* LM.Settings snapshots
+    # Reading settings files is slow: it creates a commander, parses the
+    # entire .leo file and traverses all @settings trees. Snapshots of the
+    # resulting settings and shortcuts dicts live in g.app.db.
+
+    settingsSnapshotIvars = (
+        'atCommonButtonsList', 'atCommonCommandsList', 'buttonsFileName',
+        'context_menus', 'enabledPluginsFileName', 'enabledPluginsString',
+        'menusFileName', 'menusList', 'modeCommandsDict',
+    )
+        # The g.app.config ivars that the settings parsers may change.
+    #@+node:dev.20261018200000.2: *5* LM.computeSettingsSnapshotKey
+    def computeSettingsSnapshotKey(self, tag, paths):
+        '''
+        Return the key for a snapshot of the settings in the given files, or
+        None if snapshots must not be used.
+
+        The key contains the paths, sizes and modification times of the files,
+        the key of the global settings, Leo's version and Python's version.
+        '''
+        import leo.core.leoVersion as leoVersion
+        lm = self
+        if g.app.db is None or g.app.trace_setting or g.app.trace_binding:
+            return None
+        if tag != 'global' and not lm.globalSettingsKey:
+            return None
+        sources = []
+        for path in paths:
+            if not path:
+                continue
+            try:
+                st = os.stat(path)
+                sources.append((path, st.st_size, st.st_mtime))
+            except OSError:
+                sources.append((path, None, None))
+        return (tag, leoVersion.version, leoVersion.build,
+            tuple(sys.version_info[:2]), tuple(sources), lm.globalSettingsKey)
+    #@+node:dev.20261018200000.3: *5* LM.getConfigState
+    def getConfigState(self):
+        '''
+        Return a dict describing the g.app.config ivars that reading settings
+        files may change. Keys are ivar names, values are pickles, or
+        (id, len) tuples for values that can not be pickled.
+        '''
+        import pickle
+        d = {}
+        for ivar in self.settingsSnapshotIvars:
+            val = getattr(g.app.config, ivar, None)
+            try:
+                if ivar.startswith('atCommon') and val:
+                    raise TypeError # Positions.
+                d[ivar] = pickle.dumps(val, protocol=2)
+            except Exception:
+                d[ivar] = id(val), len(val) if isinstance(val, list) else 0
+        return d
+    #@+node:dev.20261018200000.4: *5* LM.readSettingsSnapshot
+    def readSettingsSnapshot(self, key):
+        '''
+        Return the value saved by LM.writeSettingsSnapshot for the given key, or
+        None. Restore the g.app.config ivars that were set when computing the value.
+        '''
+        import pickle
+        if not key:
+            return None
+        try:
+            s = g.app.db.get('settings-snapshot:::%s' % key[0])
+            if not s:
+                return None
+            key2, config_d, value = pickle.loads(s)
+            if key2 != key:
+                return None
+            for ivar, s2 in config_d.items():
+                setattr(g.app.config, ivar, pickle.loads(s2))
+        except Exception:
+            return None
+        return value
+    #@+node:dev.20261018200000.5: *5* LM.writeSettingsSnapshot
+    def writeSettingsSnapshot(self, key, state, value):
+        '''
+        Save a snapshot of value, which must be picklable, and of the changes
+        to g.app.config made since lm.getConfigState returned state.
+
+        Do nothing if the settings files set unpicklable values, such as the
+        positions of @button and @command nodes.
+        '''
+        import pickle
+        if not key:
+            return
+        config_d = {}
+        for ivar, s in self.getConfigState().items():
+            if s != state.get(ivar):
+                if isinstance(s, tuple):
+                    return
+                config_d[ivar] = s
+        try:
+            s = pickle.dumps((key, config_d, value), protocol=2)
+            g.app.db['settings-snapshot:::%s' % key[0]] = s
+        except Exception:
+            pass
     #@+node:ekr.20120214165710.10838: *4* LM.traceSettingsDict
     def traceSettingsDict(self, d, verbose=False):
         if verbose:
@@ -2400,6 +2536,8 @@ class LoadManager(object):
         # Init the app.
         lm.initApp(verbose)
         g.app.setGlobalDb()
+        lm.createAllImporetersData()
+            # Uses g.app.loadDir and g.app.db.
         lm.reportDirectories(verbose)
         # Read settings *after* setting g.app.config and *before* opening plugins.
         # This means if-gui has effect only in per-file settings.
@@ -2420,13 +2558,95 @@ class LoadManager(object):
         New in Leo 5.5:
 
         Create global data structures describing importers and writers.
+
+        Use the cached plugin manifest if possible, so that plugin modules
+        are imported only when their classes are first used.
         '''
         assert g.app.loadDir
             # This is the only data required.
+        key = self.computePluginManifestKey()
+        if self.readPluginManifest(key):
+            return
+        self.pluginManifest = []
         self.createWritersData()
             # Was an AtFile method.
         self.createImporterData()
             # Was a LeoImportCommands method.
+        self.writePluginManifest(key)
+    #@+node:dev.20261018210000.1: *6* LM.Plugin manifest
+    #@+node:dev.20261018210000.2: *7* LM.addToPluginManifest
+    def addToPluginManifest(self, kind, sfn, m):
+        '''
+        Add an entry describing m, an importer or writer module, to the plugin
+        manifest. Invalidate the manifest if m's class can not be found by name.
+        '''
+        manifest = self.pluginManifest
+        if manifest is None:
+            return
+        if any(z[0] == kind and z[1] == sfn for z in manifest):
+            return
+        d = getattr(m, kind + '_dict', None)
+        if d:
+            aClass = d.get('class')
+            name = getattr(aClass, '__name__', None)
+            if not name or getattr(m, name, None) is not aClass:
+                self.pluginManifest = None
+                return
+            d = {
+                '@auto': list(d.get('@auto', [])),
+                'class': (m.__name__, name),
+                'extensions': list(d.get('extensions', [])),
+            }
+        manifest.append((kind, sfn, d))
+    #@+node:dev.20261018210000.3: *7* LM.computePluginManifestKey
+    def computePluginManifestKey(self):
+        '''
+        Return the key of the plugin manifest: the names, sizes and modification
+        times of all importer and writer modules, and Leo's and Python's versions.
+        '''
+        import leo.core.leoVersion as leoVersion
+        sources = []
+        for kind in ('importers', 'writers'):
+            pattern = g.os_path_finalize_join(
+                g.app.loadDir, '..', 'plugins', kind, '*.py')
+            for fn in sorted(g.glob_glob(pattern)):
+                try:
+                    st = os.stat(fn)
+                    sources.append((kind, g.shortFileName(fn), st.st_size, st.st_mtime))
+                except OSError:
+                    pass
+        return (leoVersion.version, leoVersion.build,
+            tuple(sys.version_info[:2]), tuple(sources))
+    #@+node:dev.20261018210000.4: *7* LM.readPluginManifest
+    def readPluginManifest(self, key):
+        '''
+        Create the importer and writer data from the cached plugin manifest,
+        using LazyPluginClass instances instead of classes.
+        Return True if the manifest exists and matches the key.
+        '''
+        if g.app.db is None:
+            return False
+        data = g.app.db.get('plugin-manifest')
+        if not data or data[0] != key:
+            return False
+        g.app.writersDispatchDict = {}
+        g.app.atAutoWritersDict = {}
+        for kind, sfn, d in data[1]:
+            if d:
+                d = d.copy()
+                d['class'] = LazyPluginClass(*d['class'])
+            m = g.Bunch(__file__=sfn, importer_dict=d, writer_dict=d)
+            if kind == 'importer':
+                self.parse_importer_dict(sfn, m)
+            else:
+                self.parse_writer_dict(sfn, m)
+        self.pluginManifest = data[1]
+        return True
+    #@+node:dev.20261018210000.5: *7* LM.writePluginManifest
+    def writePluginManifest(self, key):
+        '''Save the plugin manifest if all plugins were imported without error.'''
+        if g.app.db is not None and self.pluginManifest is not None:
+            g.app.db['plugin-manifest'] = (key, self.pluginManifest)
     #@+node:ekr.20140724064952.18037: *6* LM.createImporterData & helper
     def createImporterData(self):
         '''Create the data structures describing importer plugins.'''
@@ -2446,7 +2666,9 @@ class LoadManager(object):
                         m = importlib.import_module(
                             'leo.plugins.importers.%s' % module_name)
                         self.parse_importer_dict(sfn, m)
+                        self.addToPluginManifest('importer', sfn, m)
                     except Exception:
+                        self.pluginManifest = None
                         g.warning('can not import leo.plugins.importers.%s' % (
                             module_name))
     #@+node:ekr.20140723140445.18076: *7* LM.parse_importer_dict
@@ -2501,7 +2723,9 @@ class LoadManager(object):
                         # Important: use importlib to give imported modules their fully qualified names.
                         m = importlib.import_module('leo.plugins.writers.%s' % sfn[: -3])
                         self.parse_writer_dict(sfn, m)
+                        self.addToPluginManifest('writer', sfn, m)
                     except Exception:
+                        self.pluginManifest = None
                         g.es_exception()
                         g.warning('can not import leo.plugins.writers.%s' % sfn)
         if trace:
@@ -2611,11 +2835,10 @@ class LoadManager(object):
     #@+node:ekr.20120219154958.10484: *5* LM.initApp
     def initApp(self, verbose):
 
-        self.createAllImporetersData()
-            # Can be done early. Uses only g.app.loadDir
         assert g.app.loadManager
         import leo.core.leoBackground as leoBackground
         import leo.core.leoConfig as leoConfig
+        import leo.core.leoFullTextIndex as leoFullTextIndex
         import leo.core.leoNodes as leoNodes
         import leo.core.leoPlugins as leoPlugins
         import leo.core.leoSessions as leoSessions
@@ -2639,6 +2862,7 @@ class LoadManager(object):
         g.app.sessionManager = leoSessions.SessionManager()
         # Complete the plugins class last.
         g.app.pluginsController.finishCreate()
+        leoFullTextIndex.init()
     #@+node:ekr.20120219154958.10486: *5* LM.scanOptions & helpers
     def scanOptions(self, fileName, pymacs):
         '''Handle all options, remove them from sys.argv and set lm.options.'''
@@ -3304,6 +3528,45 @@ class LoadManager(object):
             c.fileCommands.getLeoFile(theFile, fn, checkOpenFiles=False)
                 # Closes the file.
     #@-others
+#@+node:dev.20261018210000.6: ** class LazyPluginClass
+class LazyPluginClass(object):
+    '''
+    A stand-in for an importer or writer class in g.app.classDispatchDict,
+    g.app.atAutoDict, g.app.writersDispatchDict and g.app.atAutoWritersDict.
+
+    Calling the stand-in imports the class's module and instantiates the class.
+    '''
+
+    def __init__(self, module_name, class_name):
+        self.module_name = module_name
+        self.__name__ = class_name
+        self.aClass = None
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPluginClass):
+            return (self.module_name, self.__name__) == (other.module_name, other.__name__)
+        return self.resolve() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.module_name, self.__name__))
+
+    def __repr__(self):
+        return '<LazyPluginClass %s.%s>' % (self.module_name, self.__name__)
+
+    __str__ = __repr__
+
+    def resolve(self):
+        '''Import the module and return the actual class.'''
+        if not self.aClass:
+            m = importlib.import_module(self.module_name)
+            self.aClass = getattr(m, self.__name__)
+        return self.aClass
 #@+node:ekr.20120223062418.10420: ** class PreviousSettings
 class PreviousSettings(object):
     '''A class holding the settings and shortcuts dictionaries
@@ -9,6 +9,7 @@
 import leo.core.leoGlobals as g
 import leo.core.leoBeautify as leoBeautify
 import leo.core.leoNodes as leoNodes
+import hashlib
 import os
 import re
 import sys
@@ -57,6 +58,18 @@ class AtFile(object):
         self.checkPythonCodeOnWrite = False
         self.runPyFlakesOnWrite = False
         self.underindentEscapeString = '\\-'
+        self.readInParallel = False
+        self.useReadCache = True
+        # Data computed by at.prescanExternalFiles.
+        self.prescannedFiles = {}
+        # Read cache statistics: reset in readAll.
+        self.readCacheHits = 0
+        self.readCacheMisses = 0
+        # The outline file name at the last full scan in at.writeAll.
+        self.fullWriteAllFileName = None
+        # Keys are normalized paths, values are (size, mtime, digest) tuples.
+        # Set by at.rememberFileDigest, used by at.fileDigestMatches.
+        self.fileDigests = {}
         self.reloadSettings()
     #@+node:ekr.20171113152939.1: *5* at.reloadSettings
     def reloadSettings(self):
@@ -68,6 +81,10 @@ class AtFile(object):
             'run-pyflakes-on-write', default=False)
         self.underindentEscapeString = c.config.getString(
             'underindent-escape-string') or '\\-'
+        self.readInParallel = c.config.getBool(
+            'read-external-files-in-parallel', default=False)
+        self.useReadCache = c.config.getBool(
+            'use-read-cache', default=True)
     #@+node:ekr.20150509194251.1: *4* at.cmd (decorator)
     def cmd(name):
         '''Command decorator for the AtFileCommands class.'''
@@ -350,14 +367,22 @@ class AtFile(object):
         if at.errors:
             return False
 
-        fileName, file_s = at.openFileForReading(fromString=fromString)
-            # For @shadow files, calls x.updatePublicAndPrivateFiles.
-            # Calls at.initReadLine(s), where s is the file contents.
-            # This will be used only if not cached.
-        
+        prescanned = None
+        if at.prescannedFiles and not (fromString or importFileName or atShadow):
+            prescanned = at.prescannedFiles.pop((root.gnx, g.fullPath(c, root)), None)
+        if prescanned:
+            # A worker process has already read and scanned the file.
+            fileName, file_s = g.fullPath(c, root), None
+            at.setPathUa(root, fileName)
+            at.warnOnReadOnlyFile(fileName)
+        else:
+            fileName, file_s = at.openFileForReading(fromString=fromString)
+                # For @shadow files, calls x.updatePublicAndPrivateFiles.
+                # Calls at.initReadLine(s), where s is the file contents.
+                # This will be used only if not cached.
         #
         # Set the time stamp.
-        if fileName and at.inputFile:
+        if fileName and (at.inputFile or prescanned):
             c.setFileTimeStamp(fileName)
         elif not fileName and not fromString and not file_s:
             return False
@@ -373,7 +398,16 @@ class AtFile(object):
                 # at.tab_width
         gnx2vnode = c.fileCommands.gnxDict
         contents = fromString or file_s
-        FastAtRead(c, gnx2vnode).read_into_root(contents, fileName, root)
+        use_cache = at.useReadCache and not fromString
+        fast = FastAtRead(c, gnx2vnode, use_cache=use_cache)
+        if prescanned:
+            fast.read_prescanned_data(prescanned, fileName, root)
+        else:
+            fast.read_into_root(contents, fileName, root)
+            if fast.cache_hit:
+                at.readCacheHits += 1
+            elif use_cache:
+                at.readCacheMisses += 1
         root.clearDirty()
         return True
     #@+node:ekr.20100122130101.6174: *6* at.deleteTnodeList
@@ -476,8 +510,13 @@ class AtFile(object):
             valid, new_df, start, end, isThin = at.parseLeoSentinel(line)
             return not isThin
     #@+node:ekr.20041005105605.26: *5* at.readAll
-    def readAll(self, root, force=False):
-        """Scan positions, looking for @<file> nodes to read."""
+    def readAll(self, root, force=False, unchanged=None):
+        """
+        Scan positions, looking for @<file> nodes to read.
+
+        unchanged is None or a function f(p). Don't read @<file> nodes p
+        for which f(p) is True: the outline already contains the file.
+        """
         at, c = self, self.c
         use_tracer = False
         if use_tracer: tt = g.startTracer()
@@ -487,63 +526,131 @@ class AtFile(object):
             c.endEditing()
         t1 = time.time()
         nRead = 0
-        p = root.copy()
+        at.readCacheHits = at.readCacheMisses = 0
         scanned_tnodes = set()
         c.init_error_dialogs()
-        after = p.nodeAfterTree() if force else None
-        while p and p != after:
-            data = (p.gnx, g.fullPath(c, p))
+        after = root.nodeAfterTree() if force else None
+        if at.readInParallel:
+            at.prescanExternalFiles(root, after, unchanged)
+        # Create positions only for @<file> nodes and other @ nodes.
+        walker = root.walk_self_and_subtree() if force else c.walk_all_nodes()
+        for v, depth, parent_v, n in walker:
+            if v.h.startswith('@'):
+                p = walker.position()
+                data = (v.gnx, g.fullPath(c, p))
+            else:
+                # The walker never enters @<file> trees,
+                # so g.fullPath(c, p) would return ''.
+                data = (v.gnx, '')
             #skip clones referring to exactly the same paths.
             if data in scanned_tnodes:
-                p.moveToNodeAfterTree()
+                walker.skip()
                 continue
             scanned_tnodes.add(data)
-            if not p.h.startswith('@'):
-                p.moveToThreadNext()
+            if not v.h.startswith('@'):
+                pass
             elif p.isAtIgnoreNode():
                 if p.isAnyAtFileNode():
                     c.ignored_at_file_nodes.append(p.h)
-                p.moveToNodeAfterTree()
+                walker.skip()
+            elif unchanged and p.isAnyAtFileNode() and unchanged(p):
+                at.rememberReadPath(data[1], p)
+                walker.skip()
             elif p.isAtThinFileNode():
                 nRead += 1
                 at.read(p, force=force)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtAutoNode():
                 nRead += 1
                 fileName = p.atAutoNodeName()
                 at.readOneAtAutoNode(fileName, p)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtEditNode():
                 nRead += 1
                 fileName = p.atEditNodeName()
                 at.readOneAtEditNode(fileName, p)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtShadowFileNode():
                 nRead += 1
                 fileName = p.atShadowFileNodeName()
                 at.readOneAtShadowNode(fileName, p)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtFileNode():
                 nRead += 1
                 at.read(p, force=force)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtAsisFileNode() or p.isAtNoSentFileNode():
                 at.rememberReadPath(g.fullPath(c, p), p)
-                p.moveToNodeAfterTree()
+                walker.skip()
             elif p.isAtCleanNode():
                 nRead += 1
                 at.readOneAtCleanNode(p)
-                p.moveToNodeAfterTree()
-            else:
-                p.moveToThreadNext()
+                walker.skip()
         if not g.unitTesting:
             if nRead:
                 t2 = time.time()
-                g.es('read %s files in %2.2f seconds' % (nRead, t2 - t1))
+                if at.readCacheHits or at.readCacheMisses:
+                    g.es('read %s files in %2.2f seconds (cache: %s hits, %s misses)' % (
+                        nRead, t2 - t1, at.readCacheHits, at.readCacheMisses))
+                else:
+                    g.es('read %s files in %2.2f seconds' % (nRead, t2 - t1))
             elif force:
                 g.es("no @<file> nodes in the selected tree")
+        at.prescannedFiles = {}
         if use_tracer: tt.stop()
         c.raise_error_dialogs()
+    #@+node:dev.20261018100000.1: *6* at.prescanExternalFiles
+    def prescanExternalFiles(self, root, after, unchanged=None):
+        '''
+        Read and scan all @file and @thin nodes from root to after in
+        worker processes, setting at.prescannedFiles.
+        unchanged is the function of the same name passed to at.readAll.
+
+        at.read merges the plain-data results into the outline, in outline
+        order, on the main thread. Other @<file> nodes are read as usual.
+        '''
+        at, c = self, self.c
+        at.prescannedFiles = {}
+        try:
+            import concurrent.futures as futures
+        except ImportError:
+            return
+        # Find the files, skipping the same nodes as at.readAll.
+        jobs, seen = [], set()
+        p = root.copy()
+        while p and p != after:
+            if not p.h.startswith('@'):
+                p.moveToThreadNext()
+            elif p.isAtIgnoreNode():
+                p.moveToNodeAfterTree()
+            elif p.isAtThinFileNode() or p.isAtFileNode():
+                data = (p.gnx, g.fullPath(c, p))
+                if unchanged and unchanged(p):
+                    pass
+                elif data not in seen and g.os_path_exists(data[1]):
+                    seen.add(data)
+                    jobs.append(data)
+                p.moveToNodeAfterTree()
+            elif p.isAnyAtFileNode():
+                p.moveToNodeAfterTree()
+            else:
+                p.moveToThreadNext()
+        if len(jobs) < 2:
+            return
+        encoding = c.config.default_derived_file_encoding
+        gnxs = [gnx for gnx, path in jobs]
+        paths = [path for gnx, path in jobs]
+        encodings = [encoding] * len(jobs)
+        try:
+            with futures.ProcessPoolExecutor() as executor:
+                results = list(executor.map(scan_external_file,
+                    paths, gnxs, encodings, chunksize=8))
+        except Exception:
+            g.es_exception()
+            return
+        for data, result in zip(jobs, results):
+            if result:
+                at.prescannedFiles[data] = result
     #@+node:ekr.20080801071227.7: *5* at.readAtShadowNodes
     def readAtShadowNodes(self, p):
         '''Read all @shadow nodes in the p's tree.'''
@@ -638,7 +745,7 @@ class AtFile(object):
     #@+node:ekr.20150204165040.5: *5* at.readOneAtCleanNode & helpers
     def readOneAtCleanNode(self, root):
         '''Update the @clean/@nosent node at root.'''
-        at, c, x = self, self.c, self.c.shadowController
+        at, c = self, self.c
         fileName = g.fullPath(c, root)
         if not g.os_path_exists(fileName):
             g.es_print('not found: %s' % (fileName), color='red',
@@ -650,6 +757,25 @@ class AtFile(object):
         at.scanAllDirectives(root)
             # Sets at.startSentinelComment/endSentinelComment.
         new_public_lines = at.read_at_clean_lines(fileName)
+        if at.useReadCache:
+            # Nothing can change if neither the file nor the tree
+            # has changed since this node was last read.
+            key = 'at-clean-read-cache:%s' % g.os_path_normcase(fileName)
+            digest = at.contentsDigest(''.join(new_public_lines))
+            if at.getReadCache(key) == (digest, at.treeDigest(root)):
+                at.readCacheHits += 1
+                root.clearOrphan()
+                return True
+            at.readCacheMisses += 1
+            try:
+                return at.readOneAtCleanNodeHelper(root, fileName, new_public_lines)
+            finally:
+                at.setReadCache(key, (digest, at.treeDigest(root)))
+        return at.readOneAtCleanNodeHelper(root, fileName, new_public_lines)
+    #@+node:dev.20261018090000.1: *6* at.readOneAtCleanNodeHelper
+    def readOneAtCleanNodeHelper(self, root, fileName, new_public_lines):
+        '''Update the @clean/@nosent node at root from new_public_lines.'''
+        at, c, x = self, self.c, self.c.shadowController
         old_private_lines = self.write_at_clean_sentinels(root)
         marker = x.markerFromFileLines(old_private_lines, fileName)
         old_public_lines, junk = x.separate_sentinels(old_private_lines, marker)
@@ -747,6 +873,44 @@ class AtFile(object):
         '''A convenience wrapper for FastAtReAD.read_into_root()'''
         return FastAtRead(c, gnx2vnode).read_into_root(contents, path, root)
     #@+node:ekr.20041005105605.116: *4* at.Reading utils...
+    #@+node:dev.20261018090000.2: *5* at.Read cache
+    # The read cache lives in g.app.commander_db. It allows at.read and
+    # at.readOneAtCleanNode to skip unchanged external files.
+    #@+node:dev.20261018090000.3: *6* at.contentsDigest
+    def contentsDigest(self, s):
+        '''Return the md5 hex digest of s, a unicode string.'''
+        return hashlib.md5(g.toEncodedString(s, encoding='utf-8')).hexdigest()
+    #@+node:dev.20261018090000.4: *6* at.get/setReadCache
+    def getReadCache(self, key):
+        '''Return the value of key in the read cache, or None.'''
+        db = g.app.commander_db
+        if db is None:
+            return None
+        try:
+            return db.get(key)
+        except Exception:
+            return None
+
+    def setReadCache(self, key, value):
+        '''Set the value of key in the read cache.'''
+        db = g.app.commander_db
+        if db is not None:
+            try:
+                db[key] = value
+            except Exception:
+                g.es_exception()
+    #@+node:dev.20261018090000.5: *6* at.treeDigest
+    def treeDigest(self, root):
+        '''
+        Return the md5 hex digest of the structure,
+        headlines and bodies of root's tree.
+        '''
+        h = hashlib.md5()
+        for p in root.self_and_subtree(copy=False):
+            s = '%s %s %s %s\n%s' % (
+                p.level(), p.gnx, len(p.v._bodyString), p.v._headString, p.v._bodyString)
+            h.update(g.toEncodedString(s, encoding='utf-8'))
+        return h.hexdigest()
     #@+node:ekr.20041005105605.119: *5* at.createImportedNode
     def createImportedNode(self, root, headline):
         at = self
@@ -843,6 +1007,7 @@ class AtFile(object):
         at = self
         s = at.openFileHelper(fn)
         if s is not None:
+            at.rememberFileDigest(fn, s)
             e, s = g.stripBOM(s)
             if e:
                 # The BOM determines the encoding unambiguously.
@@ -1217,39 +1382,38 @@ class AtFile(object):
             # Write all nodes in the selected tree.
             root = c.p
             p = c.p
-            after = p.nodeAfterTree()
+            roots = None
         else:
             # Write dirty nodes in the entire outline.
             root = c.rootPosition()
             p = c.rootPosition()
-            after = None
-        at.clearAllOrphanBits(p)
+            roots = at.findDirtyRoots()
+        if roots is None:
+            at.clearAllOrphanBits(p)
+            roots = at.findAllRoots(p if writeAtFileNodesFlag else None)
+            if not writeAtFileNodesFlag:
+                at.fullWriteAllFileName = c.mFileName
         # Leo 5.6: write files only once.
         seen = set()
-        while p and p != after:
+        for p in roots:
             if p.isAtIgnoreNode() and not p.isAtAsisFileNode():
-                if p.isAnyAtFileNode():
-                    c.ignored_at_file_nodes.append(p.h)
                 # Note: @ignore not honored in @asis nodes.
-                p.moveToNodeAfterTree() # 2011/10/08: Honor @ignore!
-            elif p.isAnyAtFileNode():
-                data = p.v, g.fullPath(c, p)
-                if data not in seen:
-                    seen.add(data)
-                    try:
-                        self.writeAllHelper(p, root, force, toString, writeAtFileNodesFlag, writtenFiles)
-                    except Exception:
-                        # Fix bug 1260415: https://bugs.launchpad.net/leo-editor/+bug/1260415
-                        # Give a more urgent, more specific, more helpful message.
-                        g.es_exception()
-                        g.es('Internal error writing: %s' % (p.h), color='red')
-                        g.es('Please report this error to:', color='blue')
-                        g.es('https://groups.google.com/forum/#!forum/leo-editor', color='blue')
-                        g.es('Warning: changes to this file will be lost', color='red')
-                        g.es('unless you can save the file successfully.', color='red')
-                p.moveToNodeAfterTree()
-            else:
-                p.moveToThreadNext()
+                c.ignored_at_file_nodes.append(p.h)
+                continue
+            data = p.v, g.fullPath(c, p)
+            if data not in seen:
+                seen.add(data)
+                try:
+                    self.writeAllHelper(p, root, force, toString, writeAtFileNodesFlag, writtenFiles)
+                except Exception:
+                    # Fix bug 1260415: https://bugs.launchpad.net/leo-editor/+bug/1260415
+                    # Give a more urgent, more specific, more helpful message.
+                    g.es_exception()
+                    g.es('Internal error writing: %s' % (p.h), color='red')
+                    g.es('Please report this error to:', color='blue')
+                    g.es('https://groups.google.com/forum/#!forum/leo-editor', color='blue')
+                    g.es('Warning: changes to this file will be lost', color='red')
+                    g.es('unless you can save the file successfully.', color='red')
         # Make *sure* these flags are cleared for other commands.
         at.canCancelFlag = False
         at.cancelFlag = False
@@ -1275,12 +1439,84 @@ class AtFile(object):
     def clearAllOrphanBits(self, p):
         '''Clear orphan bits for all nodes *except* orphan @file nodes.'''
         # 2011/06/15: Important bug fix: retain orphan bits for @file nodes.
-        for p2 in p.self_and_subtree(copy=False):
-            if p2.isOrphan():
-                if p2.isAnyAtFileNode():
+        for v, depth, parent_v, n in p.walk_self_and_subtree():
+            if v.isOrphan():
+                if v.isAnyAtFileNode():
                     pass
                 else:
-                    p2.clearOrphan()
+                    v.clearOrphan()
+    #@+node:dev.20261018110000.1: *6* at.findAllRoots
+    def findAllRoots(self, p=None):
+        '''
+        Yield positions of all @<file> nodes in p's tree, or in the entire
+        outline if p is None. Yield @ignore'd @<file> nodes, but not their
+        descendants.
+        '''
+        c = self.c
+        walker = p.walk_self_and_subtree() if p else c.walk_all_nodes()
+        for v, depth, parent_v, n in walker:
+            if v.isAtIgnoreNode() and not v.isAtAsisFileNode():
+                if v.isAnyAtFileNode():
+                    yield walker.position()
+                # Note: @ignore not honored in @asis nodes.
+                walker.skip() # 2011/10/08: Honor @ignore!
+            elif v.isAnyAtFileNode():
+                yield walker.position()
+                walker.skip()
+    #@+node:dev.20261018110000.2: *6* at.findDirtyRoots & helper
+    def findDirtyRoots(self):
+        '''
+        Return the list of all positions of dirty @<file> nodes, in outline order,
+        using c.dirtyVnodes instead of scanning the entire outline.
+
+        Return None if at.writeAll must scan the outline:
+        - The first time the outline is written, or after Save As.
+        - When a dirty node might change the path of other @<file> nodes.
+        '''
+        at, c = self, self.c
+        if at.fullWriteAllFileName != c.mFileName:
+            return None
+        dirtyRoots = []
+        for v in list(c.dirtyVnodes):
+            if not v.isDirty():
+                continue
+            if v.isAnyAtFileNode():
+                dirtyRoots.append(v)
+            elif '@path' in v.h or '@path' in v.b:
+                return None
+            elif v.isOrphan():
+                # Only @<file> nodes keep their orphan bits.
+                v.clearOrphan()
+        result = []
+        for v in dirtyRoots:
+            for stack in at.findAllStacks(v):
+                # Like at.findAllRoots, skip nodes in @ignore or @<file> trees.
+                for v2, n in stack[:-1]:
+                    if v2.isAnyAtFileNode():
+                        break
+                    if v2.isAtIgnoreNode() and not v2.isAtAsisFileNode():
+                        break
+                else:
+                    result.append(stack)
+        result.sort(key=lambda stack: [n for v2, n in stack])
+        return [leoNodes.Position(stack[-1][0], stack[-1][1], stack[:-1])
+            for stack in result]
+    #@+node:dev.20261018110000.3: *7* at.findAllStacks
+    def findAllStacks(self, v):
+        '''
+        Return a list of (v, childIndex) stacks, one for each position of v.
+        The last entry of each stack is for v itself.
+        '''
+        c = self.c
+        if v is c.hiddenRootNode:
+            return [[]]
+        result = []
+        for parent in set(v.parents):
+            for n, child in enumerate(parent.children):
+                if child is v:
+                    for stack in self.findAllStacks(parent):
+                        result.append(stack + [(v, n)])
+        return result
     #@+node:ekr.20041005105605.149: *6* at.writeAllHelper & helper
     def writeAllHelper(self, p, root,
         force, toString, writeAtFileNodesFlag, writtenFiles
@@ -2547,6 +2783,55 @@ class AtFile(object):
             return at.stringOutput
         else:
             return None
+    #@+node:dev.20261018120000.2: *5* at.File digests
+    # at.fileDigests remembers the md5 digest of the contents of each external
+    # file that Leo has read or written, along with the file's size and mtime.
+    # When the size and mtime are unchanged, and the new contents have the
+    # same digest, at.replaceTargetFileIfDifferent need not read the file.
+    #@+node:dev.20261018120000.3: *6* at.fileDigestKey
+    def fileDigestKey(self, fn):
+        '''Return (key, stat) for fn, or (None, None) if fn does not exist.'''
+        try:
+            stat = os.stat(fn)
+        except OSError:
+            return None, None
+        key = g.os_path_normcase(g.os_path_realpath(fn))
+        return key, stat
+    #@+node:dev.20261018120000.4: *6* at.fileDigestMatches
+    def fileDigestMatches(self, fn, s):
+        '''
+        Return True if the file fn is known to contain exactly the bytes that
+        at.create would write for s.
+        '''
+        at = self
+        if s is None:
+            return False
+        key, stat = at.fileDigestKey(fn)
+        data = key and at.fileDigests.get(key)
+        if not data:
+            return False
+        size, mtime, digest = data
+        if size != stat.st_size or mtime != stat.st_mtime:
+            # The file has changed since Leo last read or wrote it.
+            del at.fileDigests[key]
+            return False
+        b = at.outputBytes(s)
+        return len(b) == size and hashlib.md5(b).hexdigest() == digest
+    #@+node:dev.20261018120000.5: *6* at.rememberFileDigest
+    def rememberFileDigest(self, fn, b):
+        '''
+        Remember the digest of b, the encoded contents of fn
+        just read from, or written to, the file system.
+        '''
+        at = self
+        key, stat = at.fileDigestKey(fn)
+        if not key:
+            return
+        if stat.st_size == len(b):
+            at.fileDigests[key] = stat.st_size, stat.st_mtime, hashlib.md5(b).hexdigest()
+        else:
+            # The file changed after it was read.
+            at.fileDigests.pop(key, None)
     #@+node:ekr.20041005105605.197: *5* at.compareFiles
     def compareFiles(self, path1, path2, ignoreLineEndings, ignoreBlankLines=False):
         """Compare two text files."""
@@ -2562,6 +2847,7 @@ class AtFile(object):
         if s2 is None:
             g.internalError('empty compare file: %s' % path2)
             return False
+        at.rememberFileDigest(path2, s2)
         # 2013/10/28: fix bug #1243855: @auto-rst doesn't save text
         # Make sure both strings are unicode.
         # This is requred to handle binary files in Python 3.x.
@@ -2907,7 +3193,7 @@ class AtFile(object):
         else:
             timestamp = ''
         if g.os_path_exists(at.targetFileName):
-            if at.compareFiles(
+            if at.fileDigestMatches(at.targetFileName, at.outputContents) or at.compareFiles(
                 at.outputFileName,
                 at.targetFileName,
                 ignoreLineEndings=not at.explicitLineEnding,
@@ -3043,24 +3329,31 @@ class AtFile(object):
     def create(self, fn, s):
         '''Create a file whose contents are s.'''
         at = self
-        # 2015/07/15: do this before converting to encoded string.
-        if at.output_newline != '\n':
-            s = s.replace('\r', '').replace('\n', at.output_newline)
-        # This is part of the new_write logic.
-        # This is the only call to g.toEncodedString in the new_write logic.
-        # 2013/10/28: fix bug 1243847: unicode error when saving @shadow nodes
-        if g.isUnicode(s):
-            s = g.toEncodedString(s, encoding=at.encoding)
+        s = at.outputBytes(s)
         try:
             f = open(fn, 'wb') # Must be 'wb' to preserve line endings.
             f.write(s)
             f.close()
+            at.rememberFileDigest(fn, s)
         except Exception:
             f = None
             g.es_exception()
             g.error('error writing', fn)
             g.es('not written:', fn)
         return bool(f)
+    #@+node:dev.20261018120000.1: *5* at.outputBytes
+    def outputBytes(self, s):
+        '''Return the encoded string that at.create would write for s.'''
+        at = self
+        # 2015/07/15: do this before converting to encoded string.
+        if at.output_newline != '\n':
+            s = s.replace('\r', '').replace('\n', at.output_newline)
+        # This is part of the new_write logic.
+        # This is the only call to g.toEncodedString in the new_write logic.
+        # 2013/10/28: fix bug 1243847: unicode error when saving @shadow nodes
+        if g.isUnicode(s):
+            s = g.toEncodedString(s, encoding=at.encoding)
+        return s
     #@+node:ekr.20050104131929.1: *5* at.rename
     #@+<< about os.rename >>
     #@+node:ekr.20050104131929.2: *6* << about os.rename >>
@@ -3204,6 +3497,9 @@ class AtFile(object):
         Remember the files that have been read *and*
         the full headline (@<file> type) that caused the read.
         '''
+        # Reading sets node data without v.setDbChanged.
+        # The next save of a .db file must scan the outline.
+        self.c.dbChangedVnodes = None
         v = p.v
         # Fix bug #50: body text lost switching @file to @auto-rst
         if not hasattr(v, 'at_read'):
@@ -3346,17 +3642,135 @@ class FastAtRead (object):
     This is Vitalije's code, edited by EKR.
     '''
 
-    def __init__ (self, c, gnx2vnode, test=False, TestVNode=None): 
+    def __init__ (self, c, gnx2vnode, test=False, TestVNode=None, use_cache=False): 
         self.c = c
         assert gnx2vnode is not None
         self.gnx2vnode = gnx2vnode
             # The global fc.gnxDict. Keys are gnx's, values are vnodes.
+        self.cache_hit = False
+            # True: read_into_root restored the tree from the read cache.
+        self.nodes = []
+            # Entries are (gnx, headline, level), one per @+node sentinel.
         self.path = None
         self.root = None
         self.VNode = TestVNode if test else leoNodes.VNode
         self.test = test
+        self.use_cache = use_cache and not test
 
     #@+others
+    #@+node:dev.20261018090000.6: *3* fast_at.Read cache
+    # The read cache maps the path of an external file to the results of
+    # scanning it: (digest, root_gnx, nodes, bodies). nodes is self.nodes.
+    # bodies is a dict: keys are gnxs, values are body strings.
+    #@+node:dev.20261018090000.7: *4* fast_at.cache_key & digest
+    def cache_key(self, path):
+        '''Return the read-cache key for the external file at path.'''
+        return 'fast-at-read-cache:%s' % g.os_path_normcase(path)
+
+    def digest(self, contents):
+        '''Return the md5 hex digest of the file's contents.'''
+        return hashlib.md5(g.toEncodedString(contents, encoding='utf-8')).hexdigest()
+    #@+node:dev.20261018090000.8: *4* fast_at.read_from_cache
+    def read_from_cache(self, digest):
+        '''
+        Restore the tree of vnodes anchored in self.root.v from the read cache.
+        Return True if the cache holds the scan of a file with the given digest.
+        '''
+        at = self.c.atFileCommands
+        data = at.getReadCache(self.cache_key(self.path))
+        if not data or len(data) != 4:
+            return False
+        old_digest, root_gnx, nodes, bodies = data
+        if old_digest != digest or root_gnx != self.root.gnx:
+            return False
+        # Clear all children, as read_into_root does for valid files.
+        self.root.v._deleteAllChildren()
+        self.replay_nodes(nodes, bodies)
+        return True
+    #@+node:dev.20261018090000.9: *4* fast_at.replay_nodes
+    def replay_nodes(self, nodes, bodies):
+        '''
+        Recreate the links made by scan_lines from the cached (gnx, head, level)
+        entries. This must match the node_start logic in scan_lines.
+        '''
+        context, gnx2vnode = self.c, self.gnx2vnode
+        root_v = self.root.v
+        level_stack = [(root_v, False)]
+        for gnx, head, level in nodes:
+            v = gnx2vnode.get(gnx)
+            if v and v == root_v:
+                v.children = []
+                continue
+            parent_v, clone_v = level_stack[level-2]
+            if v and clone_v:
+                v._headString = head
+                level_stack = level_stack[:level-1]
+                level_stack.append((v, clone_v),)
+                v.children = []
+                parent_v.children.append(v)
+                continue
+            if v:
+                clone_v = v
+                v.children = []
+            else:
+                v = self.VNode(context=context, gnx=gnx)
+            gnx2vnode[gnx] = v
+            v._headString = head
+            level_stack = level_stack[:level-1]
+            level_stack.append((v, clone_v),)
+            parent_v.children.append(v)
+            v.parents.append(parent_v)
+        for gnx in bodies:
+            gnx2vnode.get(gnx)._bodyString = bodies.get(gnx)
+    #@+node:dev.20261018090000.10: *4* fast_at.write_to_cache
+    def write_to_cache(self, digest):
+        '''Remember the results of scan_lines in the read cache.'''
+        at = self.c.atFileCommands
+        at.setReadCache(self.cache_key(self.path),
+            (digest, self.root.gnx, self.nodes, self.get_bodies()))
+    #@+node:dev.20261018100000.2: *4* fast_at.get_bodies
+    def get_bodies(self):
+        '''Return a dict: keys are the gnxs of all scanned nodes, values are bodies.'''
+        gnx2vnode = self.gnx2vnode
+        bodies = {self.root.gnx: self.root.v._bodyString}
+        for gnx, head, level in self.nodes:
+            bodies[gnx] = gnx2vnode.get(gnx)._bodyString
+        return bodies
+    #@+node:dev.20261018100000.3: *3* fast_at.Prescanning
+    # at.prescanExternalFiles calls scan_external_file in worker processes.
+    # Workers scan files into plain data, using the format of the read cache.
+    #@+node:dev.20261018100000.4: *4* fast_at.read_prescanned_data
+    def read_prescanned_data(self, data, path, root):
+        '''
+        Create the tree of vnodes anchored in root.v from data,
+        the result of scan_external_file.
+        '''
+        digest, nodes, bodies = data
+        self.path = path
+        self.root = root
+        self.nodes = nodes
+        root.v._deleteAllChildren()
+        self.replay_nodes(nodes, bodies)
+        if self.use_cache:
+            self.write_to_cache(digest)
+    #@+node:dev.20261018100000.5: *4* fast_at.scan_to_data
+    def scan_to_data(self, contents, root_gnx):
+        '''
+        Scan contents without creating or changing any vnodes in the outline.
+        Return (nodes, bodies), or None if contents is not a valid external file.
+        '''
+        self.VNode = PlainVNode
+        root_v = PlainVNode(context=None, gnx=root_gnx)
+        self.root = g.Bunch(gnx=root_gnx, v=root_v)
+        lines = g.splitLines(contents)
+        data = self.scan_header(lines)
+        if not data:
+            return None
+        delims, first_lines, start_i = data
+        root_v, junk = self.scan_lines(delims, first_lines, lines, start_i)
+        if not root_v:
+            return None
+        return self.nodes, self.get_bodies()
     #@+node:ekr.20180602103135.3: *3* fast_at.get_patterns
     #@@nobeautify
 
@@ -3632,6 +4046,8 @@ class FastAtRead (object):
                 level = int(m.group(3)) if m.group(3) else 1 + len(m.group(4))
                     # m.group(3) is the level number, m.group(4) is the number of stars.
                 v = gnx2vnode.get(gnx)
+                self.nodes.append((gnx, head, level),)
+                    # For the read cache.
                 #
                 # Case 1: The root @file node. Don't change the headline.
                 if v and v == root_v:
@@ -3894,6 +4310,10 @@ class FastAtRead (object):
         self.root = root
         sfn = g.shortFileName(path)
         contents = contents.replace('\r','')
+        digest = self.digest(contents) if self.use_cache else None
+        if digest and self.read_from_cache(digest):
+            self.cache_hit = True
+            return True
         lines = g.splitLines(contents)
         data = self.scan_header(lines)
         if data:
@@ -3901,8 +4321,10 @@ class FastAtRead (object):
             ### Previously, this had been done in readOpenFile.
             root.v._deleteAllChildren()
             delims, first_lines, start_i = data
-            self.scan_lines(
+            root_v, junk = self.scan_lines(
                 delims, first_lines, lines, start_i)
+            if digest and root_v:
+                self.write_to_cache(digest)
             if trace:
                 t2 = time.clock()
                 g.trace('%5.3f sec. %s' % ((t2-t1), path))
@@ -3910,6 +4332,53 @@ class FastAtRead (object):
         g.trace('Invalid external file: %s' % sfn)
         return False
     #@-others
+#@+node:dev.20261018100000.6: ** class PlainVNode
+class PlainVNode(object):
+    '''
+    A minimal stand-in for VNodes, used by FastAtRead.scan_to_data.
+    PlainVNodes do not register their gnx with any commander.
+    '''
+
+    def __init__(self, context, gnx):
+        self.children = []
+        self.fileIndex = gnx
+        self.parents = []
+        self._bodyString = ''
+        self._headString = ''
+
+    gnx = property(lambda self: self.fileIndex)
+#@+node:dev.20261018100000.7: ** function: scan_external_file
+def scan_external_file(path, root_gnx, encoding):
+    '''
+    Read and scan the external file at path in a worker process.
+    This function must not use g.app.
+
+    Return (digest, nodes, bodies) for FastAtRead.read_prescanned_data,
+    or None if there was any problem.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            s = f.read()
+        # Use the same encoding rules as at.readFileToUnicode.
+        e, s = g.stripBOM(s)
+        if not e:
+            s_temp = g.toUnicode(s, 'ascii', reportErrors=False)
+            for line in g.splitLines(s_temp):
+                m = FastAtRead.header_pattern.match(line)
+                if m:
+                    e = m.group(6)
+                    break
+            if not e or not g.isValidEncoding(e):
+                e = encoding
+        contents = g.toUnicode(s, encoding=e).replace('\r', '')
+        x = FastAtRead(None, gnx2vnode={})
+        data = x.scan_to_data(contents, root_gnx)
+        if not data:
+            return None
+        nodes, bodies = data
+        return x.digest(contents), nodes, bodies
+    except Exception:
+        return None
 #@-others
 #@@language python
 #@@tabwidth -4
@@ -18,6 +18,8 @@ import stat
 # import time
 import zlib
 import sqlite3
+import atexit
+from collections import OrderedDict
 # try:
     # import marshal
 # except ImportError:
@@ -61,14 +63,13 @@ class CommanderCacher(object):
         # Careful: self.db may be a dict.
         if SQLITE and hasattr(self.db, 'conn'):
             # pylint: disable=no-member
-            self.db.conn.commit()
-            self.db.conn.close()
+            self.db.close()
     #@+node:ekr.20180627042809.1: *3* cacher.commit
     def commit(self):
         # Careful: self.db may be a dict.
         if SQLITE and hasattr(self.db, 'conn'):
             # pylint: disable=no-member
-            self.db.conn.commit()
+            self.db.commit()
     #@+node:ekr.20180611054447.1: *3* cacher.dump
     def dump(self):
         '''Dump the indicated cache if --trace-cache is in effect.'''
@@ -176,8 +177,7 @@ class GlobalCacher(object):
         # Careful: self.db may be a dict.
         if SQLITE and hasattr(self.db, 'conn'):
             # pylint: disable=no-member
-            self.db.conn.commit()
-            self.db.conn.close()
+            self.db.close()
     #@+node:ekr.20180627045953.1: *3* g_cacher.dump
     def dump(self):
         '''Dump the indicated cache if --trace-cache is in effect.'''
@@ -457,7 +457,22 @@ class PickleShareDB(object):
 _sentinel = object()
 
 class SqlitePickleShare(object):
-    """ The main 'connection' object for SqlitePickleShare database """
+    """
+    The main 'connection' object for SqlitePickleShare database.
+
+    Writes are buffered in self.pending and written in a single transaction
+    by flush, which runs at idle time, on commit, and whenever more than
+    batch_size writes are pending. Recently used values are kept, already
+    unpickled, in a bounded LRU cache.
+    """
+    batch_size = 500
+        # Flush when this many writes are pending.
+    lru_size = 1000
+        # The maximum number of decoded values in the LRU cache.
+    lru_max_data = 16 * 1024
+        # Never cache values whose compressed data is larger than this.
+    atomic_types = (type(None), bool, int, type(sys.maxsize + 1), float, type(b''), type(u''))
+        # Values made only of these types can be shared safely by all readers.
     #@+others
     #@+node:vitalije.20170716201700.2: *3*  Birth & special methods
     def init_dbtables(self, conn):
@@ -474,10 +489,18 @@ class SqlitePickleShare(object):
             self._makedirs(self.root)
         dbfile = ':memory:' if g.unitTesting else join(root, 'cache.sqlite')
         self.conn = sqlite3.connect(dbfile, isolation_level=None)
+        if dbfile != ':memory:':
+            self.set_journal_mode()
         self.init_dbtables(self.conn)
         self.cache = {}
             # Keys are normalized file names.
             # Values are tuples (obj, orig_mod_time)
+        self.lru = OrderedDict()
+            # Keys are keys, values are decoded, immutable values.
+        self.pending = {}
+            # Keys are keys, values are pickled data, or None for deleted keys.
+        self.stats = {'reads': 0, 'hits': 0, 'misses': 0, 'writes': 0, 'flushes': 0}
+        self.closed = False
 
         def loadz(data):
             if data:
@@ -510,25 +533,41 @@ class SqlitePickleShare(object):
     #@+node:vitalije.20170716201700.5: *4* __delitem__
     def __delitem__(self, key):
         """ del db["key"] """
-        try:
-            self.conn.execute('''delete from cachevalues
-                where key=?''', (key,))
-        except sqlite3.OperationalError:
-            pass
+        self.lru.pop(key, None)
+        self.pending[key] = None
+        self.stats['writes'] += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
 
     #@+node:vitalije.20170716201700.6: *4* __getitem__
     def __getitem__(self, key):
         """ db['key'] reading """
-        try:
-            obj = None
-            for row in self.conn.execute('''select data from cachevalues
-                where key=?''', (key,)):
-                obj = self.loader(row[0])
-                break
-            else:
+        stats, lru = self.stats, self.lru
+        stats['reads'] += 1
+        if key in lru:
+            stats['hits'] += 1
+            obj = lru.pop(key)
+            lru[key] = obj # Make key the most recently used key.
+            return obj
+        if key in self.pending:
+            stats['hits'] += 1
+            data = self.pending[key]
+            if data is None:
                 raise KeyError(key)
-        except sqlite3.Error:
-            raise KeyError(key)
+        else:
+            stats['misses'] += 1
+            try:
+                for row in self.conn.execute('''select data from cachevalues
+                    where key=?''', (key,)):
+                    data = row[0]
+                    break
+                else:
+                    raise KeyError(key)
+            except sqlite3.Error:
+                raise KeyError(key)
+        obj = self.loader(data)
+        if data and len(data) <= self.lru_max_data:
+            self.remember(key, obj)
         return obj
     #@+node:vitalije.20170716201700.7: *4* __iter__
     def __iter__(self):
@@ -541,13 +580,25 @@ class SqlitePickleShare(object):
     #@+node:vitalije.20170716201700.9: *4* __setitem__
     def __setitem__(self, key, value):
         """ db['key'] = 5 """
+        self.pending[key] = data = self.dumper(value)
+        self.stats['writes'] += 1
+        self.lru.pop(key, None)
+        if len(data) <= self.lru_max_data:
+            self.remember(key, value)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    #@+node:dev.20261018170000.1: *4* set_journal_mode
+    def set_journal_mode(self):
+        '''
+        Use write-ahead logging, so that readers and the writer of the
+        cache, possibly in separate Leo processes, don't block each other.
+        '''
         try:
-            data = self.dumper(value)
-            self.conn.execute('''replace into cachevalues(key, data)
-                values(?,?);''', (key, data))
-        except sqlite3.OperationalError as e:
-            g.es_exception(e)
-
+            self.conn.execute('pragma journal_mode=wal;')
+            self.conn.execute('pragma synchronous=normal;')
+        except sqlite3.Error:
+            pass # Keep the default rollback journal.
     #@+node:vitalije.20170716201700.10: *3* _makedirs
     def _makedirs(self, fn, mode=0o777):
 
@@ -601,25 +652,65 @@ class SqlitePickleShare(object):
         # Deletes all files in the fcache subdirectory.
         # It would be more thorough to delete everything
         # below the root directory, but it's not necessary.
+        self.lru.clear()
+        self.pending = {}
         self.conn.execute('delete from cachevalues;')
+    #@+node:dev.20261018170000.2: *3* commit & close (SqlitePickleShare)
+    def commit(self):
+        '''Write all pending changes to the database.'''
+        self.flush()
+        self.conn.commit()
+
+    def close(self):
+        '''Write all pending changes and close the database.'''
+        if not self.closed:
+            self.commit()
+            self.conn.close()
+            self.closed = True
+    #@+node:dev.20261018170000.3: *3* flush (SqlitePickleShare)
+    def flush(self):
+        '''Write all pending changes to the database in a single transaction.'''
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        replaced = [(key, data) for key, data in pending.items() if data is not None]
+        deleted = [(key,) for key, data in pending.items() if data is None]
+        conn = self.conn
+        try:
+            conn.execute('begin;')
+            if replaced:
+                conn.executemany('''replace into cachevalues(key, data)
+                    values(?,?);''', replaced)
+            if deleted:
+                conn.executemany('delete from cachevalues where key=?;', deleted)
+            conn.execute('commit;')
+            self.stats['flushes'] += 1
+        except sqlite3.Error as e:
+            try:
+                conn.execute('rollback;')
+            except sqlite3.Error:
+                pass
+            g.es_exception(e)
     #@+node:vitalije.20170716201700.16: *3* get
     def get(self, key, default=None):
 
-        if not self.has_key(key):
-            return default
         try:
-            val = self[key]
-            return val
+            return self[key]
         except KeyError:
             return default
     #@+node:vitalije.20170716201700.17: *3* has_key (SqlightPickleShare)
     def has_key(self, key):
+        if key in self.pending:
+            return self.pending[key] is not None
+        if key in self.lru:
+            return True
         sql = 'select 1 from cachevalues where key=?;'
         for row in self.conn.execute(sql, (key,)):
             return True
         return False
     #@+node:vitalije.20170716201700.18: *3* items
     def items(self):
+        self.flush()
         sql = 'select key,data from cachevalues;'
         for key,data in self.conn.execute(sql):
             yield key, data
@@ -628,6 +719,7 @@ class SqlitePickleShare(object):
 
     def keys(self, globpat=None):
         """Return all keys in DB, or all keys matching a glob"""
+        self.flush()
         if globpat is None:
             sql = 'select key from cachevalues;'
             args = tuple()
@@ -668,18 +760,63 @@ class SqlitePickleShare(object):
         while lk:
             lk = do_block(self.conn.execute(sql1, (lk,)))
         self[PROTOCOLKEY] = 2
+        self.flush()
         self.conn.commit()
 
         self.conn.isolation_level = None
+    #@+node:dev.20261018170000.4: *3* remember
+    def remember(self, key, obj):
+        '''Add key and obj to the LRU cache if obj is immutable.'''
+        if not self.is_immutable(obj):
+            return
+        lru = self.lru
+        lru[key] = obj
+        if len(lru) > self.lru_size:
+            lru.popitem(last=False)
+
+    def is_immutable(self, obj):
+        '''Return True if obj and all its components are immutable.'''
+        if isinstance(obj, self.atomic_types):
+            return True
+        if isinstance(obj, (tuple, frozenset)):
+            return all(self.is_immutable(z) for z in obj)
+        return False
+    #@+node:dev.20261018170000.5: *3* stats_report
+    def stats_report(self):
+        '''Return a one-line summary of the read and write counts.'''
+        d = self.stats
+        reads = d['reads']
+        return 'reads: %s hits: %s misses: %s hit rate: %3.1f%% writes: %s flushes: %s pending: %s lru: %s' % (
+            reads, d['hits'], d['misses'],
+            100.0 * d['hits'] / reads if reads else 0.0,
+            d['writes'], d['flushes'], len(self.pending), len(self.lru))
     #@+node:vitalije.20170716201700.23: *3* uncache
     def uncache(self, *items):
-        """not used in SqlitePickleShare"""
-        pass
+        """Remove all, or specified items, from the LRU cache."""
+        if not items:
+            self.lru.clear()
+        for it in items:
+            self.lru.pop(it, None)
     #@-others
+#@+node:dev.20261018170000.6: ** function: flush_caches
+def flush_caches():
+    '''
+    Write pending changes to g.app.db and g.app.commander_db.
+    Called at idle time and at exit.
+    '''
+    if not g.app:
+        return
+    for db in (g.app.db, g.app.commander_db):
+        if hasattr(db, 'flush') and not db.closed:
+            db.flush()
+
+atexit.register(flush_caches)
 #@+node:ekr.20180627050237.1: ** function: dump_cache
 def dump_cache(db, tag):
     '''Dump the given cache.'''
     print('\n===== %s =====\n' % tag)
+    if hasattr(db, 'stats_report'):
+        print(db.stats_report())
     # Create a dict, sorted by file prefixes.
     d = {}
     for key in db.keys():
@@ -11,8 +11,11 @@ from leo.core.leoQt import Qsci, QtGui, QtWidgets # isQt5, QtCore
     # import builtins # Python 3
 # except ImportError:
     # import __builtin__ as builtins # Python 2.
+import importlib
+import os
 import re
 import string
+import sys
 # import time
 #@-<< imports >>
 # pylint: disable=anomalous-backslash-in-string
@@ -25,10 +28,15 @@ class BaseColorizer(object):
         '''ctor for BaseColorizer class.'''
         self.c = c
         self.count = 0
+        self.directives_cache = {}
+            # Keys are gnx's, values are tuples (stamp, languages, color directives),
+            # where stamp is (len(b), hash(b)) for the body b.
         self.enabled = False
         self.full_recolor_count = 0
         self.highlighter = g.NullObject()
         self.showInvisibles = False
+        self.valid_languages = {}
+            # Keys are language names, values are True if leo/modes contains the language.
 
     def init(self, p):
         '''May be over-ridden in subclasses.'''
@@ -74,26 +82,43 @@ class BaseColorizer(object):
     #@+node:ekr.20170201150505.1: *5* bc.findAllValidLanguageDirectives
     def findAllValidLanguageDirectives(self, p):
         '''Return list of all valid @language directives in p.b'''
-        languages = set()
-        for m in self.at_language_pattern.finditer(p.b):
-            language = m.group(1)
-            if self.isValidLanguage(language):
-                languages.add(language)
-        return list(sorted(languages))
+        languages = self.getNodeDirectives(p)[0]
+        return list(sorted(set(languages)))
     #@+node:ekr.20170127142001.5: *5* bc.findFirstAtLanguageDirective
     def findFirstValidAtLanguageDirective(self, p):
         '''Return the first *valid* @language directive in p.b.'''
-        for m in self.at_language_pattern.finditer(p.b):
-            language = m.group(1)
-            if self.isValidLanguage(language):
-                return language
-        return None
+        languages = self.getNodeDirectives(p)[0]
+        return languages[0] if languages else None
 
     #@+node:ekr.20170127142001.6: *5* bc.isValidLanguage
     def isValidLanguage(self, language):
         '''True if language exists in leo/modes.'''
-        fn = g.os_path_join(g.app.loadDir, '..', 'modes', '%s.py' % (language))
-        return g.os_path_exists(fn)
+        val = self.valid_languages.get(language)
+        if val is None:
+            fn = g.os_path_join(g.app.loadDir, '..', 'modes', '%s.py' % (language))
+            val = self.valid_languages[language] = g.os_path_exists(fn)
+        return val
+    #@+node:dev.20261018180000.3: *5* bc.getNodeDirectives
+    def getNodeDirectives(self, p):
+        '''
+        Return (languages, d) for p.b, where languages is the list of valid
+        @language directives and d is the dict of color directives.
+
+        The result is cached until p.b changes.
+        '''
+        b = p.b
+        stamp = len(b), hash(b)
+        data = self.directives_cache.get(p.v.fileIndex)
+        if data and data[0] == stamp:
+            return data[1], data[2]
+        languages = [m.group(1) for m in self.at_language_pattern.finditer(b)
+            if self.isValidLanguage(m.group(1))]
+        d = {}
+        for m in self.color_directives_pat.finditer(b):
+            word = m.group(0)[1:]
+            d[word] = word
+        self.directives_cache[p.v.fileIndex] = stamp, languages, d
+        return languages, d
     #@+node:ekr.20170127142001.7: *4* bc.useSyntaxColoring & helper
     def useSyntaxColoring(self, p):
         '''True if p's parents enable coloring in p.'''
@@ -119,11 +144,7 @@ class BaseColorizer(object):
 
     def findColorDirectives(self, p):
         '''Return a dict with each color directive in p.b, without the leading '@'.'''
-        d = {}
-        for m in self.color_directives_pat.finditer(p.b):
-            word = m.group(0)[1:]
-            d[word] = word
-        return d
+        return self.getNodeDirectives(p)[1]
     #@+node:ekr.20170514054524.1: *3* bc.fonts
     def getFontFromParams(self, family, size, slant, weight, defaultSize=12):
         return None
@@ -131,6 +152,52 @@ class BaseColorizer(object):
     # def setFontFromConfig(self):
         # pass
     #@-others
+#@+node:dev.20261018220000.1: ** Shared mode data
+# The modules in leo/modes, and the rulesets compiled from them,
+# are shared by all JEditColorizers in the session.
+
+mode_modules = {}
+    # Keys are language names.
+    # Values are tuples (stamp, module), where stamp is (size, mtime) or None.
+compiled_rulesets = {}
+    # Keys are tuples (language, rulesetName, color_trailing_whitespace).
+    # Values are g.Bunches created by JEditColorizer.compileRuleset.
+#@+node:dev.20261018220000.2: *3* load_mode
+def load_mode(language):
+    '''
+    Return the module in leo/modes for the given language, or None.
+
+    Modules are imported as leo.modes.x, so Python caches their byte code.
+    They are imported once per session, and again only if their file changes.
+    Modes that define pre_init_mode may depend on the commander, so a new
+    copy of them is imported each time.
+    '''
+    path = g.os_path_join(g.app.loadDir, '..', 'modes')
+    fn = g.os_path_join(path, '%s.py' % (language))
+    try:
+        st = os.stat(fn)
+        stamp = st.st_size, st.st_mtime
+    except OSError:
+        return None
+    data = mode_modules.get(language)
+    if data and data[0] == stamp:
+        return data[1]
+    for key in list(compiled_rulesets.keys()):
+        if key[0] == language:
+            del compiled_rulesets[key]
+    mode_modules.pop(language, None)
+    moduleName = 'leo.modes.%s' % (language)
+    try:
+        sys.modules.pop(moduleName, None)
+        mode = importlib.import_module(moduleName)
+    except Exception:
+        g.error('unexpected exception importing %s' % (moduleName))
+        g.es_exception()
+        return None
+    if hasattr(mode, 'pre_init_mode'):
+        return g.importFromPath(moduleName=language, path=path)
+    mode_modules[language] = stamp, mode
+    return mode
 #@+node:ekr.20110605121601.18569: ** class JEditColorizer(BaseColorizer)
 # This is c.frame.body.colorizer
 class JEditColorizer(BaseColorizer):
@@ -599,12 +666,7 @@ class JEditColorizer(BaseColorizer):
                 return True
         else:
             # Bug fix: 2008/2/10: Don't try to import a non-existent language.
-            path = g.os_path_join(g.app.loadDir, '..', 'modes')
-            fn = g.os_path_join(path, '%s.py' % (language))
-            if g.os_path_exists(fn):
-                mode = g.importFromPath(moduleName=language, path=path)
-            else:
-                mode = None
+            mode = load_mode(language)
             return self.init_mode_from_module(name, mode)
     #@+node:btheado.20131124162237.16303: *5* jedit.init_mode_from_module
     def init_mode_from_module(self, name, mode):
@@ -635,13 +697,14 @@ class JEditColorizer(BaseColorizer):
             return False
         self.language = language
         self.rulesetName = rulesetName
-        self.properties = getattr(mode, 'properties', None) or {}
-        self.keywordsDict = mode.keywordsDictDict.get(rulesetName, {}) if hasattr(mode, 'keywordsDictDict') else {}
-        self.setKeywords()
-        self.attributesDict = mode.attributesDictDict.get(rulesetName) if hasattr(mode, 'attributesDictDict') else {}
+        bunch = self.compileRuleset(mode, language, rulesetName)
+        self.properties = bunch.properties
+        self.keywordsDict = bunch.keywordsDict
+        self.word_chars = bunch.word_chars
+        self.attributesDict = bunch.attributesDict
         self.setModeAttributes()
-        self.rulesDict = mode.rulesDictDict.get(rulesetName) if hasattr(mode, 'rulesDictDict') else {}
-        self.addLeoRules(self.rulesDict)
+        self.rulesDict = dict((ch, aList[:]) for ch, aList in bunch.rulesDict.items())
+            # Plugins may patch this colorizer's rules.
         self.defaultColor = 'null'
         self.mode = mode
         self.modes[rulesetName] = self.modeBunch = g.Bunch(
@@ -668,6 +731,37 @@ class JEditColorizer(BaseColorizer):
         else:
             self.language = language # 2017/01/31
         return True
+    #@+node:dev.20261018220000.3: *5* jedit.compileRuleset
+    def compileRuleset(self, mode, language, rulesetName):
+        '''
+        Return a g.Bunch describing the given ruleset of mode: its properties,
+        keywords, word_chars, attributes and rules, including Leo's rules.
+
+        The bunch is shared with all other colorizers if the mode is shared.
+        Colorizers must not change the bunch's dicts: they copy rulesDict.
+        '''
+        trailing_ws = bool(self.c.config.getBool("color_trailing_whitespace"))
+        key = language, rulesetName, trailing_ws
+        data = mode_modules.get(language)
+        shared = bool(data and data[1] is mode)
+        if shared and key in compiled_rulesets:
+            return compiled_rulesets[key]
+        self.keywordsDict = mode.keywordsDictDict.get(rulesetName, {}) if hasattr(mode, 'keywordsDictDict') else {}
+        self.setKeywords()
+        rulesDict = mode.rulesDictDict.get(rulesetName) if hasattr(mode, 'rulesDictDict') else {}
+        rulesDict = dict((ch, aList[:]) for ch, aList in (rulesDict or {}).items())
+            # Leo's rules depend on the color_trailing_whitespace setting.
+        self.addLeoRules(rulesDict)
+        bunch = g.Bunch(
+            attributesDict=mode.attributesDictDict.get(rulesetName) if hasattr(mode, 'attributesDictDict') else {},
+            keywordsDict=self.keywordsDict,
+            properties=getattr(mode, 'properties', None) or {},
+            rulesDict=rulesDict,
+            word_chars=self.word_chars,
+        )
+        if shared:
+            compiled_rulesets[key] = bunch
+        return bunch
     #@+node:ekr.20110605121601.18582: *5* jedit.nameToRulesetName
     def nameToRulesetName(self, name):
         '''
@@ -128,6 +128,16 @@ class Commands(object):
     #@+node:ekr.20120217070122.10471: *5* c.initDocumentIvars
     def initDocumentIvars(self):
         '''Init per-document ivars.'''
+        self.dirtyVnodes = set()
+            # A superset of all dirty vnodes, maintained by v.setDirty and v.clearDirty.
+            # at.writeAll and c.setChanged use this set instead of scanning the outline.
+        self.dbChangedVnodes = None
+            # A superset of the vnodes whose rows in a .db file have changed
+            # since it was last saved, maintained by v.setDbChanged,
+            # or None if fc.exportToSqlite must scan the outline.
+        self.directivesCache = {}
+            # Keys are gnx's, values are the directives found in each node.
+            # Used only by g.get_directives_dict.
         self.expansionLevel = 0
             # The expansion level of this outline.
         self.expansionNode = None
@@ -742,6 +752,14 @@ class Commands(object):
     all_vnodes_iter = all_nodes
     all_unique_tnodes_iter = all_unique_nodes
     all_unique_vnodes_iter = all_unique_nodes
+    #@+node:dev.20261018140000.7: *5* c.walk_all_nodes
+    def walk_all_nodes(self):
+        '''
+        Return a leoNodes.VNodeWalker yielding (v, depth, parent_v, childIndex)
+        for all nodes of the outline, in outline order, without creating positions.
+        '''
+        c = self
+        return leoNodes.VNodeWalker(c)
     #@+node:ekr.20091001141621.6044: *5* c.all_positions
     def all_positions(self, copy=True):
         '''A generator return all positions of the outline, in outline order.'''
@@ -1185,9 +1203,9 @@ class Commands(object):
             return # don't update while loading.
         # Clear all dirty bits _before_ setting the caption.
         if not changedFlag:
-            for v in c.all_unique_nodes():
-                if v.isDirty():
-                    v.clearDirty()
+            for v in list(c.dirtyVnodes):
+                v.clearDirty()
+            c.dirtyVnodes.clear()
         # Do nothing for null frames.
         assert c.gui
         if c.gui.guiName() == 'nullGui':
@@ -3844,10 +3862,11 @@ class Commands(object):
         c = self
         pat = re.compile(regex, flags)
         res = leoNodes.PosList()
-        for p in c.all_positions():
-            m = re.match(pat, p.h)
+        walker = c.walk_all_nodes()
+        for v, depth, parent_v, n in walker:
+            m = re.match(pat, v.h)
             if m:
-                pc = p.copy()
+                pc = walker.position()
                 pc.mo = m
                 res.append(pc)
         return res
@@ -3860,8 +3879,9 @@ class Commands(object):
         c = self
         pat = re.compile(regex, flags)
         res = leoNodes.PosList()
-        for p in c.all_positions():
-            m = re.finditer(pat, p.b)
+        walker = c.walk_all_nodes()
+        for v, depth, parent_v, n in walker:
+            m = re.finditer(pat, v.b)
             t1, t2 = itertools.tee(m, 2)
             try:
                 if g.isPython3:
@@ -3870,7 +3890,7 @@ class Commands(object):
                     t1.next()
             except StopIteration:
                 continue
-            pc = p.copy()
+            pc = walker.position()
             pc.matchiter = t2
             res.append(pc)
         return res
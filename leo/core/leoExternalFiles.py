@@ -3,10 +3,16 @@
 #@+node:ekr.20160306114544.1: * @file leoExternalFiles.py
 #@@first
 import leo.core.leoGlobals as g
+import errno
 import getpass
+import hashlib
 import os
+import select
+import stat
+import struct
 import subprocess
 import tempfile
+import threading
 import time
 #@+others
 #@+node:ekr.20160306110233.1: ** class ExternalFile
@@ -35,6 +41,345 @@ class ExternalFile(object):
         '''Return True if the external file still exists.'''
         return g.os_path_exists(self.path)
     #@-others
+#@+node:dev.20261018190000.1: ** class FileWatcher
+class FileWatcher(object):
+    '''
+    A class that watches external files on a worker thread.
+
+    The worker finds candidate paths using inotify on Linux, or batched
+    stat scans elsewhere. It computes md5 digests of the candidates in
+    chunks, and reports only the paths whose contents have changed.
+
+    The main thread calls only watch, get_changes, get_digest and stop.
+    '''
+    chunk_size = 64 * 1024
+        # The number of bytes read at a time when computing digests.
+    interval = 0.5
+        # The number of seconds the worker waits between batches of work.
+    scan_batch_size = 500
+        # The number of paths stat'ed in each batch of a stat scan.
+
+    def __init__(self, use_inotify=True):
+        '''Ctor for the FileWatcher class.'''
+        self.changes = {}
+            # Keys are changed paths, values are their new digests.
+            # Protected by self.lock.
+        self.inotify = None
+            # An InotifyBackend instance, created by the worker thread.
+        self.lock = threading.Lock()
+        self.paths = set()
+            # The watched paths. Changed only by the main thread.
+        self.real_d = {}
+            # Keys are real paths, values are watched paths.
+        self.requests = []
+            # A list of tuples (kind, path), where kind is 'add' or 'remove'.
+            # Protected by self.lock.
+        self.scan_index = 0
+        self.scan_paths = []
+            # The watched paths that inotify does not watch.
+        self.stopped = False
+        self.table = {}
+            # Keys are paths, values are tuples (size, mtime_ns, digest).
+            # Changed only by the worker thread.
+        self.thread = None
+        self.use_inotify = use_inotify
+        self.wakeup = threading.Event()
+
+    #@+others
+    #@+node:dev.20261018190000.2: *3* watcher.Main thread
+    #@+node:dev.20261018190000.3: *4* watcher.get_changes
+    def get_changes(self, paths):
+        '''
+        Return a dict of the changed paths in paths.
+        Keys are paths, values are digests.
+        '''
+        with self.lock:
+            if not self.changes:
+                return {}
+            result = dict((path, digest) for path, digest in self.changes.items()
+                if path in paths)
+            for path in result:
+                del self.changes[path]
+        return result
+    #@+node:dev.20261018190000.23: *4* watcher.requeue
+    def requeue(self, changes):
+        '''
+        Report the given changes again, unless the worker has reported newer
+        changes to the same paths. changes is a dict returned by get_changes.
+        '''
+        with self.lock:
+            for path, digest in changes.items():
+                if path in self.paths and path not in self.changes:
+                    self.changes[path] = digest
+    #@+node:dev.20261018190000.4: *4* watcher.get_digest
+    def get_digest(self, path):
+        '''
+        Return the digest the worker computed for path,
+        or None if the file has changed since then.
+        '''
+        data = self.table.get(path)
+        if not data:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, self.mtime_ns(st)) == data[:2]:
+            return data[2]
+        return None
+    #@+node:dev.20261018190000.5: *4* watcher.start & stop
+    def start(self):
+        '''Start the worker thread if it is not running.'''
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='Leo FileWatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''Stop the worker thread.'''
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(2 * self.interval)
+        self.thread = None
+    #@+node:dev.20261018190000.6: *4* watcher.watch
+    def watch(self, paths):
+        '''Watch exactly the given paths.'''
+        paths = set(paths)
+        added, removed = paths - self.paths, self.paths - paths
+        if not added and not removed:
+            return
+        self.paths = paths
+        with self.lock:
+            self.requests.extend(('add', z) for z in sorted(added))
+            self.requests.extend(('remove', z) for z in sorted(removed))
+            for path in removed:
+                self.changes.pop(path, None)
+        self.start()
+        self.wakeup.set()
+    #@+node:dev.20261018190000.7: *3* watcher.Worker thread
+    #@+node:dev.20261018190000.8: *4* watcher.run
+    def run(self):
+        '''The main loop of the worker thread.'''
+        if self.use_inotify and not self.inotify:
+            try:
+                self.inotify = InotifyBackend()
+            except Exception:
+                self.inotify = None # Use stat scans.
+        try:
+            while not self.stopped:
+                self.handle_requests()
+                if self.inotify and self.inotify.wds:
+                    real_paths = self.inotify.read_events(self.interval)
+                    if real_paths is None:
+                        # The event queue overflowed: check everything.
+                        real_paths = list(self.real_d.keys())
+                    for real_path in real_paths:
+                        path = self.real_d.get(real_path)
+                        if path:
+                            self.check(path)
+                    self.handle_lost_directories()
+                else:
+                    self.wakeup.wait(self.interval)
+                    self.wakeup.clear()
+                self.scan_batch()
+        finally:
+            if self.inotify:
+                self.inotify.close()
+                self.inotify = None
+    #@+node:dev.20261018190000.9: *4* watcher.check
+    def check(self, path, report=True):
+        '''
+        Compute the digest of path if its size or mtime have changed.
+        Report the path to the main thread if its contents have changed.
+        '''
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.table.pop(path, None)
+            return
+        if not stat.S_ISREG(st.st_mode):
+            return
+        key = st.st_size, self.mtime_ns(st)
+        old = self.table.get(path)
+        if old and old[:2] == key:
+            return
+        digest = self.digest(path)
+        if digest is None:
+            return
+        self.table[path] = key + (digest,)
+        if report and (not old or old[2] != digest) and path in self.paths:
+            with self.lock:
+                self.changes[path] = digest
+    #@+node:dev.20261018190000.10: *4* watcher.digest
+    def digest(self, path):
+        '''Return the md5 hex digest of the file at path, or None.'''
+        h = hashlib.md5()
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+        except (IOError, OSError):
+            return None
+        return h.hexdigest()
+    #@+node:dev.20261018190000.11: *4* watcher.handle_requests
+    def handle_requests(self):
+        '''Add and remove the paths requested by the main thread.'''
+        with self.lock:
+            requests, self.requests = self.requests, []
+        for kind, path in requests:
+            real_path = os.path.realpath(path)
+            directory = os.path.dirname(real_path)
+            if kind == 'add':
+                self.real_d[real_path] = path
+                if not (self.inotify and self.inotify.add_dir(directory)):
+                    self.scan_paths.append(path)
+                self.check(path, report=False)
+            else:
+                self.real_d.pop(real_path, None)
+                self.table.pop(path, None)
+                if path in self.scan_paths:
+                    self.scan_paths.remove(path)
+                elif self.inotify:
+                    self.inotify.remove_dir(directory)
+    #@+node:dev.20261018190000.20: *4* watcher.handle_lost_directories
+    def handle_lost_directories(self):
+        '''Use stat scans for paths in directories that inotify no longer watches.'''
+        lost = self.inotify.lost
+        if not lost:
+            return
+        self.inotify.lost = []
+        for real_path, path in self.real_d.items():
+            if os.path.dirname(real_path) in lost and path not in self.scan_paths:
+                self.scan_paths.append(path)
+    #@+node:dev.20261018190000.12: *4* watcher.mtime_ns
+    def mtime_ns(self, st):
+        '''Return the modification time of a stat result in nanoseconds.'''
+        ns = getattr(st, 'st_mtime_ns', None)
+        return int(st.st_mtime * 1e9) if ns is None else ns
+    #@+node:dev.20261018190000.13: *4* watcher.scan_batch
+    def scan_batch(self):
+        '''Check the next batch of the paths that inotify does not watch.'''
+        paths = self.scan_paths
+        if not paths:
+            return
+        i = self.scan_index % len(paths)
+        j = i + self.scan_batch_size
+        self.scan_index = j if j < len(paths) else 0
+        for path in paths[i:j]:
+            self.check(path)
+    #@-others
+#@+node:dev.20261018190000.14: ** class InotifyBackend
+class InotifyBackend(object):
+    '''
+    A minimal ctypes interface to Linux's inotify,
+    used only by the FileWatcher's worker thread.
+
+    The ctor raises an exception if inotify is not available.
+    '''
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    mask = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE |
+        IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+    def __init__(self):
+        '''Ctor for the InotifyBackend class.'''
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.counts = {}
+            # Keys are directories, values are the number of watched paths in them.
+        self.dirs = {}
+            # Keys are directories, values are watch descriptors.
+        self.lost = []
+            # Directories whose watches inotify has removed.
+        self.wds = {}
+            # Keys are watch descriptors, values are directories.
+
+    #@+others
+    #@+node:dev.20261018190000.15: *3* inotify.add_dir & remove_dir
+    def add_dir(self, directory):
+        '''Watch the given directory. Return False if that is not possible.'''
+        if directory not in self.dirs:
+            wd = self.libc.inotify_add_watch(self.fd,
+                g.toEncodedString(directory, 'utf-8'), self.mask)
+            if wd < 0:
+                return False # Typically, the watch limit has been reached.
+            self.dirs[directory] = wd
+            self.wds[wd] = directory
+        self.counts[directory] = self.counts.get(directory, 0) + 1
+        return True
+
+    def remove_dir(self, directory):
+        '''Stop watching the directory if it contains no more watched paths.'''
+        n = self.counts.get(directory, 0) - 1
+        if n > 0:
+            self.counts[directory] = n
+            return
+        self.counts.pop(directory, None)
+        wd = self.dirs.pop(directory, None)
+        if wd is not None:
+            self.wds.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+    #@+node:dev.20261018190000.16: *3* inotify.close
+    def close(self):
+        '''Close the inotify file descriptor, removing all watches.'''
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+    #@+node:dev.20261018190000.17: *3* inotify.read_events
+    def read_events(self, timeout):
+        '''
+        Wait at most timeout seconds for events.
+        Return the set of paths in all events, or None if events were lost.
+        '''
+        paths = set()
+        r, w, x = select.select([self.fd], [], [], timeout)
+        if not r:
+            return paths
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            i = 0
+            while i + 16 <= len(data):
+                wd, mask, cookie, n = struct.unpack_from('iIII', data, i)
+                name = data[i + 16: i + 16 + n].rstrip(b'\0')
+                i += 16 + n
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                directory = self.wds.get(wd)
+                if not directory:
+                    continue
+                if mask & self.IN_IGNORED:
+                    # The directory no longer exists. Forget the watch.
+                    self.wds.pop(wd, None)
+                    self.dirs.pop(directory, None)
+                    self.counts.pop(directory, None)
+                    self.lost.append(directory)
+                elif name:
+                    paths.add(os.path.join(directory, g.toUnicode(name)))
+        return None if overflow else paths
+    #@-others
 #@+node:ekr.20150405073203.1: ** class ExternalFilesController
 class ExternalFilesController(object):
     '''
@@ -69,6 +414,14 @@ class ExternalFilesController(object):
             # Copy of g.app.commanders()
         self.unchecked_files = []
             # Copy of self file. Only one files is checked at idle time.
+        self.watched_d = {}
+            # Keys are commanders, values are tuples (time, d).
+            # Keys of d are the paths of @<file> nodes, values are vnodes.
+        self.watcher = FileWatcher()
+            # The worker thread starts when the first path is watched.
+        self.watcher_enabled_d = {}
+            # Keys are commanders.
+            # Values are cached watch-external-files settings.
         self._time_d = {}
             # Keys are full paths, values are modification times.
             # DO NOT alter directly, use set_time(path) and
@@ -178,6 +531,21 @@ class ExternalFilesController(object):
         Check all external files corresponding to @<file> nodes in c for
         changes.
         '''
+        if self.is_watcher_enabled(c):
+            d = self.update_watched_files(c)
+            lost = {}
+            for path, digest in self.watcher.get_changes(d).items():
+                p = self.find_watched_node(c, d[path], path)
+                if p:
+                    self.idle_check_at_file_node(c, p, digest=digest)
+                else:
+                    lost[path] = digest
+            if lost:
+                # The outline has changed since the last scan.
+                # Rescan it before checking these paths again.
+                self.watched_d.pop(c, None)
+                self.watcher.requeue(lost)
+            return
         p = c.rootPosition()
         seen = set()
         while p:
@@ -190,10 +558,13 @@ class ExternalFilesController(object):
             else:
                 p.moveToThreadNext()
     #@+node:ekr.20150403044823.1: *5* efc.idle_check_at_file_node
-    def idle_check_at_file_node(self, c, p):
-        '''Check the @<file> node at p for external changes.'''
+    def idle_check_at_file_node(self, c, p, digest=None):
+        '''
+        Check the @<file> node at p for external changes.
+        digest is the file's md5 digest, if already known.
+        '''
         path = g.fullPath(c, p)
-        if self.has_changed(c, path):
+        if self.has_changed(c, path, digest=digest):
             if self.ask(c, path, p=p):
                 c.redraw(p=p)
                 c.refreshFromDisk(p)
@@ -201,6 +572,57 @@ class ExternalFilesController(object):
             # Always update the path & time to prevent future warnings.
             self.set_time(path)
             self.checksum_d[path] = self.checksum(path)
+    #@+node:dev.20261018190000.24: *5* efc.find_watched_node
+    def find_watched_node(self, c, v, path):
+        '''
+        Return a position of the vnode v if v is still an @<file> node
+        for the given path in c's outline. Otherwise return None.
+        '''
+        p = c.vnode2position(v)
+        if not p or not c.positionExists(p):
+            # v's first parent may no longer be in the outline.
+            for p in c.all_unique_positions():
+                if p.v == v:
+                    break
+            else:
+                return None
+        if p.isAnyAtFileNode() and g.fullPath(c, p) == path:
+            return p.copy()
+        return None
+    #@+node:dev.20261018190000.18: *5* efc.update_watched_files
+    rescan_interval = 10.0
+        # The number of seconds between scans of an outline for @<file> nodes.
+
+    def update_watched_files(self, c):
+        '''
+        Return a dict of c's @<file> nodes. Keys are paths, values are vnodes.
+
+        Scan the outline at most once every rescan_interval seconds, and
+        tell the watcher about the paths of all commanders.
+        '''
+        now = time.time()
+        data = self.watched_d.get(c)
+        if data and now < data[0] + self.rescan_interval:
+            return data[1]
+        d, seen = {}, set()
+        walker = c.walk_all_nodes()
+        for v, depth, parent_v, n in walker:
+            if v in seen:
+                walker.skip()
+            elif v.isAnyAtFileNode():
+                seen.add(v)
+                d[g.fullPath(c, walker.position())] = v
+                walker.skip()
+        self.watched_d[c] = now, d
+        commanders = g.app.commanders()
+        for c2 in list(self.watched_d.keys()):
+            if c2 not in commanders:
+                del self.watched_d[c2]
+        paths = set()
+        for junk, d2 in self.watched_d.values():
+            paths.update(d2.keys())
+        self.watcher.watch(paths)
+        return d
     #@+node:ekr.20150407124259.1: *5* efc.idle_check_open_with_file & helper
     def idle_check_open_with_file(self, ef):
         '''Update the open-with node given by ef.'''
@@ -290,6 +712,7 @@ class ExternalFilesController(object):
         Called by g.app.finishQuit.
         '''
         # Dont call g.es or g.trace! The log stream no longer exists.
+        self.watcher.stop()
         for ef in self.files[:]:
             self.destroy_external_file(ef)
         self.files = []
@@ -338,8 +761,8 @@ class ExternalFilesController(object):
     #@+node:ekr.20150404052819.1: *4* efc.checksum
     def checksum(self, path):
         '''Return the checksum of the file at the given path.'''
-        import hashlib
-        return hashlib.md5(open(path, 'rb').read()).hexdigest()
+        watcher = self.watcher
+        return watcher.get_digest(path) or watcher.digest(path)
     #@+node:ekr.20100203050306.5937: *4* efc.create_temp_file
     def create_temp_file(self, c, ext, p):
         '''
@@ -427,8 +850,11 @@ class ExternalFilesController(object):
         '''
         return self._time_d.get(g.os_path_realpath(path))
     #@+node:ekr.20150403045207.1: *4* efc.has_changed
-    def has_changed(self, c, path):
-        '''Return True if p's external file has changed outside of Leo.'''
+    def has_changed(self, c, path, digest=None):
+        '''
+        Return True if p's external file has changed outside of Leo.
+        digest is the file's md5 digest, if already known.
+        '''
         if not g.os_path_exists(path):
             return False
         if g.os_path_isdir(path):
@@ -440,7 +866,7 @@ class ExternalFilesController(object):
         if not old_time:
             # Initialize.
             self.set_time(path, new_time)
-            self.checksum_d[path] = self.checksum(path)
+            self.checksum_d[path] = digest or self.checksum(path)
             return False
         if old_time == new_time:
             # print('%s:times match %s %s' % (tag,c.shortFileName(),path))
@@ -448,7 +874,7 @@ class ExternalFilesController(object):
         #
         # Check the checksums *only* if the mod times don't match.
         old_sum = self.checksum_d.get(path)
-        new_sum = self.checksum(path)
+        new_sum = digest or self.checksum(path)
         if new_sum == old_sum:
             # The modtime changed, but it's contents didn't.
             # Update the time, so we don't keep checking the checksums.
@@ -474,6 +900,15 @@ class ExternalFilesController(object):
             val = c.config.getBool('check_for_changed_external_files', default=False)
             d[c] = val
         return val
+    #@+node:dev.20261018190000.19: *4* efc.is_watcher_enabled
+    def is_watcher_enabled(self, c):
+        '''Return the cached @bool watch-external-files setting.'''
+        d = self.watcher_enabled_d
+        val = d.get(c)
+        if val is None:
+            val = c.config.getBool('watch-external-files', default=True)
+            d[c] = val
+        return val
     #@+node:ekr.20150404083049.1: *4* efc.join
     def join(self, s1, s2):
         '''Return s1 + ' ' + s2'''
@@ -13,7 +13,7 @@ except Exception:
 import leo.core.leoGlobals as g
 import leo.core.leoNodes as leoNodes
 import binascii
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import difflib
 import time
 if g.isPython3:
@@ -25,12 +25,14 @@ else:
     StringIO = cStringIO.StringIO
 import os
 import pickle
+import shutil
 # import string
 # import sys
 import tempfile
 import zipfile
 import sqlite3
 import hashlib
+import weakref
 from contextlib import contextmanager
 #@-<< imports >>
 PRIVAREA = '---begin-private-area---'
@@ -63,6 +65,8 @@ class FastRead (object):
     def readFile(self, path=None, s=None):
 
         if not s:
+            if self.c.config.getBool('stream-leo-file-reads', default=False):
+                return self.readWithIterparse(path)
             with open(path, 'rb') as f:
                 s = f.read()
         return self.readWithElementTree(path, s)
@@ -233,7 +237,7 @@ class FastRead (object):
     #@+node:ekr.20180602062323.9: *5* fast.scanVnodes & helper
     def scanVnodes(self, gnx2body, gnx2vnode, gnx2ua, v_elements):
         
-        c, fc = self.c, self.c.fileCommands
+        c = self.c
         #@+<< define v_element_visitor >>
         #@+node:ekr.20180605102822.1: *6* << define v_element_visitor >>
         def v_element_visitor(parent_e, parent_v):
@@ -267,36 +271,10 @@ class FastRead (object):
                     #@-<< Make a new vnode, linked to the parent >>
                     #@+<< handle all other v attributes >>
                     #@+node:ekr.20180605075113.1: *7* << handle all other v attributes >>
-                    # Like fc.handleVnodeSaxAttrutes.
-                    #
-                    # The native attributes of <v> elements are a, t, vtag, tnodeList,
-                    # marks, expanded, and descendentTnode/VnodeUnknownAttributes.
-                    d = e.attrib
-                    s = d.get('tnodeList', '')
-                    tnodeList = s and s.split(',')
-                    if tnodeList:
-                        # This tnodeList will be resolved later.
-                        v.tempTnodeList = tnodeList
-                    s = d.get('descendentTnodeUnknownAttributes')
-                    if s:
-                        aDict = fc.getDescendentUnknownAttributes(s, v=v)
-                        if aDict:
-                            fc.descendentTnodeUaDictList.append(aDict)
-                    s = d.get('descendentVnodeUnknownAttributes')
-                    if s:
-                        aDict = fc.getDescendentUnknownAttributes(s, v=v)
-                        if aDict:
-                            fc.descendentVnodeUaDictList.append((v, aDict),)
-                    #
-                    # Handle vnode uA's
                     uaDict = gnx2ua.get(gnx)
                         # gnx2ua is a defaultdict(dict)
                         # It might already exists because of tnode uA's.
-                    for key, val in d.items():
-                        if key not in self.nativeVnodeAttributes:
-                            uaDict[key] = self.resolveUa(key, val)
-                    if uaDict:
-                        v.unknownAttributes = uaDict
+                    self.handleVnodeAttributes(v, e.attrib, uaDict)
                     #@-<< handle all other v attributes >>
                     # Handle all inner elements.
                     v_element_visitor(e, v)
@@ -311,7 +289,384 @@ class FastRead (object):
         # Traverse the tree of v elements.
         v_element_visitor(v_elements, hidden_v)
         return hidden_v
+    #@+node:dev.20261018320000.1: *5* fast.handleVnodeAttributes
+    def handleVnodeAttributes(self, v, d, uaDict):
+        '''
+        Handle the attributes d of the <v> element for the new vnode v.
+        Set v.unknownAttributes from uaDict, updated with the <v> element's uA's.
+        '''
+        # Like fc.handleVnodeSaxAttrutes.
+        #
+        # The native attributes of <v> elements are a, t, vtag, tnodeList,
+        # marks, expanded, and descendentTnode/VnodeUnknownAttributes.
+        fc = self.c.fileCommands
+        s = d.get('tnodeList', '')
+        tnodeList = s and s.split(',')
+        if tnodeList:
+            # This tnodeList will be resolved later.
+            v.tempTnodeList = tnodeList
+        s = d.get('descendentTnodeUnknownAttributes')
+        if s:
+            aDict = fc.getDescendentUnknownAttributes(s, v=v)
+            if aDict:
+                fc.descendentTnodeUaDictList.append(aDict)
+        s = d.get('descendentVnodeUnknownAttributes')
+        if s:
+            aDict = fc.getDescendentUnknownAttributes(s, v=v)
+            if aDict:
+                fc.descendentVnodeUaDictList.append((v, aDict),)
+        #
+        # Handle vnode uA's
+        for key, val in d.items():
+            if key not in self.nativeVnodeAttributes:
+                uaDict[key] = self.resolveUa(key, val)
+        if uaDict:
+            v.unknownAttributes = uaDict
+    #@+node:dev.20261018320000.2: *4* fast.readWithIterparse
+    def readWithIterparse(self, path):
+        '''
+        Read the .leo file at path with ElementTree.iterparse.
+
+        Unlike fast.readWithElementTree, this never holds the entire file or
+        its element tree in memory. It creates vnodes as <v> elements arrive
+        and sets their bodies as the following <t> elements arrive, deleting
+        all elements as soon as they have been handled.
+        '''
+        c, gnx2vnode = self.c, self.gnx2vnode
+        hidden_gnx = 'hidden-root-vnode-gnx'
+        old_hidden_v = gnx2vnode.get(hidden_gnx)
+        hidden_v = leoNodes.VNode(context=c, gnx=hidden_gnx)
+        hidden_v._headString = g.u('<hidden root vnode>')
+        created = set()
+            # The gnxs of all vnodes created here.
+        pending = {}
+            # Keys are gnxs of vnodes that existed before this read.
+            # Values are their bodies, set only if the read succeeds.
+        stack = []
+            # Pairs (v, e) for all open <v> elements, and the <vnodes> element.
+        skip = 0
+            # The depth within the <v> element of a clone.
+        tnodes = None
+        try:
+            for event, e in ElementTree.iterparse(path, events=('start', 'end')):
+                tag = e.tag
+                if event == 'start':
+                    if tag == 'v':
+                        if skip:
+                            skip += 1
+                            continue
+                        gnx = e.attrib['t']
+                        parent_v = stack[-1][0]
+                        v = gnx2vnode.get(gnx)
+                        if v:
+                            # A clone. Ignore its headline and children.
+                            skip = 1
+                            if gnx not in created:
+                                pending[gnx] = ''
+                        else:
+                            v = leoNodes.VNode(context=c, gnx=gnx)
+                            gnx2vnode[gnx] = v
+                            created.add(gnx)
+                            v._headString = 'PLACE HOLDER'
+                            self.handleVnodeAttributes(v, e.attrib, {})
+                        parent_v.children.append(v)
+                        v.parents.append(parent_v)
+                        stack.append((v, e))
+                    elif tag == 'vnodes':
+                        stack = [(hidden_v, e)]
+                    elif tag == 'tnodes':
+                        tnodes = e
+                    elif tag == 'globals':
+                        self.scanGlobals(e)
+                elif tag == 'vh':
+                    if not skip:
+                        stack[-1][0]._headString = g.toUnicode(e.text or '')
+                elif tag == 'v':
+                    if skip > 1:
+                        skip -= 1
+                    else:
+                        skip = 0
+                        stack.pop()
+                        # All earlier children of the parent have been handled.
+                        del stack[-1][1][:]
+                elif tag == 't':
+                    gnx = e.attrib['tx']
+                    if gnx in created:
+                        v = gnx2vnode[gnx]
+                        v._bodyString = g.toUnicode(e.text or '')
+                        self.handleTnodeAttributes(v, e.attrib)
+                    elif gnx in pending:
+                        pending[gnx] = g.toUnicode(e.text or '')
+                    del tnodes[:]
+        except Exception as e:
+            # Undo all changes to gnx2vnode and to existing vnodes.
+            for gnx in created:
+                del gnx2vnode[gnx]
+            for gnx in pending:
+                v = gnx2vnode[gnx]
+                v.parents = [z for z in v.parents
+                    if z is not hidden_v and z.gnx not in created]
+            if old_hidden_v:
+                gnx2vnode[hidden_gnx] = old_hidden_v
+            else:
+                gnx2vnode.pop(hidden_gnx, None)
+            print('')
+            g.es_print('bad .leo file: %s' % g.shortFileName(path), color='red')
+            g.es_print(g.toUnicode(e))
+            print('')
+            return None
+        for gnx, body in pending.items():
+            gnx2vnode[gnx]._bodyString = body
+        self.handleBits()
+        return hidden_v
+    #@+node:dev.20261018320000.3: *5* fast.handleTnodeAttributes
+    def handleTnodeAttributes(self, v, d):
+        '''
+        Add the uA's in the attributes d of a <t> element to v.unknownAttributes.
+        The uA's of the <v> element take precedence.
+        '''
+        uaDict = None
+        for key, val in d.items():
+            if key != 'tx':
+                if uaDict is None:
+                    uaDict = getattr(v, 'unknownAttributes', None) or {}
+                if key not in uaDict:
+                    uaDict[key] = self.resolveUa(key, val)
+        if uaDict:
+            v.unknownAttributes = uaDict
+    #@-others
+#@+node:dev.20261018150000.1: ** class StreamingOutputFile
+class StreamingOutputFile(object):
+    '''
+    A file-like object used by fc.writeToFileStreaming.
+    It encodes the strings passed to write() and writes them to f,
+    a binary file, in chunks of roughly chunkSize characters.
+    '''
+
+    def __init__(self, f, encoding, chunkSize=1024 * 1024):
+        self.chunkSize = chunkSize
+        self.encoding = encoding
+        self.f = f
+        self.pending = []
+        self.size = 0
+
+    def flush(self):
+        '''Encode and write all pending strings.'''
+        if self.pending:
+            s = ''.join(self.pending)
+            self.pending = []
+            self.size = 0
+            if g.isUnicode(s):
+                s = s.encode(self.encoding, 'replace')
+            self.f.write(s)
+
+    def write(self, s):
+        self.pending.append(s)
+        self.size += len(s)
+        if self.size >= self.chunkSize:
+            self.flush()
+#@+node:dev.20261018300000.1: ** class SqliteBodyLoader
+class SqliteBodyLoader(object):
+    '''
+    Reads the body text and uA of SqliteVNodes from a .db file when first used.
+
+    Loading a node's body also loads the bodies of its descendants. At most
+    maxResident bodies that have not changed since they were loaded stay in
+    memory: the least recently used bodies are dropped and read again if needed.
+    '''
+    unloaded = object()
+        # The body or uA column of rows whose data is the data in the .db file.
+    prefetchSize = 200
+        # The maximum number of nodes loaded by one query.
+
+    def __init__(self, fileName, maxResident=0):
+        self.conn = sqlite3.connect(fileName)
+        self.ignored = None
+            # A set of the gnxs of all nodes whose body contained @ignore
+            # when last saved, or None if unknown.
+        self.maxResident = maxResident
+            # Zero: never drop bodies.
+        self.resident = OrderedDict()
+            # Keys are SqliteVNodes with loaded, unchanged bodies,
+            # least recently used first. Values are ignored.
+        self.vnodes = weakref.WeakValueDictionary()
+            # Keys are gnxs, values are all live SqliteVNodes using this loader,
+            # including deleted nodes that the undoer may restore.
+
+    #@+others
+    #@+node:dev.20261018300000.2: *3* loader.close & loadAll
+    def close(self):
+        self.resident.clear()
+        self.conn.close()
+
+    def loadAll(self, vnodes):
+        '''
+        Load the bodies and uAs of all SqliteVNodes in vnodes. They become
+        ordinary VNodes: they no longer use this loader.
+        '''
+        aList = [v for v in vnodes
+            if isinstance(v, SqliteVNode) and v._dbLoader is self]
+        for i in range(0, len(aList), self.prefetchSize):
+            chunk = aList[i: i + self.prefetchSize]
+            bodies = self.select('body', chunk)
+            uas = self.select('ua', chunk)
+            for v in chunk:
+                if SqliteVNode.bodySlot.__get__(v) is None:
+                    SqliteVNode.bodySlot.__set__(v, bodies.get(v._dbGnx) or '')
+                if not v._dbUaLoaded:
+                    self.setUa(v, uas.get(v._dbGnx))
+                v._dbBodyChanged = True
+                v._dbLoader = None
+                self.vnodes.pop(v._dbGnx, None)
+        self.resident.clear()
+    #@+node:dev.20261018300000.3: *3* loader.loadBody & loadUa
+    def loadBody(self, v):
+        '''Load the bodies of v and its descendants. Return v's body.'''
+        bodySlot = SqliteVNode.bodySlot
+        nodes = self.subtree(v, lambda z: bodySlot.__get__(z) is None)
+        d = self.select('body', nodes)
+        for z in reversed(nodes): # v is the most recently used node.
+            bodySlot.__set__(z, d.get(z._dbGnx) or '')
+            self.resident[z] = None
+        s = bodySlot.__get__(v)
+        self.evict()
+        return s
+
+    def loadUa(self, v):
+        '''Load the uAs of v and its descendants.'''
+        nodes = self.subtree(v, lambda z: not z._dbUaLoaded)
+        d = self.select('ua', nodes)
+        for z in nodes:
+            self.setUa(z, d.get(z._dbGnx))
+
+    def setUa(self, v, ua):
+        '''Set v's uA from the pickled uA in the ua column.'''
+        v._dbUaLoaded = True
+        if not ua:
+            return
+        try:
+            ua = pickle.loads(g.toEncodedString(ua))
+        except Exception:
+            ua = None
+        if isinstance(ua, dict):
+            v._dbUa = ua
+    #@+node:dev.20261018300000.4: *3* loader.evict & touch
+    def evict(self):
+        '''Drop the least recently used unchanged bodies.'''
+        d, n = self.resident, self.maxResident
+        while n > 0 and len(d) > n:
+            v, junk = d.popitem(last=False)
+            if not v._dbBodyChanged:
+                SqliteVNode.bodySlot.__set__(v, None)
+
+    def touch(self, v):
+        '''Make v the most recently used node.'''
+        d = self.resident
+        if v in d:
+            del d[v]
+            d[v] = None
+    #@+node:dev.20261018300000.5: *3* loader.select & subtree
+    def select(self, column, nodes):
+        '''Return a dict whose keys are gnxs and whose values are the given column.'''
+        if not nodes:
+            return {}
+        sql = 'select gnx, %s from vnodes where gnx in (%s)' % (
+            column, ','.join('?' * len(nodes)))
+        try:
+            return dict(self.conn.execute(sql, [v._dbGnx for v in nodes]).fetchall())
+        except sqlite3.Error as e:
+            g.error('can not read %s from .db file: %s' % (column, e))
+            return {}
+
+    def subtree(self, v, pred):
+        '''
+        Return a list of v and of up to prefetchSize descendants z of v,
+        in breadth-first order, such that pred(z) is True.
+        '''
+        result, seen, todo = [v], set([v]), list(v.children)
+        while todo and len(result) < self.prefetchSize:
+            z = todo.pop(0)
+            if z in seen:
+                continue
+            seen.add(z)
+            if isinstance(z, SqliteVNode) and z._dbLoader is self and pred(z):
+                result.append(z)
+            todo.extend(z.children)
+        return result
     #@-others
+#@+node:dev.20261018300000.6: ** class SqliteVNode
+if hasattr(leoNodes.VNode, '__slots__'): # Not when using ZODB.
+
+    class SqliteVNode(leoNodes.VNode):
+        '''
+        A VNode created by fc.retrieveVnodesFromDb in lazy mode.
+        Its body text and uA are read from the .db file when first used.
+        '''
+        __slots__ = ('_dbLoader', '_dbGnx', '_dbBodyChanged', '_dbUaLoaded', '_dbUa')
+
+        bodySlot = leoNodes.VNode._bodyString
+            # The _bodyString slot of the base class.
+            # It contains None until the body has been loaded.
+
+        def __init__(self, context, gnx, loader):
+            self._dbLoader = loader
+                # The SqliteBodyLoader, or None when all data have been loaded.
+            if loader:
+                loader.vnodes[gnx] = self
+            leoNodes.VNode.__init__(self, context, gnx)
+            self._dbGnx = gnx
+            self._dbBodyChanged = False
+            self._dbUaLoaded = False
+            SqliteVNode.bodySlot.__set__(self, None)
+
+        #@+others
+        #@+node:dev.20261018300000.7: *3* SqliteVNode._bodyString & unknownAttributes
+        def __get_body(self):
+            s = SqliteVNode.bodySlot.__get__(self)
+            if s is None:
+                s = self._dbLoader.loadBody(self)
+            elif self._dbLoader and not self._dbBodyChanged:
+                self._dbLoader.touch(self)
+            return s
+
+        def __set_body(self, s):
+            SqliteVNode.bodySlot.__set__(self, s)
+            self._dbBodyChanged = True
+            if self._dbLoader:
+                self._dbLoader.resident.pop(self, None)
+
+        _bodyString = property(__get_body, __set_body)
+
+        def __get_ua(self):
+            if not self._dbUaLoaded:
+                self._dbLoader.loadUa(self)
+            return self._dbUa # May raise AttributeError.
+
+        def __set_ua(self, val):
+            self._dbUaLoaded = True
+            self._dbUa = val
+
+        def __del_ua(self):
+            self._dbUaLoaded = True
+            del self._dbUa
+
+        unknownAttributes = property(__get_ua, __set_ua, __del_ua)
+        #@+node:dev.20261018300000.8: *3* SqliteVNode.isAtIgnoreNode
+        def isAtIgnoreNode(self):
+            '''Don't load the body if the .db file says whether it contains @ignore.'''
+            loader = self._dbLoader
+            if (
+                loader and loader.ignored is not None and
+                SqliteVNode.bodySlot.__get__(self) is None
+            ):
+                return (
+                    g.match_word(self._headString, 0, '@ignore') or
+                    self._dbGnx in loader.ignored)
+            return leoNodes.VNode.isAtIgnoreNode(self)
+        #@-others
+
+else:
+    SqliteVNode = None
 #@+node:ekr.20160514120347.1: ** class FileCommands
 class FileCommands(object):
     """A class creating the FileCommands subcommander."""
@@ -373,6 +728,30 @@ class FileCommands(object):
             # 2011/12/10: This dict is never re-inited.
         self.vnodesDict = {}
             # keys are gnx strings; values are ignored
+        self.tnodeFragments = {}
+            # Keys are gnx strings; values are (v._bodyString, escaped body).
+            # Used by fc.putTnode. Rebuilt by each fc.putReferencedTnodes.
+        self.useTnodeFragments = True
+            # Set by fc.putTnodes.
+        self.dbFileName = None
+            # The .db file described by dbRowHashes and dbHashes.
+        self.dbFileStamp = None
+            # The modification time of dbFileName after the last read or save.
+        self.dbRowHashes = {}
+            # Keys are gnx strings; values are the hashes of the rows of
+            # the vnodes table as last read from or written to dbFileName.
+        self.dbHashes = {}
+            # Keys are 'md5_<gnx>' names in the extra_infos table.
+            # Values are (path, size, mtime, md5) of external files.
+        self.dbStoredHashes = {}
+            # Keys are gnxs of @<file> nodes; values are (md5, "size mtime")
+            # of their external files as read from a .db file.
+            # Used only while reading external files.
+        self.dbIgnored = None
+            # The set of gnxs of nodes whose body contains @ignore,
+            # as last read from or written to dbFileName, or None.
+        self.dbLoader = None
+            # The SqliteBodyLoader for the SqliteVNodes of this outline.
     #@+node:ekr.20031218072017.3020: *3* fc.Reading
     #@+node:ekr.20060919104836: *4*  fc.Reading Top-level
     #@+node:ekr.20031218072017.1559: *5* fc.Paste
@@ -449,6 +828,9 @@ class FileCommands(object):
             p._linkCopiedAfter(current)
         # Fix #862: paste-retaining-clones can corrupt the outline.
         self.linkChildrenToParents(p)
+        # Reading may have changed existing clones.
+        for p2 in p.self_and_subtree(copy=False):
+            p2.v.setDbChanged()
         c.selectPosition(p)
         self.initReadIvars()
         return p
@@ -609,7 +991,16 @@ class FileCommands(object):
     def readExternalFiles(self, fileName):
         '''Read all external files.'''
         c, fc = self.c, self
-        c.atFileCommands.readAll(c.rootVnode(), force=False)
+        unchanged = None
+        if fileName.endswith('.db') and fc.dbStoredHashes:
+            d = {}
+            def unchanged_helper(p):
+                if p.v not in d:
+                    d[p.v] = fc.isUnchangedExternalFile(p)
+                return d[p.v]
+            unchanged = unchanged_helper
+        c.atFileCommands.readAll(c.rootVnode(), force=False, unchanged=unchanged)
+        fc.dbStoredHashes = {}
         recoveryNode = fc.handleNodeConflicts()
         # Do this after reading external files.
         # The descendent nodes won't exist unless we have read
@@ -617,6 +1008,29 @@ class FileCommands(object):
         fc.restoreDescendentAttributes()
         fc.setPositionsFromVnodes()
         return recoveryNode
+    #@+node:dev.20261018310000.2: *6* fc.isUnchangedExternalFile
+    def isUnchangedExternalFile(self, p):
+        '''
+        Return True if the external file of the @<file> node p has not changed
+        since the .db file being read was saved: the file has the same size
+        and modification time, or the same md5 digest, as when it was saved.
+        '''
+        c, fc = self.c, self
+        digest, stat = fc.dbStoredHashes.get(p.gnx, (None, None))
+        if not digest or p.isOrphan():
+            # An orphan tree was not written when the outline was saved.
+            return False
+        path = c.getNodeFileName(p)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        stamp = (path, st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime))
+        if stat == '%s %s' % stamp[1:]:
+            # fc.exportHashesToSqlite need not write this entry.
+            fc.dbHashes['md5_' + p.gnx] = stamp + (digest,)
+            return True
+        return fc.getExternalFileDigest(path) == digest
     #@+node:ekr.20031218072017.1554: *6* fc.warnOnReadOnlyFiles
     def warnOnReadOnlyFiles(self, fileName):
         # os.access may not exist on all platforms.
@@ -729,6 +1143,8 @@ class FileCommands(object):
                 v.parents = parents
                 v.iconVal = iconVal
                 v.statusBits = statusBits
+                if v.isDirty():
+                    v.setDirty() # Update c.dirtyVnodes.
                 v.u = ua
                 vnodes.append(v)
             pv = lambda x: fc.gnxDict.get(x, c.hiddenRootNode)
@@ -902,17 +1318,29 @@ class FileCommands(object):
         Recreates tree from the data contained in table vnodes.
         
         This method follows behavior of readSaxFile.
+        
+        With @bool lazy-sqlite-bodies = True, read only the headlines and
+        links and create SqliteVNodes, whose bodies and uAs are read later.
         '''
 
         c, fc = self.c, self
+        lazy = bool(SqliteVNode and fc.mFileName and
+            c.config.getBool('lazy-sqlite-bodies', default=False))
         sql = '''select gnx, head, 
-             body,
+             %s,
              children,
              parents,
              iconVal,
              statusBits,
-             ua from vnodes'''
-        vnodes = []
+             %s from vnodes''' % (('null', 'null') if lazy else ('body', 'ua'))
+        if fc.dbLoader:
+            fc.dbLoader.close()
+            fc.dbLoader = None
+        if lazy:
+            loader = SqliteBodyLoader(fc.mFileName,
+                c.config.getInt('lazy-sqlite-resident-bodies') or 0)
+            unloaded = SqliteBodyLoader.unloaded
+        vnodes, hashes = [], {}
         try:
             for row in conn.execute(sql):
                 (gnx,
@@ -923,20 +1351,31 @@ class FileCommands(object):
                     iconVal,
                     statusBits,
                     ua) = row
-                try:
-                    ua = pickle.loads(g.toEncodedString(ua))
-                except ValueError:
-                    ua = None
-                v = leoNodes.VNode(context=c, gnx=gnx)
+                if lazy:
+                    v = SqliteVNode(context=c, gnx=gnx, loader=loader)
+                    hashes[gnx] = hash((gnx, h, unloaded, children, parents,
+                        iconVal, statusBits, unloaded))
+                else:
+                    hashes[gnx] = hash(row)
+                    try:
+                        ua = pickle.loads(g.toEncodedString(ua))
+                    except ValueError:
+                        ua = None
+                    v = leoNodes.VNode(context=c, gnx=gnx)
+                    v._bodyString = b
                 v._headString = h
-                v._bodyString = b
                 v.children = children.split()
                 v.parents = parents.split()
                 v.iconVal = iconVal
                 v.statusBits = statusBits
-                v.u = ua
+                if v.isDirty():
+                    v.setDirty() # Update c.dirtyVnodes.
+                if not lazy:
+                    v.u = ua
                 vnodes.append(v)
         except sqlite3.Error as er:
+            if lazy:
+                loader.close()
             if er.args[0].find('no such table') < 0:
                 # there was an error raised but it is not the one we expect
                 g.internalError(er)
@@ -944,6 +1383,7 @@ class FileCommands(object):
             return None
 
         rootChildren = [x for x in vnodes if 'hidden-root-vnode-gnx' in x.parents]
+        rootChildren = fc.sortRootChildrenFromDb(conn, rootChildren)
         if not rootChildren:
             g.trace('there should be at least one top level node!')
             return None
@@ -955,12 +1395,64 @@ class FileCommands(object):
             v.children = [findNode(x) for x in v.children]
             v.parents = [findNode(x) for x in v.parents]
         c.hiddenRootNode.children = rootChildren
+        # Later saves write only the vnodes that differ from these rows.
+        fc.dbRowHashes, fc.dbHashes = hashes, {}
+        fc.dbIgnored = fc.getIgnoredGnxsFromDb(conn)
+        fc.dbStoredHashes = fc.getHashesFromDb(conn)
+        fc.setDbFileStamp(fc.mFileName)
+        if lazy:
+            loader.ignored = fc.dbIgnored
+            fc.dbLoader = loader
         (w, h, x, y, r1, r2, encp) = fc.getWindowGeometryFromDb(conn)
         c.frame.setTopGeometry(w, h, x, y, adjustSize=True)
         c.frame.resizePanesToRatio(r1, r2)
         p = fc.decodePosition(encp)
         c.setCurrentPosition(p)
         return rootChildren[0]
+    #@+node:dev.20261018310000.3: *6* fc.getHashesFromDb
+    def getHashesFromDb(self, conn):
+        '''
+        Return a dict describing the external files when the .db file was saved.
+        Keys are gnxs of @<file> nodes; values are (md5 digest, "size mtime").
+        '''
+        d = {}
+        try:
+            for name, value in conn.execute('select name, value from extra_infos'):
+                kind, sep, gnx = name.partition('_')
+                if kind in ('md5', 'stat') and gnx:
+                    digest, stat = d.get(gnx, (None, None))
+                    d[gnx] = (value, stat) if kind == 'md5' else (digest, value)
+        except sqlite3.OperationalError:
+            pass
+        return d
+    #@+node:dev.20261018300000.9: *6* fc.getIgnoredGnxsFromDb
+    def getIgnoredGnxsFromDb(self, conn):
+        '''
+        Return the set of gnxs of nodes whose body contains @ignore,
+        or None if the .db file does not say.
+        '''
+        try:
+            row = conn.execute('''select value from extra_infos
+                where name = 'ignored_gnxs' ''').fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        return set(row[0].split()) if row else None
+    #@+node:dev.20261018290000.3: *6* fc.sortRootChildrenFromDb
+    def sortRootChildrenFromDb(self, conn, rootChildren):
+        '''
+        Return rootChildren in the order given by the root_children entry of
+        the extra_infos table. Older files list top-level nodes in row order.
+        '''
+        try:
+            row = conn.execute('''select value from extra_infos
+                where name = 'root_children' ''').fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if not row or not row[0]:
+            return rootChildren
+        order = dict((gnx, i) for i, gnx in enumerate(row[0].split()))
+        n = len(order)
+        return sorted(rootChildren, key=lambda v: order.get(v.gnx, n))
     #@+node:vitalije.20170815162307.1: *6* fc.initNewDb
     def initNewDb(self, conn):
         ''' Initializes tables and returns None'''
@@ -1252,17 +1744,33 @@ class FileCommands(object):
             self.put(s)
             self.put_nl()
     #@+node:ekr.20031218072017.1577: *5* fc.putTnode
-    def putTnode(self, v):
+    def putTnode(self, v, fragments=None):
+        '''
+        Put the <t> element for v.
+
+        fragments is a dict of escaped bodies from the previous save. The
+        escaped body is reused if v's body is the very same string object.
+        '''
         # Call put just once.
         gnx = v.fileIndex
         # pylint: disable=consider-using-ternary
         ua = hasattr(v, 'unknownAttributes') and self.putUnknownAttributes(v) or ''
         b = v.b
-        body = xml.sax.saxutils.escape(b) if b else ''
+        data = fragments and fragments.get(gnx)
+        if data and data[0] is b:
+            body = data[1]
+        else:
+            body = xml.sax.saxutils.escape(b) if b else ''
+            if body == b:
+                body = b # Don't keep a second copy of b.
+        if fragments is not None:
+            self.tnodeFragments[gnx] = b, body
         self.put('<t tx="%s"%s>%s</t>\n' % (gnx, ua, body))
     #@+node:ekr.20031218072017.1575: *5* fc.putTnodes
     def putTnodes(self):
         """Puts all tnodes as required for copy or save commands"""
+        c = self.c
+        self.useTnodeFragments = c.config.getBool('cache-leo-file-fragments', default=True)
         self.put("<tnodes>\n")
         self.putReferencedTnodes()
         self.put("</tnodes>\n")
@@ -1271,16 +1779,28 @@ class FileCommands(object):
         '''Put all referenced tnodes.'''
         c = self.c
         if self.usingClipboard: # write the current tree.
-            theIter = self.currentPosition.self_and_subtree(copy=False)
+            walker = self.currentPosition.walk_self_and_subtree()
         else: # write everything
-            theIter = c.all_unique_positions(copy=False)
+            walker = c.walk_all_nodes()
         # Populate tnodes
         tnodes = {}
-        for p in theIter:
+        for v, depth, parent_v, n in walker:
             # Make *sure* the file index has the proper form.
             # pylint: disable=unbalanced-tuple-unpacking
-            index = p.v.fileIndex
-            tnodes[index] = p.v
+            index = v.fileIndex
+            if index in tnodes:
+                walker.skip() # The subtree of a clone.
+            else:
+                tnodes[index] = v
+        # Reuse the escaped bodies of unchanged nodes.
+        # Retain only the entries for the tnodes written here.
+        if self.useTnodeFragments:
+            fragments = self.tnodeFragments
+            if not self.usingClipboard:
+                self.tnodeFragments = {}
+        else:
+            fragments = None
+            self.tnodeFragments = {}
         # Put all tnodes in index order.
         for index in sorted(tnodes):
             v = tnodes.get(index)
@@ -1288,7 +1808,7 @@ class FileCommands(object):
                 # Write only those tnodes whose vnodes were written.
                 # **Note**: @<file> trees are not written unless they contain clones.
                 if v.isWriteBit():
-                    self.putTnode(v)
+                    self.putTnode(v, fragments)
             else:
                 g.trace('can not happen: no VNode for', repr(index))
                 # This prevents the file from being written.
@@ -1298,13 +1818,16 @@ class FileCommands(object):
         """Write a <v> element corresponding to a VNode."""
         fc = self
         v = p.v
-        isAuto = p.isAtAutoNode() and p.atAutoNodeName().strip()
-        isEdit = p.isAtEditNode() and p.atEditNodeName().strip() and not p.hasChildren()
-            # 2010/09/02: @edit nodes must not have children.
-            # If they do, the entire tree is written to the outline.
-        isFile = p.isAtFileNode()
-        isShadow = p.isAtShadowFileNode()
-        isThin = p.isAtThinFileNode()
+        if v.headString().startswith('@'):
+            isAuto = p.isAtAutoNode() and p.atAutoNodeName().strip()
+            isEdit = p.isAtEditNode() and p.atEditNodeName().strip() and not p.hasChildren()
+                # 2010/09/02: @edit nodes must not have children.
+                # If they do, the entire tree is written to the outline.
+            isFile = p.isAtFileNode()
+            isShadow = p.isAtShadowFileNode()
+            isThin = p.isAtThinFileNode()
+        else:
+            isAuto = isEdit = isFile = isShadow = isThin = False
         isOrphan = p.isOrphan()
         if not isIgnore:
             isIgnore = p.isAtIgnoreNode()
@@ -1488,6 +2011,8 @@ class FileCommands(object):
     #@+node:ekr.20100119145629.6111: *5* fc.writeToFileHelper & helpers
     def writeToFileHelper(self, fileName, toOPML):
         c = self.c; toZip = c.isZipped
+        if not toZip and c.config.getBool('stream-leo-file-writes', default=False):
+            return self.writeToFileStreaming(fileName, toOPML)
         ok, backupName = self.createBackupFile(fileName)
         if not ok: return False
         fileName, theActualFile = self.createActualFile(fileName, toOPML, toZip)
@@ -1579,6 +2104,69 @@ class FileCommands(object):
             g.utils_rename(c, backupName, fileName)
         else:
             g.error('backup file does not exist!', repr(backupName))
+    #@+node:dev.20261018150000.2: *6* fc.writeToFileStreaming & helper
+    def writeToFileStreaming(self, fileName, toOPML):
+        '''
+        Write the outline to a temporary file in the directory containing
+        fileName, encoding and writing the output in chunks, then replace
+        fileName with the temporary file.
+
+        Unlike fc.writeToFileHelper, this method never holds the entire
+        .leo file in memory, and fileName is never partially written, so no
+        backup file is needed.
+        '''
+        c = self.c
+        self.mFileName = fileName
+        g.app.write_Leo_file_string = None
+            # The output is never available as a string.
+        # Replace the target of a symlink, not the link itself.
+        path = g.os_path_realpath(g.os_path_finalize(fileName))
+        theDir, base = g.os_path_split(path)
+        try:
+            fd, tempName = tempfile.mkstemp(prefix='.%s.' % base, suffix='.tmp', dir=theDir)
+        except Exception:
+            g.es('can not open %s' % fileName)
+            g.es_exception()
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.outputFile = StreamingOutputFile(f, self.leo_file_encoding)
+                if toOPML:
+                    if hasattr(c, 'opmlController'):
+                        c.opmlController.putToOPML(owner=self)
+                    else:
+                        # This is not likely ever to be called.
+                        g.trace('leoOPML plugin not active.')
+                else:
+                    self.putLeoFile()
+                self.outputFile.flush()
+                f.flush()
+                os.fsync(f.fileno())
+            self.replaceFile(tempName, path)
+            c.setFileTimeStamp(fileName)
+            return True
+        except Exception:
+            g.es("exception writing:", fileName)
+            g.es_exception(full=True)
+            if g.os_path_exists(tempName):
+                self.deleteFileWithMessage(tempName, 'temp')
+            return False
+    #@+node:dev.20261018150000.3: *7* fc.replaceFile
+    def replaceFile(self, tempName, fileName):
+        '''Atomically replace fileName by tempName, retaining fileName's permissions.'''
+        if g.os_path_exists(fileName):
+            shutil.copymode(fileName, tempName)
+        else:
+            # Give the new file the permissions open() would have given it.
+            mask = os.umask(0)
+            os.umask(mask)
+            os.chmod(tempName, 0o666 & ~mask)
+        if hasattr(os, 'replace'):
+            os.replace(tempName, fileName) # Python 3.3+.
+        else:
+            if os.name == 'nt' and g.os_path_exists(fileName):
+                os.remove(fileName)
+            os.rename(tempName, fileName)
     #@+node:ekr.20100119145629.6110: *5* fc.writeToStringHelper
     def writeToStringHelper(self, fileName):
         try:
@@ -1609,14 +2197,48 @@ class FileCommands(object):
         theFile.close()
     #@+node:vitalije.20170630172118.1: *5* fc.exportToSqlite
     def exportToSqlite(self, fileName):
-        '''Dump all vnodes to sqlite database. Returns True on success.'''
+        '''
+        Dump all vnodes to sqlite database. Returns True on success.
+        
+        If fileName is unchanged since the last read or save, write only the
+        vnodes that have changed and delete the vnodes that no longer exist.
+        After a save, only the vnodes in c.dbChangedVnodes and the trees of
+        new and deleted vnodes are compared with the file. Otherwise, all
+        vnodes are compared, and if fileName has changed, first load the
+        bodies and uAs of all SqliteVNodes.
+        '''
         # fc = self
         c = self.c; fc = self
         if c.sqlite_connection is None:
             c.sqlite_connection = sqlite3.connect(fileName, 
                                         isolation_level='DEFERRED')
         conn = c.sqlite_connection
+        incremental = fc.isDbFileUnchanged(fileName)
+        if fc.dbLoader and not incremental:
+            fc.dbLoader.loadAll(c.all_unique_nodes())
+            fc.dbLoader.close()
+            fc.dbLoader = None
+        loader = fc.dbLoader
+        unloaded = SqliteBodyLoader.unloaded
+        def is_lazy(v):
+            return loader and isinstance(v, SqliteVNode) and v._dbLoader is loader
+        def dump_b(v):
+            if is_lazy(v) and not v._dbBodyChanged:
+                return unloaded # The .db file contains v's body.
+            return v._bodyString
+        def has_ignore(v):
+            if (
+                is_lazy(v) and loader.ignored is not None and
+                SqliteVNode.bodySlot.__get__(v) is None
+            ):
+                return v._dbGnx in loader.ignored
+            return g.is_special(v._bodyString, '@ignore')[0]
+        empty_u = pickle.dumps({}, protocol=1)
         def dump_u(v):
+            if is_lazy(v) and not v._dbUaLoaded:
+                return unloaded # The .db file contains v's uA.
+            if not getattr(v, 'unknownAttributes', None):
+                return empty_u
             try:
                 s = pickle.dumps(v.u, protocol=1)
             except pickle.PicklingError:
@@ -1626,7 +2248,7 @@ class FileCommands(object):
         dbrow = lambda v:(
                 v.gnx,
                 v.h,
-                v.b,
+                dump_b(v),
                 ' '.join(x.gnx for x in v.children),
                 ' '.join(x.gnx for x in v.parents),
                 v.iconVal,
@@ -1635,14 +2257,69 @@ class FileCommands(object):
             )
         ok = False
         try:
-            fc.prepareDbTables(conn)
+            if not incremental:
+                fc.dbRowHashes, fc.dbHashes = {}, {}
+            fc.prepareDbTables(conn, clear=not incremental)
             fc.exportDbVersion(conn)
-            fc.exportVnodesToSqlite(conn, (dbrow(v) for v in c.all_unique_nodes()))
+            check_all = not incremental or fc.dbIgnored is None
+            ignored = set() if check_all else set(fc.dbIgnored)
+            old_hashes, changed, deleted = fc.dbRowHashes, [], []
+            if check_all or c.dbChangedVnodes is None:
+                hashes, vnodes = {}, c.all_unique_nodes()
+            else:
+                # Update fc.dbRowHashes in place: errors clear it.
+                hashes = old_hashes
+                vnodes, gone = fc.getDbChangedVnodes()
+                for v in gone:
+                    if hashes.pop(v.gnx, None) is not None:
+                        deleted.append(v.gnx)
+            for v in vnodes:
+                row = dbrow(v)
+                old_hash, hashes[v.gnx] = old_hashes.get(v.gnx), hash(row)
+                if old_hash != hashes[v.gnx]:
+                    changed.append(row)
+                elif not check_all:
+                    continue
+                if has_ignore(v):
+                    ignored.add(v.gnx)
+                else:
+                    ignored.discard(v.gnx)
+            if hashes is not old_hashes:
+                deleted = [gnx for gnx in old_hashes if gnx not in hashes]
+            missing = fc.exportVnodesToSqlite(conn, changed)
+            if missing:
+                # An earlier save deleted the rows of these lazy vnodes.
+                # Write all their columns.
+                vnodes = [loader.vnodes[gnx] for gnx in missing]
+                loader.loadAll(vnodes)
+                changed = [dbrow(v) for v in vnodes]
+                fc.exportVnodesToSqlite(conn, changed)
+                hashes.update((row[0], hash(row)) for row in changed)
+            if loader:
+                # The undoer may restore deleted nodes: load their data
+                # before their rows disappear.
+                loader.loadAll([loader.vnodes.get(gnx) for gnx in deleted])
+            conn.executemany('delete from vnodes where gnx=?',
+                [(gnx,) for gnx in deleted])
+            ignored.difference_update(deleted)
+            # Replaced rows move to the end of the table.
+            conn.execute("replace into extra_infos(name, value) values('root_children', ?)",
+                (' '.join(v.gnx for v in c.hiddenRootNode.children),))
+            conn.execute("replace into extra_infos(name, value) values('ignored_gnxs', ?)",
+                (' '.join(sorted(ignored)),))
             fc.exportGeomToSqlite(conn)
             fc.exportHashesToSqlite(conn)
             conn.commit()
+            fc.dbRowHashes, fc.dbIgnored = hashes, ignored
+            if loader:
+                loader.ignored = ignored
+            fc.setDbFileStamp(fileName)
+            c.dbChangedVnodes = set()
             ok = True
         except sqlite3.Error as e:
+            conn.rollback()
+            fc.dbFileName, fc.dbRowHashes, fc.dbHashes = None, {}, {}
+            c.dbChangedVnodes = None
             g.internalError(e)
         return ok
     #@+node:vitalije.20170705075107.1: *6* fc.decodePosition
@@ -1666,9 +2343,69 @@ class FileCommands(object):
         res = [mk%(x.gnx, y) for x,y in p.stack]
         res.append(mk%(p.gnx, p._childIndex))
         return jn.join(res)
+    #@+node:dev.20261018290000.9: *6* fc.getDbChangedVnodes
+    def getDbChangedVnodes(self):
+        '''
+        Return (vnodes, gone): the vnodes whose rows fc.exportToSqlite must
+        compare with the .db file, and the vnodes no longer in the outline.
+
+        Both contain the vnodes in c.dbChangedVnodes, their children, and
+        all descendants of new vnodes and of vnodes no longer in the outline.
+        '''
+        c, fc = self.c, self
+        hidden, hashes = c.hiddenRootNode, fc.dbRowHashes
+        live = {hidden: True}
+
+        def in_outline(v):
+            if v not in live:
+                live[v] = False # Guard against cycles.
+                live[v] = any(v in parent.children and in_outline(parent)
+                    for parent in v.parents)
+            return live[v]
+
+        vnodes, gone, seen, todo = [], [], set(), []
+        for v in c.dbChangedVnodes:
+            todo.append(v)
+            todo.extend(v.children)
+        while todo:
+            v = todo.pop()
+            if v in seen or v is hidden:
+                continue
+            seen.add(v)
+            if in_outline(v):
+                vnodes.append(v)
+                if v.gnx in hashes:
+                    continue
+            else:
+                gone.append(v)
+            todo.extend(v.children)
+        return vnodes, gone
+    #@+node:dev.20261018290000.1: *6* fc.isDbFileUnchanged & setDbFileStamp
+    def isDbFileUnchanged(self, fileName):
+        '''
+        Return True if fc.dbRowHashes describes the contents of fileName:
+        fileName is the .db file last read or saved and it has not changed since.
+        '''
+        fc = self
+        if not fc.dbFileName or fc.dbFileName != os.path.abspath(fileName):
+            return False
+        try:
+            return fc.dbFileStamp == os.path.getmtime(fileName)
+        except OSError:
+            return False
+
+    def setDbFileStamp(self, fileName):
+        '''Remember that fc.dbRowHashes describes the contents of fileName.'''
+        fc = self
+        try:
+            fc.dbFileStamp = os.path.getmtime(fileName)
+            fc.dbFileName = os.path.abspath(fileName)
+        except OSError:
+            fc.dbFileName, fc.dbFileStamp = None, None
     #@+node:vitalije.20170811130512.1: *6* fc.prepareDbTables
-    def prepareDbTables(self, conn):
-        conn.execute('''drop table if exists vnodes;''')
+    def prepareDbTables(self, conn, clear=True):
+        if clear:
+            conn.execute('''drop table if exists vnodes;''')
         conn.execute('''
             create table if not exists vnodes(
                 gnx primary key,
@@ -1682,10 +2419,33 @@ class FileCommands(object):
         conn.execute('''create table if not exists extra_infos(name primary key, value)''')
     #@+node:vitalije.20170701161851.1: *6* fc.exportVnodesToSqlite
     def exportVnodesToSqlite(self, conn, rows):
-        conn.executemany('''insert into vnodes
+        '''
+        Write the given rows of the vnodes table.
+        Update only the other columns of rows whose body or ua is unloaded.
+
+        Return the gnxs of rows that could not be updated because the vnodes
+        table does not contain them.
+        '''
+        unloaded = SqliteBodyLoader.unloaded
+        full = [row for row in rows if unloaded not in row]
+        conn.executemany('''replace into vnodes
             (gnx, head, body, children, parents,
                 iconVal, statusBits, ua)
-            values(?,?,?,?,?,?,?,?);''', rows)
+            values(?,?,?,?,?,?,?,?);''', full)
+        missing = []
+        if len(full) == len(rows):
+            return missing
+        columns = ('head', 'body', 'children', 'parents', 'iconVal', 'statusBits', 'ua')
+        for row in rows:
+            if unloaded in row:
+                data = [(name, val) for name, val in zip(columns, row[1:])
+                    if val is not unloaded]
+                cursor = conn.execute('update vnodes set %s where gnx=?' % (
+                    ', '.join('%s=?' % name for name, val in data)),
+                    [val for name, val in data] + [row[0]])
+                if cursor.rowcount == 0:
+                    missing.append(row[0])
+        return missing
     #@+node:vitalije.20170701162052.1: *6* fc.exportGeomToSqlite
     def exportGeomToSqlite(self, conn):
         c = self.c
@@ -1708,31 +2468,56 @@ class FileCommands(object):
         conn.execute("replace into extra_infos(name, value) values('dbversion', ?)", ('1.0',))
     #@+node:vitalije.20170701162204.1: *6* fc.exportHashesToSqlite
     def exportHashesToSqlite(self, conn):
-        c = self.c
-        def md5(x):
-            try:
-                s = open(x, 'rb').read()
-            except Exception:
-                return ''
-            s = s.replace(b'\r\n', b'\n')
-            return hashlib.md5(s).hexdigest()
+        '''
+        Write the md5 digest, size and modification time of each @<file>
+        node's external file.
+        
+        Recompute a digest only if the file's size or modification time
+        has changed since the last save.
+        '''
+        c, fc = self.c, self
         files = set()
 
         p = c.rootPosition()
         while p:
             if p.isAtIgnoreNode():
                 p.moveToNodeAfterTree()
-            elif p.isAtAutoNode() or p.isAtFileNode():
+            elif p.isAnyAtFileNode():
                 fn = c.getNodeFileName(p)
                 files.add((fn, 'md5_'+p.gnx))
                 p.moveToNodeAfterTree()
             else:
                 p.moveToThreadNext()
-        # pylint: disable=deprecated-lambda
+        hashes, rows = {}, []
+        for fn, name in files:
+            try:
+                st = os.stat(fn)
+                stamp = (fn, st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime))
+            except OSError:
+                stamp = None
+            old = fc.dbHashes.get(name)
+            if stamp and old and old[:3] == stamp:
+                hashes[name] = old
+                continue # extra_infos already contains the digest.
+            digest = fc.getExternalFileDigest(fn)
+            if stamp:
+                hashes[name] = stamp + (digest,)
+                rows.append(('stat' + name[3:], '%s %s' % stamp[1:]))
+            rows.append((name, digest))
         conn.executemany(
-            'replace into extra_infos(name, value) values(?,?)',
-            map(lambda x:(x[1], md5(x[0])), files))
+            'replace into extra_infos(name, value) values(?,?)', rows)
+        fc.dbHashes = hashes
 
+    #@+node:dev.20261018310000.1: *6* fc.getExternalFileDigest
+    def getExternalFileDigest(self, path):
+        '''Return the md5 digest of the external file, or '' if it can't be read.'''
+        try:
+            with open(path, 'rb') as f:
+                s = f.read()
+        except Exception:
+            return ''
+        s = s.replace(b'\r\n', b'\n')
+        return hashlib.md5(s).hexdigest()
     #@+node:ekr.20031218072017.2012: *4* fc.writeAtFileNodes
     @cmd('write-at-file-nodes')
     def writeAtFileNodes(self, event=None):
@@ -1397,58 +1397,143 @@ class LeoFind(object):
     #@+node:ekr.20131117164142.16991: *4* LeoFind.setupSearchPattern
     def setupSearchPattern(self, pattern):
         self.ftm.setFindText(pattern)
-    #@+node:ekr.20031218072017.3067: *3* LeoFind.Utils
-    #@+node:ekr.20031218072017.2293: *4* find.batchChange
-    def batchChange(self, pos1, pos2):
+    #@+node:dev.20261018260000.7: *3* LeoFind.Batch engine
+    # find-all, clone-find-all and replace-all search each vnode just once,
+    # matching the whole headline and body in one pass.
+    #@+node:dev.20261018260000.8: *4* find.batchChangeNode
+    def batchChangeNode(self, match):
         '''
-        Do a single batch change operation, updating the head or body string of
-        p and leaving the result in s_ctrl.
-
-        s_ctrl contains the found text on entry and contains the changed text
-        on exit. pos and pos2 indicate the selection. The selection will never
-        be empty.
+        Replace all the matches recorded in match, a g.Bunch returned by
+        batchSearch, with self.change_text. Return the number of changes.
         '''
         c, u = self.c, self.c.undoer
-        p = self.p
-        if not p:
-            g.trace('===== can not happen: no p.')
-            return
-        w = self.s_ctrl
-        # Replace the selection with self.change_text
-        if pos1 > pos2:
-            pos1, pos2 = pos2, pos1
-        s = w.getAllText()
-        if pos1 != pos2:
-            w.delete(pos1, pos2)
-        w.insert(pos1, self.change_text)
-        # Update the selection.
-        insert = pos1 if self.reverse else pos1 + len(self.change_text)
-        w.setSelectionRange(insert, insert)
-        w.setInsertPoint(insert)
-        # Update the node
-        s = w.getAllText()
-        if s and s[-1] == '\n': s = s[: -1]
-        changed = s != p.h if self.in_headline else s != p.b
-        if changed:
-            undoData = u.beforeChangeNodeContents(p)
-            if self.in_headline:
-                p.initHeadString(s)
-            else:
-                # Fix #456: replace-all is very slow.
-                # p.b calls c.setBodyString, which is *very* slow.
-                p.v.setBodyString(s)
-            if self.mark_changes:
-                p.setMarked() # Just calls v.setMarked.
+        p, v = match.p, match.p.v
+
+        def replace(s, spans):
+            result, i = [], 0
+            for start, end in spans:
+                result.append(s[i:start])
+                result.append(self.change_text)
+                i = end
+            result.append(s[i:])
+            return ''.join(result)
+
+        undoData = u.beforeChangeNodeContents(p)
+        if match.head:
+            h = replace(v.h, match.head)
+            if h.endswith('\n'): h = h[:-1]
+            p.initHeadString(h)
+        if match.body:
             # Fix #456: replace-all is very slow.
-            # p.setDirty if very slow.
-            p.v.setDirty()
-            if not c.isChanged():
-                c.setChanged(True)
-            u.afterChangeNodeContents(
-                p,
-                'Change Headline' if self.in_headline else 'Change Body',
-                undoData,
-            )
+            # p.b calls c.setBodyString, which is *very* slow.
+            v.setBodyString(replace(v.b, match.body))
+        if self.mark_changes:
+            p.setMarked() # Just calls v.setMarked.
+        # Fix #456: replace-all is very slow.
+        # p.setDirty if very slow.
+        v.setDirty()
+        if not c.isChanged():
+            c.setChanged(True)
+        u.afterChangeNodeContents(p,
+            'Change Body' if match.body else 'Change Headline', undoData)
+        return len(match.head) + len(match.body)
+    #@+node:dev.20261018260000.9: *4* find.batchMatcher
+    def batchMatcher(self):
+        '''
+        Return a function that returns the list of (start, end) spans of all
+        non-overlapping matches in a string, using the present find options.
+        Return None if the pattern is not valid.
+        '''
+        if self.pattern_match or self.findAllUniqueFlag:
+            if not self.precompilePattern():
+                return None
+            re_obj = self.re_obj
+
+            def regex_spans(s):
+                return [m.span() for m in re_obj.finditer(s) if m.end() > m.start()]
+
+            return regex_spans
+        nocase, word = self.ignore_case, self.whole_word
+        pattern = self.replaceBackSlashes(self.find_text)
+        if nocase:
+            pattern = pattern.lower()
+        n = len(pattern)
+
+        def plain_spans(s):
+            result, i = [], 0
+            if not n:
+                return result
+            if nocase:
+                s = s.lower()
+            while 1:
+                k = s.find(pattern, i)
+                if k == -1:
+                    return result
+                i = k + n
+                if not word or self.matchWord(s, k, pattern):
+                    result.append((k, i))
+
+        return plain_spans
+    #@+node:dev.20261018260000.10: *4* find.batchRange
+    def batchRange(self):
+        '''
+        Return (p, after): batch commands search from p up to after.
+        Node-only searches also pass node_only=True to find.batchSearch.
+        '''
+        c = self.c
+        if self.node_only or self.suboutline_only:
+            p = c.p.copy()
+            return p, p.nodeAfterTree()
+        else:
+            # Always search the entire outline.
+            return c.rootPosition(), None
+    #@+node:dev.20261018260000.11: *4* find.batchSearch
+    def batchSearch(self, p, after=None, clone_find=False, flatten=False, node_only=False):
+        '''
+        Search the headline and body of each vnode from p up to after once,
+        no matter how many times it is cloned. node_only: search only p.
+
+        Return a list of g.Bunches, one for each matching vnode in outline
+        order, or None if the pattern is not valid. Each bunch has gnx, p
+        (the first position of the vnode), head and body ivars. head and
+        body are lists of (start, end) spans of matches.
+
+        clone_find: skip @ignore and @nosearch trees, and unless flatten is
+        True, the trees of matching nodes.
+        '''
+        spans = self.batchMatcher()
+        if not spans:
+            return None
+        search_head, search_body = self.search_headline, self.search_body
+        result, seen = [], set()
+        p, first = p.copy(), p.copy()
+        while p and p != after:
+            if node_only and p != first:
+                break
+            v = p.v
+            if v in seen:
+                # All of v's descendants have been searched.
+                p.moveToNodeAfterTree()
+                continue
+            if clone_find and (p.is_at_ignore() or re.search(r'(^@|\n@)nosearch\b', v.b)):
+                p.moveToNodeAfterTree()
+                continue
+            seen.add(v)
+            head = spans(v.h) if search_head else []
+            body = spans(v.b) if search_body else []
+            if head or body:
+                result.append(g.Bunch(gnx=v.gnx, p=p.copy(), head=head, body=body))
+                if self.mark_finds and not clone_find:
+                    v.setMarked()
+                if clone_find and not flatten:
+                    # Don't look at the node or it's descendants.
+                    for p2 in p.self_and_subtree(copy=False):
+                        seen.add(p2.v)
+                    p.moveToNodeAfterTree()
+                    continue
+            p.moveToThreadNext()
+        return result
+    #@+node:ekr.20031218072017.3067: *3* LeoFind.Utils
     #@+node:ekr.20031218072017.3068: *4* find.change
     @cmd('replace')
     def change(self, event=None):
@@ -1469,18 +1554,17 @@ class LeoFind(object):
         saveData = self.save()
         self.initBatchCommands()
         count = 0
-        u.beforeChangeGroup(current, undoType)
         # Fix bug 338172: ReplaceAll will not replace newlines
         # indicated as \n in target string.
         self.change_text = self.replaceBackSlashes(self.change_text)
-        while 1:
-            pos1, pos2 = self.findNextMatch()
-            if pos1 is None:
-                break
-            count += 1
-            self.batchChange(pos1, pos2)
+        p, after = self.batchRange()
+        matches = self.batchSearch(p, after, node_only=self.node_only)
+        if matches:
+            u.beforeChangeGroup(current, undoType)
+            for match in matches:
+                count += self.batchChangeNode(match)
+            u.afterChangeGroup(c.p, undoType, reportFlag=True)
         p = c.p
-        u.afterChangeGroup(p, undoType, reportFlag=True)
         t2 = time.clock()
         g.es('changed %s instances in %4.2f sec.' % (count, (t2-t1)))
             # self.find_text, self.change_text,
@@ -1626,13 +1710,7 @@ class LeoFind(object):
         if self.pattern_match or self.findAllUniqueFlag:
             ok = self.precompilePattern()
             if not ok: return
-        if self.suboutline_only:
-            p = c.p
-            after = p.nodeAfterTree()
-        else:
-            # Always search the entire outline.
-            p = c.rootPosition()
-            after = None
+        p, after = self.batchRange()
         # Fix #292: Never collapse nodes during find-all commands.
         old_sparse_find = c.sparse_find
         try:
@@ -1653,16 +1731,11 @@ class LeoFind(object):
     def doCloneFindAll(self, after, data, flatten, p, undoType):
         '''Handle the clone-find-all command, from p to after.'''
         c, u = self.c, self.c.undoer
-        count, found = 0, None
-        # 535: positions are not hashable, but vnodes are.
-        clones, skip = [], set()
-        while p and p != after:
-            progress = p.copy()
-            if p.v in skip:
-                p.moveToThreadNext()
-            else:
-                count = self.doCloneFindAllHelper(clones, count, flatten, p, skip)
-            assert p != progress
+        found = None
+        matches = self.batchSearch(p, after,
+            clone_find=True, flatten=flatten, node_only=self.node_only) or []
+        clones = [match.p for match in matches]
+        count = len(clones)
         if clones:
             undoData = u.beforeInsertNode(c.p)
             found = self.createCloneFindAllNodes(clones, flatten)
@@ -1699,56 +1772,34 @@ class LeoFind(object):
         # Sort the clones in place, without undo.
         found.v.children.sort(key=lambda v: v.h.lower())
         return found
-    #@+node:ekr.20160422071747.1: *6* find.doCloneFindAllHelper
-    def doCloneFindAllHelper(self, clones, count, flatten, p, skip):
-        '''Handle the cff or cfa at node p.'''
-        if p.is_at_ignore() or re.search(r'(^@|\n@)nosearch\b', p.b):
-            p.moveToNodeAfterTree()
-            return count
-        found = self.findNextBatchMatch(p)
-        if found:
-            if not p in clones:
-                clones.append(p.copy())
-            count += 1
-        if flatten:
-            skip.add(p.v)
-            p.moveToThreadNext()
-        elif found:
-            # Don't look at the node or it's descendants.
-            for p2 in p.self_and_subtree(copy=False):
-                skip.add(p2.v)
-            p.moveToNodeAfterTree()
-        else:
-            p.moveToThreadNext()
-        return count
     #@+node:ekr.20160422073500.1: *5* find.doFindAll & helpers
     def doFindAll(self, after, data, p, undoType):
         '''Handle the find-all command from p to after.'''
-        c, u, w = self.c, self.c.undoer, self.s_ctrl
+        c, u = self.c, self.c.undoer
         both = self.search_body and self.search_headline
         count, found, result = 0, None, []
-        while 1:
-            pos, newpos = self.findNextMatch()
-            if not self.p: self.p = c.p
-            if pos is None: break
-            count += 1
-            s = w.getAllText()
-            i, j = g.getLine(s, pos)
-            line = s[i: j]
-            if self.findAllUniqueFlag:
-                m = self.match_obj
-                if m:
-                    self.unique_matches.add(m.group(0).strip())
-            elif both:
-                result.append('%s%s\n%s%s\n' % (
-                    '-' * 20, self.p.h,
-                    "head: " if self.in_headline else "body: ",
-                    line.rstrip()+'\n'))
-            elif self.p.isVisited():
-                result.append(line.rstrip()+'\n')
-            else:
-                result.append('%s%s\n%s' % ('-' * 20, self.p.h, line.rstrip()+'\n'))
-                self.p.setVisited()
+        for match in self.batchSearch(p, after, node_only=self.node_only) or []:
+            h = match.p.h
+            visited = False
+            for in_headline, spans in ((True, match.head), (False, match.body)):
+                s = h if in_headline else match.p.b
+                for pos, newpos in spans:
+                    count += 1
+                    if self.findAllUniqueFlag:
+                        self.unique_matches.add(s[pos:newpos].strip())
+                        continue
+                    i, j = g.getLine(s, pos)
+                    line = s[i: j]
+                    if both:
+                        result.append('%s%s\n%s%s\n' % (
+                            '-' * 20, h,
+                            "head: " if in_headline else "body: ",
+                            line.rstrip()+'\n'))
+                    elif visited:
+                        result.append(line.rstrip()+'\n')
+                    else:
+                        result.append('%s%s\n%s' % ('-' * 20, h, line.rstrip()+'\n'))
+                        visited = True
         if result or self.unique_matches:
             undoData = u.beforeInsertNode(c.p)
             if self.findAllUniqueFlag:
@@ -1786,19 +1837,6 @@ class LeoFind(object):
         result = sorted(self.unique_matches)
         found.b = '\n'.join(result)
         return found
-    #@+node:ekr.20160224141710.1: *6* find.findNextBatchMatch
-    def findNextBatchMatch(self, p):
-        '''Find the next batch match at p.'''
-        table = []
-        if self.search_headline:
-            table.append(p.h)
-        if self.search_body:
-            table.append(p.b)
-        for s in table:
-            self.reverse = False
-            pos, newpos = self.searchHelper(s, 0, len(s), self.find_text)
-            if pos != -1: return True
-        return False
     #@+node:ekr.20031218072017.3074: *4* find.findNext & helper
     def findNext(self, initFlag=True):
         '''Find the next instance of the pattern.'''
@@ -146,6 +146,8 @@ class WrapperAPI(object):
 
     def getAllText(self): return ''
 
+    def getChangeSpan(self): return None # Optional.
+
     def getInsertPoint(self): return 0
 
     def getSelectedText(self): return ''
@@ -622,13 +624,16 @@ class LeoBody(object):
         ch = g.toUnicode(ch)
         newText = w.getAllText() # Note: getAllText converts to unicode.
         newSel = w.getSelectionRange()
+        # The span of the text changed since the last call, or None.
+        span = w.getChangeSpan() if hasattr(w, 'getChangeSpan') else None
         if not oldText:
             oldText = p.b; changed = True
         else:
             changed = oldText != newText
         if not changed: return
         c.undoer.setUndoTypingParams(p, undoType,
-            oldText=oldText, newText=newText, oldSel=oldSel, newSel=newSel, oldYview=oldYview)
+            oldText=oldText, newText=newText, oldSel=oldSel, newSel=newSel,
+            oldYview=oldYview, span=span)
         p.v.setBodyString(newText)
         p.v.insertSpot = w.getInsertPoint()
         #@+<< recolor the body >>
@@ -2040,6 +2045,7 @@ class StringTextWrapper(object):
         '''Ctor for the StringTextWrapper class.'''
         self.c = c
         self.name = name
+        self.changeSpan = None # See getChangeSpan.
         self.ins = 0
         self.sel = 0, 0
         self.s = ''
@@ -2085,6 +2091,8 @@ class StringTextWrapper(object):
     #@+node:ekr.20140903172510.18592: *4* stw.appendText
     def appendText(self, s):
         '''StringTextWrapper.'''
+        n = len(self.s)
+        self.changeSpan = g.mergeChangeSpan(self.changeSpan, n, n, n + len(s))
         self.s = self.s + s
         self.ins = len(self.s)
         self.sel = self.ins, self.ins
@@ -2097,7 +2105,9 @@ class StringTextWrapper(object):
         # This allows subclasses to use this base class method.
         if i > j: i, j = j, i
         s = self.getAllText()
+        span = self.changeSpan
         self.setAllText(s[: i] + s[j:])
+        self.changeSpan = g.mergeChangeSpan(span, i, j, i)
         # Bug fix: 2011/11/13: Significant in external tests.
         self.setSelectionRange(i, i, insert=i)
     #@+node:ekr.20140903172510.18594: *4* stw.deleteTextSelection
@@ -2118,6 +2128,15 @@ class StringTextWrapper(object):
         '''StringTextWrapper.'''
         s = self.s
         return g.toUnicode(s)
+    #@+node:dev.20261018270000.4: *4* stw.getChangeSpan
+    def getChangeSpan(self):
+        '''
+        Return the span (i, j, k) of the text changed since the last call:
+        s[i:j] of the old text became s[i:k]. Return None if the change
+        is unknown, that is, if setAllText has been called.
+        '''
+        span, self.changeSpan = self.changeSpan, ()
+        return span or None
     #@+node:ekr.20140903172510.18584: *4* stw.getInsertPoint
     def getInsertPoint(self):
         '''StringTextWrapper.'''
@@ -2156,6 +2175,7 @@ class StringTextWrapper(object):
         '''StringTextWrapper.'''
         i = self.toPythonIndex(i)
         s1 = s
+        self.changeSpan = g.mergeChangeSpan(self.changeSpan, i, i, i + len(s1))
         self.s = self.s[: i] + s1 + self.s[i:]
         i += len(s1)
         self.ins = i
@@ -2167,6 +2187,7 @@ class StringTextWrapper(object):
     #@+node:ekr.20140903172510.18600: *4* stw.setAllText
     def setAllText(self, s):
         '''StringTextWrapper.'''
+        self.changeSpan = None
         self.s = s
         i = len(self.s)
         self.ins = i
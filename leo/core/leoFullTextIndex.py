@@ -0,0 +1,597 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018230000.1: * @file leoFullTextIndex.py
+'''
+Leo's full-text index: an sqlite FTS5 index of the headlines and bodies of
+any number of outlines, shared by all of the user's Leo sessions.
+
+When @bool full-text-index is True, Leo indexes outlines when they are
+opened, unless the index is current, reindexes changed nodes at idle time,
+and removes deleted nodes when outlines are saved. The full-text-search
+command searches all indexed outlines. The full-text-index-outline command
+reindexes the entire selected outline.
+
+Index outlines in bulk, using several processes::
+
+    python -m leo.core.leoFullTextIndex [--jobs n] [--force] file1.leo file2.leo ...
+
+If a file name starts with @, the file lists the files to index, one per
+line. If a file name contains '#', the part after the '#' is the UNL of a
+node listing the files to index. See leo/external/leoftsindex.py.
+
+Search the index::
+
+    python -m leo.core.leoFullTextIndex --search "words"
+'''
+#@+<< imports >>
+#@+node:dev.20261018230000.2: ** << imports >> (leoFullTextIndex)
+import hashlib
+import multiprocessing
+import optparse
+import os
+import sqlite3
+import sys
+import time
+import leo.core.leoGlobals as g
+#@-<< imports >>
+#@+others
+#@+node:dev.20261018230000.3: ** class FullTextIndex
+class FullTextIndex(object):
+    '''An sqlite FTS5 index of the nodes of any number of outlines.'''
+
+    schema = '''
+        create table if not exists outlines(
+            path text primary key, mtime real, size integer);
+        create table if not exists nodes(
+            id integer primary key, path text, gnx text, unl text, digest text,
+            unique(path, gnx));
+        create virtual table if not exists nodes_fts using fts5(h, b);
+    '''
+        # nodes_fts.rowid is nodes.id.
+    #@+others
+    #@+node:dev.20261018230000.4: *3* fti.ctor
+    def __init__(self, path=None):
+        '''Ctor for the FullTextIndex class.'''
+        if not path:
+            path = g.os_path_join(g.app.homeLeoDir, 'db', 'fts.sqlite')
+        self.path = path
+        self.conn = None
+        self.error = None
+            # The reason the database can not be opened.
+        self.pending = {}
+            # Keys are commanders, values are sets of vnodes to be reindexed.
+        self.moved = {}
+            # Keys are commanders, values are sets of vnodes whose children
+            # have changed. The children's subtrees may have new UNLs.
+        self.restructured = set()
+            # Commanders whose outlines may contain deleted nodes.
+    #@+node:dev.20261018230000.5: *3* fti.open & close
+    def open(self):
+        '''Open the database if necessary. Return the connection or None.'''
+        if self.conn or self.error:
+            return self.conn
+        try:
+            if self.path != ':memory:':
+                directory = g.os_path_dirname(self.path)
+                if not g.os_path_exists(directory):
+                    os.makedirs(directory)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('pragma journal_mode=wal')
+                conn.execute('pragma synchronous=normal')
+            conn.executescript(self.schema)
+            self.conn = conn
+        except (OSError, sqlite3.Error) as e:
+            # Most likely, sqlite does not support FTS5.
+            self.error = str(e)
+            g.es_print('can not open full-text index: %s' % self.error)
+        return self.conn
+
+    def close(self):
+        '''Write pending changes and close the database.'''
+        if self.conn:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+    #@+node:dev.20261018230000.6: *3* fti.drop_outline
+    def drop_outline(self, path):
+        '''Remove all nodes of the outline with the given path from the index.'''
+        conn = self.open()
+        if not conn:
+            return
+        path = self.normalize(path)
+        conn.execute('begin')
+        try:
+            conn.execute('delete from nodes_fts where rowid in '
+                '(select id from nodes where path=?)', (path,))
+            conn.execute('delete from nodes where path=?', (path,))
+            conn.execute('delete from outlines where path=?', (path,))
+            conn.execute('commit')
+        except sqlite3.Error:
+            conn.execute('rollback')
+            raise
+    #@+node:dev.20261018230000.7: *3* fti.flush & add_pending
+    def add_pending(self, c, nodes, moved=False):
+        '''
+        Remember to reindex the given vnodes of c.
+        If moved is True, the children of the vnodes have changed.
+        '''
+        d = self.moved if moved else self.pending
+        aSet = d.setdefault(c, set())
+        aSet.update(nodes)
+        if moved:
+            self.restructured.add(c)
+
+    def flush(self):
+        '''Reindex all pending vnodes and the subtrees whose UNLs have changed.'''
+        for c in list(set(self.pending) | set(self.moved)):
+            path = c.fileName()
+            rows = self.pending_rows(c, path)
+            if rows:
+                self.update_rows(path, rows)
+    #@+node:dev.20261018290000.4: *3* fti.pending_rows
+    def pending_rows(self, c, path):
+        '''
+        Forget the pending vnodes of c. Return a list of tuples
+        (gnx, unl, h, b) for them and for the children of moved vnodes,
+        including the subtrees of vnodes whose UNLs differ from the index.
+        '''
+        todo = list(self.pending.pop(c, []))
+        for v in self.moved.pop(c, []):
+            todo.extend(v.children)
+        if not path or not self.open():
+            return []
+        conn, path = self.conn, self.normalize(path)
+        rows, seen = [], set()
+        while todo:
+            v = todo.pop()
+            if v in seen or v.context != c or not v.parents:
+                continue
+            seen.add(v)
+            unl = vnode_unl(c, v)
+            rows.append((v.fileIndex, unl, v.h, v.b))
+            row = conn.execute('select unl from nodes where path=? and gnx=?',
+                (path, v.fileIndex)).fetchone()
+            if not row or row[0] != unl:
+                todo.extend(v.children)
+        return rows
+    #@+node:dev.20261018230000.8: *3* fti.index_outline
+    def index_outline(self, c, path=None):
+        '''
+        Bring the index of c's outline up to date.
+        Return (inserted, updated, deleted) or None.
+        '''
+        path = path or c.fileName()
+        if not path or not self.open():
+            return None
+        self.pending.pop(c, None)
+        self.moved.pop(c, None)
+        self.restructured.discard(c)
+        rows = list(outline_rows(c))
+        counts = self.update_rows(path, rows, complete=True)
+        self.set_outline_stat(path)
+        return counts
+    #@+node:dev.20261018290000.5: *3* fti.update_outline
+    def update_outline(self, c):
+        '''
+        Bring the index of c's outline up to date after c has been saved,
+        without computing the UNLs and digests of unchanged nodes.
+        Return (inserted, updated, deleted) or None.
+        '''
+        path = c.fileName()
+        if not path or not self.open():
+            return None
+        if not self.is_indexed(path):
+            return self.index_outline(c)
+        rows = self.pending_rows(c, path)
+        removed = []
+        if c in self.restructured:
+            self.restructured.discard(c)
+            gnxs = set(v.fileIndex for v in c.all_unique_nodes())
+            removed = [gnx for gnx, in self.conn.execute(
+                'select gnx from nodes where path=?', (self.normalize(path),))
+                if gnx not in gnxs]
+        counts = self.update_rows(path, rows, removed=removed)
+        self.set_outline_stat(path)
+        return counts
+    #@+node:dev.20261018230000.9: *3* fti.is_current & set_outline_stat
+    def file_stat(self, path):
+        '''Return (mtime, size) for the file at path, or None.'''
+        try:
+            st = os.stat(path)
+            return st.st_mtime, st.st_size
+        except OSError:
+            return None
+
+    def is_current(self, path):
+        '''True if the index has the nodes of the file at path as they are now.'''
+        conn = self.open()
+        if not conn:
+            return False
+        row = conn.execute('select mtime, size from outlines where path=?',
+            (self.normalize(path),)).fetchone()
+        return bool(row) and tuple(row) == self.file_stat(path)
+
+    def is_indexed(self, path):
+        '''True if the index contains the outline at path.'''
+        conn = self.open()
+        return bool(conn and conn.execute('select 1 from outlines where path=?',
+            (self.normalize(path),)).fetchone())
+
+    def set_outline_stat(self, path, stat=None):
+        '''Remember the modification time and size of the file at path.'''
+        stat = stat or self.file_stat(path)
+        if stat:
+            self.conn.execute('insert or replace into outlines values (?, ?, ?)',
+                (self.normalize(path), stat[0], stat[1]))
+    #@+node:dev.20261018230000.10: *3* fti.normalize & digest
+    def normalize(self, path):
+        '''Return the key for the given outline path.'''
+        return g.os_path_finalize(path) if path != ':memory:' else path
+
+    def digest(self, unl, h, b):
+        '''Return a digest of a node's data.'''
+        s = '\x00'.join([unl, h, b])
+        return hashlib.md5(g.toEncodedString(s, 'utf-8')).hexdigest()
+    #@+node:dev.20261018230000.11: *3* fti.search
+    def search(self, query, limit=20, path=None):
+        '''
+        Search the index. Return a list of g.Bunches with path, gnx, h, unl,
+        rank and snippet ivars, best matches first.
+
+        query uses the FTS5 query syntax. If that fails, search for the
+        words in the query.
+        '''
+        conn = self.open()
+        if not conn or not query.strip():
+            return []
+        self.flush()
+        sql = (
+            "select nodes.path, nodes.gnx, nodes.unl, nodes_fts.h, "
+            "bm25(nodes_fts, 5.0, 1.0) as score, "
+            "snippet(nodes_fts, 1, '[', ']', '...', 12) "
+            "from nodes_fts join nodes on nodes.id = nodes_fts.rowid "
+            "where nodes_fts match ?%s order by score limit ?" % (
+                ' and nodes.path=?' if path else ''))
+        quoted = ' '.join('"%s"' % z.replace('"', '""') for z in query.split())
+        for s in (query, quoted):
+            args = [s, self.normalize(path), limit] if path else [s, limit]
+            try:
+                rows = conn.execute(sql, args).fetchall()
+                break
+            except sqlite3.OperationalError:
+                # A syntax error in the query.
+                rows = []
+        return [g.Bunch(path=path2, gnx=gnx, unl=unl, h=h, rank=rank, snippet=snippet)
+            for path2, gnx, unl, h, rank, snippet in rows]
+    #@+node:dev.20261018230000.12: *3* fti.update_rows
+    def update_rows(self, path, rows, complete=False, removed=None):
+        '''
+        Update the index of the outline at path from rows, a list of tuples
+        (gnx, unl, h, b). If complete is True, rows describes all the nodes
+        of the outline, and other nodes of the outline are removed.
+        Otherwise, remove the nodes whose gnxs are in removed.
+
+        Return (inserted, updated, deleted).
+        '''
+        conn = self.open()
+        path = self.normalize(path)
+        inserted = updated = deleted = 0
+        conn.execute('begin')
+        try:
+            if complete:
+                old_d = dict((gnx, (id_, digest)) for id_, gnx, digest in conn.execute(
+                    'select id, gnx, digest from nodes where path=?', (path,)))
+            else:
+                old_d = {}
+                for gnx in list(removed or []) + [z[0] for z in rows]:
+                    row = conn.execute('select id, digest from nodes where path=? and gnx=?',
+                        (path, gnx)).fetchone()
+                    if row:
+                        old_d[gnx] = row
+            for gnx, unl, h, b in rows:
+                digest = self.digest(unl, h, b)
+                data = old_d.pop(gnx, None)
+                if not data:
+                    cursor = conn.execute(
+                        'insert into nodes(path, gnx, unl, digest) values (?, ?, ?, ?)',
+                        (path, gnx, unl, digest))
+                    conn.execute('insert into nodes_fts(rowid, h, b) values (?, ?, ?)',
+                        (cursor.lastrowid, h, b))
+                    inserted += 1
+                elif data[1] != digest:
+                    id_ = data[0]
+                    conn.execute('update nodes set unl=?, digest=? where id=?',
+                        (unl, digest, id_))
+                    conn.execute('update nodes_fts set h=?, b=? where rowid=?',
+                        (h, b, id_))
+                    updated += 1
+            # old_d now contains only the nodes to be deleted.
+            for id_, digest in old_d.values():
+                conn.execute('delete from nodes_fts where rowid=?', (id_,))
+                conn.execute('delete from nodes where id=?', (id_,))
+                deleted += 1
+            conn.execute('commit')
+        except sqlite3.Error:
+            conn.execute('rollback')
+            raise
+        return inserted, updated, deleted
+    #@-others
+#@+node:dev.20261018230000.13: ** Helpers
+#@+node:dev.20261018230000.14: *3* get_index & is_enabled
+def get_index():
+    '''
+    Return the singleton FullTextIndex, creating it if necessary.
+    Creating it starts reindexing changed nodes at idle time.
+    '''
+    if not g.app.fullTextIndex:
+        g.app.fullTextIndex = FullTextIndex()
+        itm = g.app.idleTimeManager
+        if itm:
+            itm.add_callback(onIdle)
+    return g.app.fullTextIndex
+
+def is_enabled(c):
+    '''True if c's outline should be indexed.'''
+    return bool(c and c.exists and c.fileName() and
+        c.config.getBool('full-text-index', default=False))
+#@+node:dev.20261018230000.15: *3* outline_rows & vnode_unl
+def outline_rows(c):
+    '''Yield (gnx, unl, h, b) for all nodes of c's outline.'''
+    for v in c.all_unique_nodes():
+        yield v.fileIndex, vnode_unl(c, v), v.h, v.b
+
+def vnode_unl(c, v):
+    '''
+    Return the UNL of v, without the file name or child indices.
+    For clones, use v's first parent.
+    '''
+    aList, root = [], c.hiddenRootNode
+    while v and v is not root:
+        aList.append(v.h.replace('-->', '--%3E'))
+        v = v.parents[0] if v.parents else None
+    return '-->'.join(reversed(aList))
+#@+node:dev.20261018230000.16: ** Hooks
+#@+node:dev.20261018230000.17: *3* init
+def init():
+    '''Maintain the full-text index of outlines that enable it.'''
+    g.registerHandler('open2', onOpen)
+    g.registerHandler('save1', onSave1)
+    g.registerHandler('save2', onSave)
+    g.registerHandler('contentModified', onContentModified)
+    g.registerHandler('childrenModified', onContentModified)
+#@+node:dev.20261018230000.18: *3* onContentModified
+def onContentModified(tag, keys):
+    '''
+    Remember to reindex changed nodes, or the children of nodes whose
+    children have changed.
+    '''
+    add_pending_nodes(keys.get('nodes'), moved=tag == 'childrenModified')
+
+def add_pending_nodes(nodes, moved=False):
+    '''Add the given vnodes to the pending vnodes of their commanders.'''
+    d = {}
+    for v in nodes or []:
+        d.setdefault(v.context, []).append(v)
+    for c, vnodes in d.items():
+        if is_enabled(c):
+            get_index().add_pending(c, vnodes, moved=moved)
+#@+node:dev.20261018230000.19: *3* onIdle
+def onIdle():
+    '''Reindex changed nodes at idle time.'''
+    if g.app.fullTextIndex and g.app.fullTextIndex.pending:
+        g.app.fullTextIndex.flush()
+#@+node:dev.20261018230000.20: *3* onOpen & onSave1 & onSave
+def onOpen(tag, keys):
+    '''Index an outline when it is opened, unless the index is current.'''
+    c = keys.get('c')
+    if is_enabled(c):
+        index = get_index()
+        if not index.is_current(c.fileName()):
+            index.index_outline(c)
+
+def onSave1(tag, keys):
+    '''
+    Remember the nodes that saving the outline may make clean,
+    and changes that the idle-time hooks have not yet reported.
+    '''
+    c = keys.get('c')
+    if is_enabled(c):
+        get_index().add_pending(c, c.dirtyVnodes)
+        add_pending_nodes([v for v in g.contentModifiedSet if v.context == c])
+        add_pending_nodes([v for v in g.childrenModifiedSet if v.context == c],
+            moved=True)
+
+def onSave(tag, keys):
+    '''Reindex the changed parts of an outline after it has been saved.'''
+    c = keys.get('c')
+    if is_enabled(c):
+        get_index().update_outline(c)
+#@+node:dev.20261018230000.21: ** Commands
+#@+node:dev.20261018230000.22: *3* full-text-index-outline
+@g.command('full-text-index-outline')
+def full_text_index_outline(event):
+    '''Add the selected outline to the full-text index, or bring it up to date.'''
+    c = event.get('c')
+    if not c or not c.fileName():
+        g.es('full-text-index-outline: the outline has no file name')
+        return
+    t1 = time.time()
+    counts = get_index().index_outline(c)
+    if counts:
+        g.es('indexed %s: %s inserted, %s updated, %s deleted in %4.2f sec.' % (
+            c.shortFileName(), counts[0], counts[1], counts[2], time.time() - t1))
+#@+node:dev.20261018230000.23: *3* full-text-search
+@g.command('full-text-search')
+def full_text_search(event):
+    '''Search all outlines in the full-text index.'''
+    c = event.get('c')
+    if c:
+        k = c.k
+        k.setLabelBlue('full-text-search: ')
+        k.get1Arg(event, handler=full_text_search1)
+
+def full_text_search1(event):
+    c = event.get('c')
+    k = c.k
+    query = g.toUnicode(k.arg)
+    k.clearState()
+    k.resetLabel()
+    k.showStateAndMode()
+    t1 = time.time()
+    hits = get_index().search(query)
+    g.es('%s hits for %s in %4.3f sec.' % (len(hits), query, time.time() - t1))
+    for hit in hits:
+        g.es('%s#%s' % (hit.path, hit.unl))
+        g.es('    %s' % hit.snippet.replace('\n', ' '))
+#@+node:dev.20261018230000.24: ** Bulk indexer
+# Not used within Leo.
+#@+node:dev.20261018230000.25: *3* main
+def main(args=None):
+    '''Index or search outlines. See the module's docstring.'''
+    options, files = scan_options(args)
+    index = FullTextIndex(options.db)
+    if not index.open():
+        return 1
+    if options.search:
+        for hit in index.search(options.search, limit=options.limit):
+            print('%8.2f %s#%s' % (hit.rank, hit.path, hit.unl))
+            print('         %s' % hit.snippet.replace('\n', ' '))
+    if files:
+        index_files(index, files, options.jobs, options.force)
+    index.close()
+    return 0
+#@+node:dev.20261018230000.26: *3* scan_options
+def scan_options(args):
+    '''Handle all options. Return (options, files).'''
+    # This automatically implements the --help option.
+    usage = 'usage: python -m leo.core.leoFullTextIndex [options] file1, file2, ...'
+    parser = optparse.OptionParser(usage=usage)
+    add = parser.add_option
+    add('--db', dest='db', default=None,
+        help='path to the index (default: ~/.leo/db/fts.sqlite)')
+    add('-f', '--force', action='store_true', dest='force',
+        help='reindex outlines that have not changed')
+    add('-j', '--jobs', type='int', dest='jobs', default=0,
+        help='number of processes reading outlines (default: number of cpus)')
+    add('-l', '--limit', type='int', dest='limit', default=20,
+        help='maximum number of search results')
+    add('-s', '--search', dest='search', default=None,
+        help='search the index')
+    return parser.parse_args(args)
+#@+node:dev.20261018230000.27: *3* index_files
+def index_files(index, files, jobs=0, force=False):
+    '''
+    Add the outlines given by files to the index.
+
+    Worker processes read the outlines. This process updates the index.
+    '''
+    t1 = time.time()
+    jobs = jobs or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(jobs, init_worker) if jobs > 1 else None
+        # Create the processes before this process creates a bridge.
+    paths = []
+    for path in expand_files(files):
+        path = g.os_path_finalize(path)
+        if path in paths:
+            continue
+        if force or not index.is_current(path):
+            paths.append(path)
+        else:
+            print('unchanged: %s' % path)
+    if pool:
+        results = pool.imap_unordered(read_outline, paths)
+    else:
+        init_worker()
+        results = (read_outline(z) for z in paths)
+    n = 0
+    for path, stat, rows in results:
+        if rows is None:
+            print('can not read: %s' % path)
+            continue
+        counts = index.update_rows(path, rows, complete=True)
+        index.set_outline_stat(path, stat)
+        n += len(rows)
+        print('indexed: %s: %s nodes, %s inserted, %s updated, %s deleted' % (
+            path, len(rows), counts[0], counts[1], counts[2]))
+    if pool:
+        pool.close()
+        pool.join()
+    print('indexed %s nodes in %s outlines in %4.2f sec.' % (
+        n, len(paths), time.time() - t1))
+#@+node:dev.20261018230000.28: *3* expand_files
+def expand_files(files):
+    '''
+    Yield the paths of the outlines described by files.
+
+    - @path: the file at path lists outlines, one per line.
+    - path#unl: the node at unl in the outline at path lists outlines.
+      If the node has children, the first line of each child's body is
+      an outline. Otherwise each line of the node's body is an outline.
+    - Anything else is the path to an outline.
+    '''
+    todo = list(files)
+    while todo:
+        item = todo.pop(0).strip()
+        if not item:
+            continue
+        if item.startswith('@'):
+            with open(item[1:]) as f:
+                todo.extend(f.read().strip().split('\n'))
+        elif '#' in item:
+            fn, unl = item.split('#', 1)
+            c = get_bridge().openLeoFile(fn)
+            found, depth, p = g.recursiveUNLSearch(unl.split('-->'), c)
+            if not found:
+                print('can not find: %s' % item)
+                continue
+            if p.hasChildren():
+                aList = [z.b.strip().split('\n', 1)[0] for z in p.children()]
+            else:
+                aList = p.b.strip().split('\n')
+            for s in aList:
+                # Names may still contain '#'.
+                s = s.split('#', 1)[0].strip()
+                if s:
+                    yield s
+        else:
+            yield item
+#@+node:dev.20261018230000.29: *3* get_bridge & init_worker & read_outline
+bridge = None
+
+def get_bridge():
+    '''Return a leoBridge controller, creating it if necessary.'''
+    global bridge
+    if not bridge:
+        import leo.core.leoBridge as leoBridge
+        bridge = leoBridge.controller(gui='nullGui',
+            loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    return bridge
+
+def init_worker():
+    '''Init a process that reads outlines.'''
+    get_bridge()
+
+def read_outline(path):
+    '''
+    Return (path, stat, rows) for the outline at path, where rows contains
+    (gnx, unl, h, b) for each node, or None if the outline can't be read.
+    '''
+    stat = None
+    try:
+        st = os.stat(path)
+        stat = st.st_mtime, st.st_size
+        c = get_bridge().openLeoFile(path)
+        rows = list(outline_rows(c)) if c else None
+        if c:
+            c.changed = False
+            g.app.closeLeoWindow(c.frame, finish_quit=False)
+    except Exception:
+        g.es_exception()
+        rows = None
+    return path, stat, rows
+#@-others
+if __name__ == '__main__':
+    sys.exit(main())
+#@@language python
+#@@tabwidth -4
+#@-leo
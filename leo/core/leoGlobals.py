@@ -2930,13 +2930,39 @@ def get_directives_dict(p, root=None):
     following the first occurrence of each recognized directive
     """
     if root: root_node = root[0]
-    # c = p and p.v and p.v.context
-    d = {}
     # Do this every time so plugins can add directives.
-    pat = g.compute_directives_re()
-    directives_pat = re.compile(pat, re.MULTILINE)
+    directives_pat = g.get_directives_re()
+    h, b = p.h, p.b
+    # c.directivesCache: keys are gnx's, values are tuples (stamp, directives_pat, d, is_root).
+    # An entry is valid only if p's headline and body still have the same stamp.
+    # Stamps don't keep superseded strings alive. Strings cache their hashes.
+    stamp = len(h), hash(h), len(b), hash(b)
+    c = p.v.context
+    cache = getattr(c, 'directivesCache', None)
+    data = cache.get(p.v.fileIndex) if cache is not None else None
+    if data and data[0] == stamp and data[1] is directives_pat:
+        d, is_root = dict(data[2]), data[3]
+    else:
+        d = g.scan_directives_dict(h, b, directives_pat)
+        is_root = bool(g_noweb_root.search(b))
+        if cache is not None:
+            cache[p.v.fileIndex] = stamp, directives_pat, dict(d), is_root
+    if root and is_root:
+        if root_node:
+            d["root"] = 0 # value not immportant
+        else:
+            g.es('%s= may only occur in a topmost node (i.e., without a parent)' % (
+                g.angleBrackets('*')))
+    return d
+#@+node:dev.20261018180000.1: *4* g.scan_directives_dict
+def scan_directives_dict(h, b, directives_pat):
+    '''
+    Return the dict of directives in headline h and body b.
+    Only g.get_directives_dict uses this function.
+    '''
+    d = {}
     # The headline has higher precedence because it is more visible.
-    for kind, s in (('head', p.h), ('body', p.b)):
+    for kind, s in (('head', h), ('body', b)):
         anIter = directives_pat.finditer(s)
         for m in anIter:
             word = m.group(1).strip()
@@ -2954,27 +2980,32 @@ def get_directives_dict(p, root=None):
             d[word] = val
             # New in Leo 5.7.1: @path is allowed in body text.
             # This is very useful when doing recursive imports.
-    if root:
-        anIter = g_noweb_root.finditer(p.b)
-        for m in anIter:
-            if root_node:
-                d["root"] = 0 # value not immportant
-            else:
-                g.es('%s= may only occur in a topmost node (i.e., without a parent)' % (
-                    g.angleBrackets('*')))
-            break
     return d
 #@+node:ekr.20090214075058.10: *4* g.compute_directives_re
 def compute_directives_re():
     '''
     Return an re pattern which word matches all Leo directives.
-    Only g.get_directives_dict uses this pattern.
+    Only g.get_directives_re uses this pattern.
     '''
     global globalDirectiveList
     # EKR: 2016/03/30: Use a pattern that guarantees word matches.
     aList = [r'\b%s\b' % (z) for z in globalDirectiveList
                 if z != 'others']
     return "^@(%s)" % "|".join(aList)
+#@+node:dev.20261018180000.2: *4* g.get_directives_re
+g_directives_re_cache = [None, None]
+    # The contents of globalDirectiveList and the compiled pattern.
+
+def get_directives_re():
+    '''
+    Return the compiled pattern that matches all Leo directives,
+    recompiling it only when plugins have changed globalDirectiveList.
+    '''
+    key = tuple(globalDirectiveList)
+    if g_directives_re_cache[0] != key:
+        pat = re.compile(g.compute_directives_re(), re.MULTILINE)
+        g_directives_re_cache[:] = [key, pat]
+    return g_directives_re_cache[1]
 #@+node:ekr.20080827175609.1: *3* g.get_directives_dict_list (must be fast)
 def get_directives_dict_list(p):
     """Scans p and all its ancestors for directives.
@@ -3467,11 +3498,11 @@ def fullPath(c, p, simulate=False):
     '''
     # Search p and p's parents.
     for p in p.self_and_parents(copy=False):
-        aList = g.get_directives_dict_list(p)
-        path = c.scanAtPathDirectives(aList)
         fn = p.h if simulate else p.anyAtFileNodeName()
             # Use p.h for unit tests.
         if fn:
+            aList = g.get_directives_dict_list(p)
+            path = c.scanAtPathDirectives(aList)
             # Fix #102: call commander method, not the global function.
             return c.os_path_finalize_join(path, fn)
     return ''
@@ -4507,6 +4538,8 @@ def is_nl(s, i):
 def is_special(s, directive):
     '''Return True if the body text contains the @ directive.'''
     assert(directive and directive[0] == '@')
+    if directive not in s:
+        return False, -1 # Much faster than the regex search below.
     lws = directive in ("@others", "@all")
         # Most directives must start the line.
     pattern = r'^\s*(%s\b)' if lws else r'^(%s\b)'
@@ -5250,6 +5283,34 @@ def importFromPath(moduleName, path, verbose=False):
     return module
 #@+node:ekr.20140711071454.17650: ** g.Indices, Strings, Unicode & Whitespace
 #@+node:ekr.20140711071454.17647: *3* g.Indices
+#@+node:dev.20261018270000.1: *4* g.computeChangeSpan
+def computeChangeSpan(s1, s2):
+    '''
+    Return (i, j, k) such that replacing s1[i:j] by s2[i:k] changes s1 into
+    s2. The unchanged prefix and suffix are as long as possible.
+    '''
+    n1, n2 = len(s1), len(s2)
+    n = min(n1, n2)
+    # Compare slices, not characters: slices compare at C speed.
+    i, block, grow = 0, 256, True
+    while block:
+        if i + block <= n and s1[i: i + block] == s2[i: i + block]:
+            i += block
+            if grow: block *= 2
+        else:
+            grow = False
+            block //= 2
+    # Don't let the suffix overlap the prefix.
+    m = n - i
+    t, block, grow = 0, 256, True
+    while block:
+        if t + block <= m and s1[n1 - t - block: n1 - t] == s2[n2 - t - block: n2 - t]:
+            t += block
+            if grow: block *= 2
+        else:
+            grow = False
+            block //= 2
+    return i, n1 - t, n2 - t
 #@+node:ekr.20050314140957: *4* g.convertPythonIndexToRowCol
 def convertPythonIndexToRowCol(s, i):
     '''Convert index i into string s into zero-based row/col indices.'''
@@ -5306,6 +5367,25 @@ def getLine(s, i):
     if k == -1: k = len(s)
     else: k = k + 1
     return j, k
+#@+node:dev.20261018270000.2: *4* g.mergeChangeSpan
+def mergeChangeSpan(span, i, j, k):
+    '''
+    Return the span of the text changed by two successive changes.
+
+    A span (i, j, k) means that s[i:j] of the old text became s[i:k] of the
+    new text. span describes the first change. It may be () if there is no
+    first change, or None if the first change is unknown. The second change
+    is the span (i, j, k) relative to the text resulting from the first.
+
+    Return None if span is None.
+    '''
+    if span is None:
+        return None
+    if not span:
+        return i, j, k
+    i1, j1, k1 = span
+    end = max(k1, j)
+    return min(i1, i), end - (k1 - j1), end + (k - j)
 #@+node:ekr.20111114151846.9847: *4* g.toPythonIndex
 def toPythonIndex(s, index):
     '''Convert index to a Python int.
@@ -561,6 +561,14 @@ class Position(object):
 
     # Compatibility with old code...
     subtree_iter = subtree
+    #@+node:dev.20261018140000.6: *4* p.walk_self_and_subtree
+    def walk_self_and_subtree(self):
+        '''
+        Return a VNodeWalker yielding (v, depth, parent_v, childIndex) for p
+        and all nodes in p's subtree, without creating positions.
+        '''
+        p = self
+        return VNodeWalker(p.v.context, p)
     #@+node:ekr.20091002083910.6105: *4* p.unique_nodes
     def unique_nodes(self):
         '''Yield p.v and all unique vnodes in p's subtree.'''
@@ -1062,6 +1070,7 @@ class Position(object):
         if parent_v.children[p._childIndex] == v:
             parent_v.children[p._childIndex] = v2
             v2.parents.append(parent_v)
+            parent_v.childrenModified()
             # p.v no longer truly exists.
             # p.v = p2.v
         else:
@@ -1313,6 +1322,8 @@ class Position(object):
                             v2 for v2 in parent.v.children if not v2 == child_v]
                         if parent.v in child_v.parents:
                             child_v.parents.remove(parent.v)
+                        parent.v.childrenModified()
+                        child_v.setDbChanged()
                         # Try not to hang.
                         p.moveToParent()
                         break
@@ -1553,6 +1564,8 @@ class Position(object):
         for child in children:
             child.parents.remove(p.v)
             child.parents.append(parent_v)
+        p.v.childrenModified()
+        parent_v.childrenModified()
     #@+node:ekr.20040303175026.13: *4* p.validateOutlineWithParent
     # This routine checks the structure of the receiver's tree.
 
@@ -1922,6 +1935,78 @@ class PosList(list):
     #@-others
 
 Poslist = PosList # compatibility.
+#@+node:dev.20261018140000.1: ** class VNodeWalker
+class VNodeWalker(object):
+    '''
+    An iterator yielding (v, depth, parent_v, childIndex) tuples in outline
+    order. depth is the level of v, as in p.level().
+
+    Unlike the position generators, the walker creates no positions. It
+    keeps an explicit stack of (parent_v, nextIndex) lists, one per level.
+
+    Within a loop over the walker:
+    - walker.skip() prevents the walker from visiting the descendants of
+      the last-yielded node.
+    - walker.position() returns a new position for the last-yielded node.
+    '''
+    #@+others
+    #@+node:dev.20261018140000.2: *3* walker.ctor
+    def __init__(self, c, p=None):
+        '''
+        Ctor for the VNodeWalker class.
+        Walk p and its subtree if p is given, otherwise the entire outline.
+        '''
+        self.c = c
+        self.p = p and p.copy()
+        self.skipFlag = False
+        self.stack = []
+            # A list of [parent_v, nextIndex] lists.
+        self.base = []
+            # The position stack above self.stack[0][0].
+    #@+node:dev.20261018140000.3: *3* walker.__iter__
+    def __iter__(self):
+        p = self.p
+        if p:
+            self.base = p.stack[:]
+            parent_v = p.stack[-1][0] if p.stack else self.c.hiddenRootNode
+            stack = self.stack = [[parent_v, p._childIndex + 1]]
+            bottom = 1
+            self.skipFlag = False
+            yield p.v, p.level(), parent_v, p._childIndex
+            if p.v.children and not self.skipFlag:
+                stack.append([p.v, 0])
+        else:
+            self.base = []
+            stack = self.stack = [[self.c.hiddenRootNode, 0]]
+            bottom = 0
+        depth0 = len(self.base) - 1
+        while len(stack) > bottom:
+            top = stack[-1]
+            parent_v, i = top
+            children = parent_v.children
+            if i < len(children):
+                top[1] = i + 1
+                v = children[i]
+                self.skipFlag = False
+                yield v, depth0 + len(stack), parent_v, i
+                if v.children and not self.skipFlag:
+                    stack.append([v, 0])
+            else:
+                stack.pop()
+    #@+node:dev.20261018140000.4: *3* walker.position
+    def position(self):
+        '''Return a new position for the last node yielded by the walker.'''
+        stack = self.stack
+        p_stack = self.base[:]
+        for i in range(len(stack) - 1):
+            p_stack.append((stack[i + 1][0], stack[i][1] - 1))
+        parent_v, i = stack[-1]
+        return Position(parent_v.children[i - 1], i - 1, p_stack)
+    #@+node:dev.20261018140000.5: *3* walker.skip
+    def skip(self):
+        '''Do not visit the descendants of the last node yielded by the walker.'''
+        self.skipFlag = True
+    #@-others
 #@+node:ekr.20031218072017.3341: ** class VNode
 #@@nobeautify
 
@@ -1944,6 +2029,36 @@ class VNodeBase(object):
     writeBit = 0x400
     orphanBit = 0x800 # True: error in @<file> tree prevented it from being written.
     #@-<< VNode constants >>
+    #@+<< VNode slots >>
+    #@+node:dev.20261018130000.1: *3* << VNode slots >>
+    # Large outlines contain hundreds of thousands of vnodes, so the data
+    # that every VNode needs lives in slots rather than in a per-node dict.
+    #
+    # The __dict__ slot retains the ability to set arbitrary ivars. Python
+    # allocates the dict only when the first such ivar is set. This happens
+    # only for nodes with unknownAttributes (v.u), tempAttributes, plugin
+    # data or the per-node UI state below.
+    if not (use_zodb and ZODB):
+        # ZODB.Persistence.Persistent does not support slotted subclasses.
+        __slots__ = (
+            '_headString', '_bodyString',
+            'children', 'parents',
+            'fileIndex', 'iconVal', 'statusBits',
+            'context',
+            '__dict__', '__weakref__',
+        )
+
+    # Per-node UI state, set only for nodes that have been selected.
+    # These class attributes are the defaults.
+    insertSpot = None
+        # Location of previous insert point.
+    scrollBarSpot = None
+        # Previous value of scrollbar position.
+    selectionLength = 0
+        # The length of the selected body text.
+    selectionStart = 0
+        # The start of the selected body text.
+    #@-<< VNode slots >>
     #@+others
     #@+node:ekr.20031218072017.3342: *3* v.Birth & death
     #@+node:ekr.20031218072017.3344: *4* v.__init
@@ -1972,16 +2087,9 @@ class VNodeBase(object):
         self.context = context # The context containing context.hiddenRootNode.
             # Required so we can compute top-level siblings.
             # It is named .context rather than .c to emphasize its limited usage.
-        self.expandedPositions = []
-            # Positions that should be expanded.
-        self.insertSpot = None
-            # Location of previous insert point.
-        self.scrollBarSpot = None
-            # Previous value of scrollbar position.
-        self.selectionLength = 0
-            # The length of the selected body text.
-        self.selectionStart = 0
-            # The start of the selected body text.
+        # The UI state (v.expandedPositions, v.insertSpot, v.scrollBarSpot,
+        # v.selectionLength and v.selectionStart) is allocated lazily.
+        # See the VNode slots section.
         # To make VNode's independent of Leo's core,
         # wrap all calls to the VNode ctor::
         #
@@ -2301,6 +2409,10 @@ class VNodeBase(object):
         '''Clear the vnode dirty bit.'''
         v = self
         v.statusBits &= ~v.dirtyBit
+        v.setDbChanged()
+        dirtyVnodes = getattr(v.context, 'dirtyVnodes', None)
+        if dirtyVnodes:
+            dirtyVnodes.discard(v)
     #@+node:ekr.20090830051712.6153: *5* v.findAllPotentiallyDirtyNodes
     def findAllPotentiallyDirtyNodes(self):
 
@@ -2340,6 +2452,20 @@ class VNodeBase(object):
     def setDirty(self):
         '''Set the vnode dirty bit.'''
         self.statusBits |= self.dirtyBit
+        self.setDbChanged()
+        # Remember the node so that at.writeAll need not scan the outline.
+        dirtyVnodes = getattr(self.context, 'dirtyVnodes', None)
+        if dirtyVnodes is not None:
+            dirtyVnodes.add(self)
+    #@+node:dev.20261018290000.8: *5* v.setDbChanged
+    def setDbChanged(self):
+        '''
+        Remember that the row of the vnode in a .db file may have changed,
+        so that fc.exportToSqlite need not scan the outline.
+        '''
+        changed = getattr(self.context, 'dbChangedVnodes', None)
+        if changed is not None:
+            changed.add(self)
     #@+node:ekr.20031218072017.3386: *4*  v.Status bits
     #@+node:ekr.20031218072017.3389: *5* v.clearClonedBit
     def clearClonedBit(self):
@@ -2347,6 +2473,7 @@ class VNodeBase(object):
     #@+node:ekr.20031218072017.3391: *5* v.clearMarked
     def clearMarked(self):
         self.statusBits &= ~self.markedBit
+        self.setDbChanged()
     #@+node:ekr.20080429053831.8: *5* v.clearWriteBit
     def clearWriteBit(self):
         self.statusBits &= ~self.writeBit
@@ -2361,14 +2488,17 @@ class VNodeBase(object):
     def contract(self):
         '''Contract the node.'''
         self.statusBits &= ~self.expandedBit
+        self.setDbChanged()
 
     def expand(self):
         '''Expand the node.'''
         self.statusBits |= self.expandedBit
+        self.setDbChanged()
 
     def initExpandedBit(self):
         '''Init self.statusBits.'''
         self.statusBits |= self.expandedBit
+        self.setDbChanged()
 
     def isExpanded(self):
         '''Return True if the VNode expansion bit is set.'''
@@ -2388,9 +2518,11 @@ class VNodeBase(object):
     #@+node:ekr.20031218072017.3398: *5* v.setMarked & initMarkedBit
     def setMarked(self):
         self.statusBits |= self.markedBit
+        self.setDbChanged()
 
     def initMarkedBit(self):
         self.statusBits |= self.markedBit
+        self.setDbChanged()
     #@+node:ekr.20031218072017.3399: *5* v.setOrphan
     def setOrphan(self):
         '''Set the vnode's orphan bit.'''
@@ -2411,6 +2543,7 @@ class VNodeBase(object):
     #@+node:ville.20120502221057.7499: *4* v.childrenModified
     def childrenModified(self):
         g.childrenModifiedSet.add(self)
+        self.setDbChanged()
     #@+node:ekr.20031218072017.3385: *4* v.computeIcon & setIcon
     def computeIcon(self):
         val = 0; v = self
@@ -2480,6 +2613,7 @@ class VNodeBase(object):
                     self.unicode_warning_given = True
                     g.internalError(s)
                     g.es_exception()
+        v.setDbChanged()
         sig.emit(self.context, 'body_changed', self)
 
     def setHeadString(self, s):
@@ -2497,6 +2631,7 @@ class VNodeBase(object):
                     self.unicode_warning_given = True
                     g.internalError(s)
                     g.es_exception()
+        v.setDbChanged()
 
     initBodyString = setBodyString
     initHeadString = setHeadString
@@ -2540,6 +2675,7 @@ class VNodeBase(object):
         # Update parent_v.children & v.parents.
         parent_v.children.insert(childIndex, v)
         v.parents.append(parent_v)
+        v.setDbChanged()
         # Set zodb changed flags.
         v._p_changed = 1
         parent_v._p_changed = 1
@@ -2553,6 +2689,7 @@ class VNodeBase(object):
         # Update parent_v.children & v.parents.
         parent_v.children.insert(childIndex, v)
         v.parents.append(parent_v)
+        v.setDbChanged()
         # Set zodb changed flags.
         v._p_changed = 1
         parent_v._p_changed = 1
@@ -2578,6 +2715,7 @@ class VNodeBase(object):
         parent_v.childrenModified()
         assert parent_v.children[childIndex] == v
         del parent_v.children[childIndex]
+        v.setDbChanged()
         if parent_v in v.parents:
             try:
                 v.parents.remove(parent_v)
@@ -2655,10 +2793,12 @@ class VNodeBase(object):
         # It is does not set v.unknownAttributes, which can cause problems.
         if not hasattr(v, 'unknownAttributes'):
             v.unknownAttributes = {}
+        v.setDbChanged() # The caller may change the dict.
         return v.unknownAttributes
 
     def __set_u(self, val):
         v = self
+        v.setDbChanged()
         if val is None:
             if hasattr(v, 'unknownAttributes'):
                 delattr(v, 'unknownAttributes')
@@ -2678,6 +2818,23 @@ class VNodeBase(object):
     gnx = property(
         __get_gnx, # __set_gnx,
         doc="VNode gnx property")
+    #@+node:dev.20261018130000.2: *4* v.expandedPositions Property
+    def __get_expandedPositions(self):
+        '''Return the list of positions that should be expanded, creating it if needed.'''
+        v = self
+        d = v.__dict__
+        aList = d.get('_expandedPositions')
+        if aList is None:
+            aList = d['_expandedPositions'] = []
+        return aList
+
+    def __set_expandedPositions(self, val):
+        v = self
+        v.__dict__['_expandedPositions'] = val
+
+    expandedPositions = property(
+        __get_expandedPositions, __set_expandedPositions,
+        doc="VNode expandedPositions property")
     #@-others
 
 if use_zodb and ZODB:
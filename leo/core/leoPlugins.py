@@ -3,6 +3,7 @@
 '''Classes relating to Leo's plugin architecture.'''
 import leo.core.leoGlobals as g
 import sys
+import time
 # Define modules that may be enabled by default
 # but that mignt not load because imports may fail.
 optional_modules = [
@@ -254,6 +255,13 @@ class LeoPluginsController(object):
     def __init__(self):
 
         self.handlers = {}
+        self.dispatchDict = {}
+            # Keys are tags, values are tuples of (fn, moduleName, isAll).
+            # Computed from self.handlers by plugins.getDispatchTable.
+        self.hookTimes = {}
+            # Keys are (moduleName, tag), values are [calls, total, max] times.
+        self.timeHooks = False
+            # True: update self.hookTimes on every call to a hook handler.
         self.loadedModulesFilesDict = {}
             # Keys are regularized module names, values are the names of .leo files
             # containing @enabled-plugins nodes that caused the plugin to be loaded
@@ -277,6 +285,9 @@ class LeoPluginsController(object):
         self.warn_on_failure = g.app.config.getBool(
             setting='warn_when_plugins_fail_to_load',
             default=True)
+        self.timeHooks = g.app.config.getBool(
+            setting='time-plugin-hooks',
+            default=False)
     #@+node:ekr.20100909065501.5952: *3* plugins.Event handlers
     #@+node:ekr.20161029060545.1: *4* plugins.on_idle
     def on_idle(self):
@@ -287,7 +298,7 @@ class LeoPluginsController(object):
                 # Do NOT compute c.currentPosition.
                 # This would be a MAJOR leak of positions.
                 g.doHook("idle", c=c)
-    #@+node:ekr.20100908125007.6017: *4* plugins.doHandlersForTag & helper
+    #@+node:ekr.20100908125007.6017: *4* plugins.doHandlersForTag & helpers
     def doHandlersForTag(self, tag, keywords):
         """
         Execute all handlers for a given tag, in alphabetical order.
@@ -295,40 +306,68 @@ class LeoPluginsController(object):
         """
         if g.app.killed:
             return None
+        table = self.dispatchDict.get(tag)
+        if table is None:
+            table = self.getDispatchTable(tag)
+        if not table:
+            return None
+        # Make sure the commanders exist and have frames.
+        c, new_c = keywords.get('c'), keywords.get('new_c')
+        for c2 in (c, new_c):
+            if c2 and (not c2.exists or not hasattr(c2, 'frame')):
+                return None
+        stack = self.loadingModuleNameStack
         #
         # Execute hooks in some random order.
         # Return if one of them returns a non-None result.
-        for bunch in self.handlers.get(tag, []):
-            val = self.callTagHandler(bunch, tag, keywords)
-            if val is not None:
-                return val
-        if 'all' in self.handlers:
-            bunches = self.handlers.get('all')
-            for bunch in bunches:
-                self.callTagHandler(bunch, tag, keywords)
+        for fn, moduleName, isAll in table:
+            # A previous handler may have closed a commander.
+            if (c and not c.exists) or (new_c and not new_c.exists):
+                return None
+            # Calls to registerHandler from inside the handler belong to moduleName.
+            stack.append(moduleName)
+            try:
+                if self.timeHooks:
+                    result = self.timeTagHandler(fn, moduleName, tag, keywords)
+                else:
+                    result = fn(tag, keywords)
+            except Exception:
+                g.es("hook failed: %s, %s, %s" % (tag, fn, moduleName))
+                g.es_exception()
+                result = None
+            stack.pop()
+            if result is not None and not isAll:
+                return result
         return None
-    #@+node:ekr.20100908125007.6016: *5* plugins.callTagHandler
-    def callTagHandler(self, bunch, tag, keywords):
-        '''Call the event handler.'''
-        handler, moduleName = bunch.fn, bunch.moduleName
-        # Make sure the new commander exists.
-        for key in ('c', 'new_c'):
-            c = keywords.get(key)
-            if c:
-                # Make sure c exists and has a frame.
-                if not c.exists or not hasattr(c, 'frame'):
-                    # g.pr('skipping tag %s: c does not exist or does not have a frame.' % tag)
-                    return None
-        # Calls to registerHandler from inside the handler belong to moduleName.
-        self.loadingModuleNameStack.append(moduleName)
+    #@+node:dev.20261018330000.1: *5* plugins.getDispatchTable
+    def getDispatchTable(self, tag):
+        '''
+        Return the tuple of (fn, moduleName, isAll) for all handlers of tag,
+        including the handlers for 'all', and cache it in self.dispatchDict.
+        '''
+        table = [(bunch.fn, bunch.moduleName, False)
+            for bunch in self.handlers.get(tag, [])]
+        table.extend([(bunch.fn, bunch.moduleName, True)
+            for bunch in self.handlers.get('all', [])])
+        table = tuple(table)
+        self.dispatchDict[tag] = table
+        return table
+    #@+node:dev.20261018330000.2: *5* plugins.timeTagHandler
+    def timeTagHandler(self, fn, moduleName, tag, keywords):
+        '''Call the event handler, updating self.hookTimes.'''
+        t1 = time.time()
         try:
-            result = handler(tag, keywords)
-        except Exception:
-            g.es("hook failed: %s, %s, %s" % (tag, handler, moduleName))
-            g.es_exception()
-            result = None
-        self.loadingModuleNameStack.pop()
-        return result
+            return fn(tag, keywords)
+        finally:
+            t = time.time() - t1
+            key = moduleName, tag
+            data = self.hookTimes.get(key)
+            if data:
+                data[0] += 1
+                data[1] += t
+                data[2] = max(data[2], t)
+            else:
+                self.hookTimes[key] = [1, t, t]
     #@+node:ekr.20100908125007.6018: *4* plugins.doPlugins (g.app.hookFunction)
     def doPlugins(self, tag, keywords):
         '''The default g.app.hookFunction.'''
@@ -387,8 +426,33 @@ class LeoPluginsController(object):
                 for tag in tags:
                     n = max(n, len(tag))
                     data.append((tag, key),)
-        lines = ['%*s %s\n' % (-n, s1, s2) for(s1, s2) in data]
+        lines = []
+        for tag, key in data:
+            times = self.hookTimes.get((key, tag))
+            if times:
+                lines.append('%*s %s %s\n' % (-n, tag, key, self.formatHookTimes(times)))
+            else:
+                lines.append('%*s %s\n' % (-n, tag, key))
         g.es('', ''.join(lines), tabName=tabName)
+    #@+node:dev.20261018330000.3: *4* plugins.printHookTimes & formatHookTimes
+    def printHookTimes(self, c):
+        '''Print the times spent in each hook handler, slowest first.'''
+        tabName = 'Plugins'
+        c.frame.log.selectTab(tabName)
+        if not self.hookTimes:
+            g.es('no hook times: use toggle-plugin-hook-timing', tabName=tabName)
+            return
+        g.es('plugin hook times...\n', tabName=tabName)
+        items = sorted(self.hookTimes.items(), key=lambda item: -item[1][1])
+        n = max(len(tag) for (moduleName, tag), times in items)
+        lines = ['%*s %s %s\n' % (-n, tag, moduleName, self.formatHookTimes(times))
+            for (moduleName, tag), times in items]
+        g.es('', ''.join(lines), tabName=tabName)
+
+    def formatHookTimes(self, times):
+        '''Return a description of [calls, total, max] times.'''
+        calls, total, max_t = times
+        return 'calls: %s total: %5.3f sec. max: %5.3f sec.' % (calls, total, max_t)
     #@+node:ekr.20100908125007.6026: *4* plugins.printPlugins
     def printPlugins(self, c):
         '''Print all enabled plugins.'''
@@ -599,6 +663,7 @@ class LeoPluginsController(object):
             bunches = self.handlers.get(tag)
             bunches = [bunch for bunch in bunches if bunch.moduleName != moduleName]
             self.handlers[tag] = bunches
+        self.dispatchDict = {}
     #@+node:ekr.20100909065501.5951: *3* plugins.Registration
     #@+node:ekr.20100908125007.6028: *4* plugins.registerExclusiveHandler
     def registerExclusiveHandler(self, tags, fn):
@@ -624,6 +689,7 @@ class LeoPluginsController(object):
         else:
             bunch = g.Bunch(fn=fn, moduleName=moduleName, tag='handler')
             self.handlers[tag] = [bunch] # Vitalije
+            self.dispatchDict = {}
     #@+node:ekr.20100908125007.6029: *4* plugins.registerHandler & registerOneHandler
     def registerHandler(self, tags, fn):
         """ Register one or more handlers"""
@@ -648,6 +714,7 @@ class LeoPluginsController(object):
             bunch = g.Bunch(fn=fn, moduleName=moduleName, tag='handler')
             items.append(bunch)
         self.handlers[tag] = items
+        self.dispatchDict = {}
     #@+node:ekr.20100908125007.6031: *4* plugins.unregisterHandler
     def unregisterHandler(self, tags, fn):
         if isinstance(tags, (list, tuple)):
@@ -660,6 +727,7 @@ class LeoPluginsController(object):
         bunches = self.handlers.get(tag)
         bunches = [bunch for bunch in bunches if bunch and bunch.fn != fn]
         self.handlers[tag] = bunches
+        self.dispatchDict = {}
     #@-others
 #@-others
 #@@language python
@@ -44,6 +44,8 @@
 # I first saw this model of unlimited undo in the documentation for Apple's Yellow Box classes.
 #@-<< How Leo implements unlimited undo >>
 import leo.core.leoGlobals as g
+import leo.core.leoNodes as leoNodes
+import sys
 # pylint: disable=unpacking-non-sequence
 #@+others
 #@+node:ekr.20031218072017.3605: ** class Undoer
@@ -61,6 +63,8 @@ class Undoer(object):
         self.debug_print = False # True: enable print statements in debug code.
         self.granularity = None # Set in reloadSettings.
         self.max_undo_stack_size = c.config.getInt('max_undo_stack_size') or 0
+        self.max_undo_memory = c.config.getInt('max_undo_memory_mb') or 0
+        self.evictedBeads = 0 # The number of beads discarded by u.cutStack.
         # Statistics comparing old and new ways (only if self.debug_Undoer is on).
         self.new_mem = 0
         self.old_mem = 0
@@ -148,19 +152,42 @@ class Undoer(object):
             setattr(u, ivar, None)
     #@+node:ekr.20060127052111.1: *4* u.cutStack
     def cutStack(self):
+        '''
+        Discard the oldest beads if the undo stack contains more than
+        max_undo_stack_size beads or uses more than max_undo_memory megabytes.
+        The present bead is never discarded.
+        '''
         u = self; n = u.max_undo_stack_size
-        if n > 0 and u.bead >= n and not g.app.unitTesting:
-            # Do nothing if we are in the middle of creating a group.
-            i = len(u.beads) - 1
-            while i >= 0:
-                bunch = u.beads[i]
-                if hasattr(bunch, 'kind') and bunch.kind == 'beforeGroup':
-                    return
-                i -= 1
+        cut_size = n > 0 and u.bead >= n and not g.app.unitTesting
+        if not cut_size and u.max_undo_memory <= 0:
+            return
+        # Do nothing if we are in the middle of creating a group.
+        i = len(u.beads) - 1
+        while i >= 0:
+            bunch = u.beads[i]
+            if hasattr(bunch, 'kind') and bunch.kind == 'beforeGroup':
+                return
+            i -= 1
+        if cut_size:
             # This work regardless of how many items appear after bead n.
                 # g.trace('Cutting undo stack to %d entries' % (n))
+            u.evictedBeads += len(u.beads) - n
             u.beads = u.beads[-n:]
             u.bead = n - 1
+        if u.max_undo_memory > 0:
+            limit = u.max_undo_memory * 1024 * 1024
+            sizes = [u.getBeadSize(z, maximum=True) for z in u.beads]
+            if sum(sizes) > limit:
+                # Don't count strings that are still node text.
+                sizes = [u.getBeadSize(z) for z in u.beads]
+            total, i = sum(sizes), 0
+            while total > limit and i < u.bead:
+                total -= sizes[i]
+                i += 1
+            if i > 0:
+                u.evictedBeads += i
+                u.beads = u.beads[i:]
+                u.bead -= i
     #@+node:ekr.20080623083646.10: *4* u.dumpBead
     def dumpBead(self, n):
         u = self
@@ -181,6 +208,66 @@ class Undoer(object):
             return self.dumpBead(n - 1)
         else:
             return '<no top bead>'
+    #@+node:dev.20261018280000.1: *4* u.getBeadSize
+    def getBeadSize(self, bunch, maximum=False):
+        '''
+        Return the approximate number of bytes of memory kept alive by the bead.
+
+        Strings that are still a node's headline or body text don't count:
+        the outline keeps them alive anyway. They count once the node
+        changes, so only the size including them is cached.
+
+        maximum: return that cached size, an upper bound.
+        '''
+        size, texts = bunch.get('beadSize'), bunch.get('beadTexts')
+        if size is None:
+            size, texts = self.computeBeadSize(bunch)
+            # A group grows until u.afterChangeGroup.
+            if bunch.get('kind') != 'beforeGroup':
+                bunch.beadSize, bunch.beadTexts = size, texts
+        if maximum:
+            return size
+        seen = set()
+        for data in texts:
+            v = data[0]
+            for s in data:
+                if (s is v._headString or s is v._bodyString) and id(s) not in seen:
+                    seen.add(id(s))
+                    size -= sys.getsizeof(s)
+        return size
+
+    def computeBeadSize(self, bunch):
+        '''
+        Return (size, texts) for u.getBeadSize. size counts every object the
+        bead references once. texts is a list of tuples (v, ...) whose items
+        may be v's headline or body text.
+        '''
+        seen, texts = set(), []
+        size, todo = 0, [bunch]
+        while todo:
+            obj = todo.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, g.Bunch):
+                size += sys.getsizeof(obj.__dict__)
+                values = list(obj.__dict__.values())
+                p = obj.get('p')
+                if p and p.v:
+                    texts.append(tuple([p.v] + [z for z in values if g.isString(z)]))
+                todo.extend(values)
+            elif isinstance(obj, (list, tuple)):
+                size += sys.getsizeof(obj)
+                if obj and isinstance(obj[0], leoNodes.VNode):
+                    # An entry of a tree created by u.saveTree.
+                    texts.append(obj)
+                todo.extend(obj)
+            elif isinstance(obj, dict):
+                size += sys.getsizeof(obj)
+                todo.extend(obj.values())
+            elif g.isString(obj) or isinstance(obj, bytes):
+                size += sys.getsizeof(obj)
+        return size, texts
     #@+node:EKR.20040526150818: *4* u.getBead
     def getBead(self, n):
         '''Set Undoer ivars from the bunch at the top of the undo stack.'''
@@ -230,7 +317,8 @@ class Undoer(object):
         new_ch is the char at the given (Tk) row, col of new_lines.
 
         The present code uses only old_ch and new_ch. The other arguments are given
-        for use by more sophisticated algorithms.'''
+        for use by more sophisticated algorithms. old_lines and new_lines are
+        always None: splitting the body text on every keystroke is too slow.'''
         # Start a word if new_ch begins whitespace + word
         new_word_started = not old_ch.isspace() and new_ch.isspace()
         # Start a word if the cursor has been moved since the last change
@@ -325,39 +413,33 @@ class Undoer(object):
         else:
             u.setRedoType("Can't Redo")
         u.cutStack()
-    #@+node:EKR.20040530121329: *4* u.restoreTree & helpers
+    #@+node:EKR.20040530121329: *4* u.restoreTree
     def restoreTree(self, treeInfo):
         """Use the tree info to restore all VNode data,
         including all links."""
-        u = self
         # This effectively relinks all vnodes.
-        for v, vInfo, tInfo in treeInfo:
-            u.restoreVnodeUndoInfo(vInfo)
-            u.restoreTnodeUndoInfo(tInfo)
-    #@+node:ekr.20050415170737.2: *5* u.restoreVnodeUndoInfo
-    def restoreVnodeUndoInfo(self, bunch):
-        """Restore all ivars saved in the bunch."""
-        v = bunch.v
-        v.statusBits = bunch.statusBits
-        v.children = bunch.children
-        v.parents = bunch.parents
-        uA = bunch.get('unknownAttributes')
-        if uA is not None:
-            v.unknownAttributes = uA
-            v._p_changed = 1
-    #@+node:ekr.20050415170812.2: *5* u.restoreTnodeUndoInfo
-    def restoreTnodeUndoInfo(self, bunch):
-        v = bunch.v
-        v.h = bunch.headString
-        v.b = bunch.bodyString
-        v.statusBits = bunch.statusBits
-        uA = bunch.get('unknownAttributes')
-        if uA is not None:
-            v.unknownAttributes = uA
-            v._p_changed = 1
-    #@+node:EKR.20040528075307: *4* u.saveTree & helpers
-    def saveTree(self, p, treeInfo=None):
-        """Return a list of tuples with all info needed to handle a general undo operation."""
+        for v, h, b, statusBits, parents, children, uA in treeInfo:
+            v.h = h
+            v.b = b
+            v.statusBits = statusBits
+            if v.isDirty():
+                v.setDirty() # Update c.dirtyVnodes.
+            for child in v.children:
+                child.setDbChanged() # child may no longer be in the outline.
+            v.children = list(children)
+            v.parents = list(parents)
+            if uA is not None:
+                v.unknownAttributes = uA
+                v._p_changed = 1
+    #@+node:EKR.20040528075307: *4* u.saveTree & helper
+    def saveTree(self, p, oldTree=None):
+        """
+        Return a list of tuples with all info needed to handle a general undo
+        operation, one tuple for each VNode in p's tree.
+
+        oldTree is a list returned by an earlier call. The result shares the
+        tuples of oldTree for all unchanged nodes.
+        """
         # WARNING: read this before doing anything "clever"
         #@+<< about u.saveTree >>
         #@+node:EKR.20040530114124: *5* << about u.saveTree >>
@@ -368,53 +450,41 @@ class Undoer(object):
         # adjustments to t.vnodeLists.
         # 
         # Instead of creating new nodes, the new code creates all information
-        # needed to properly restore the vnodes and tnodes. It creates a list of
-        # tuples, on tuple for each VNode in the tree. Each tuple has the form,
+        # needed to properly restore the vnodes. It creates a list of tuples,
+        # one tuple for each VNode in the tree. Each tuple has the form,
         # 
-        # (vnodeInfo, tnodeInfo)
+        # (v, headString, bodyString, statusBits, parents, children, uA)
         # 
-        # where vnodeInfo and tnodeInfo are dicts contain all info needed to
-        # recreate the nodes. The v.createUndoInfoDict and t.createUndoInfoDict
-        # methods correspond to the old v.copy and t.copy methods.
+        # The tuples contain references to the headline and body strings, not
+        # copies, so a snapshot holds on to a string only after the node's text
+        # has changed. The u.before/afterChangeTree snapshots share the tuples
+        # of unchanged nodes, so an operation that changes only part of a big
+        # tree costs little more than one copy of the tree's links.
         # 
         # Aside: Prior to 4.2 Leo used a scheme that was equivalent to the
         # createUndoInfoDict info, but quite a bit uglier.
         #@-<< about u.saveTree >>
-        u = self; topLevel = (treeInfo is None)
-        if topLevel: treeInfo = []
-        # Add info for p.v.  Duplicate tnode info is harmless.
-        data = (p.v, u.createVnodeUndoInfo(p.v), u.createTnodeUndoInfo(p.v))
-        treeInfo.append(data)
-        # Recursively add info for the subtree.
-        child = p.firstChild()
-        while child:
-            self.saveTree(child, treeInfo)
-            child = child.next()
+        u = self
+        old_d = dict((data[0], data) for data in oldTree) if oldTree else {}
+        treeInfo, seen = [], set()
+        for p2 in p.self_and_subtree(copy=False):
+            v = p2.v
+            if v in seen:
+                continue # A clone: the info would be the same.
+            seen.add(v)
+            data = u.createUndoInfo(v)
+            old_data = old_d.get(v)
+            if old_data is not None and old_data == data:
+                data = old_data
+            treeInfo.append(data)
         return treeInfo
-    #@+node:ekr.20050415170737.1: *5* u.createVnodeUndoInfo
-    def createVnodeUndoInfo(self, v):
-        """Create a bunch containing all info needed to recreate a VNode for undo."""
-        bunch = g.Bunch(
-            v=v,
-            statusBits=v.statusBits,
-            parents=v.parents[:],
-            children=v.children[:],
-        )
-        if hasattr(v, 'unknownAttributes'):
-            bunch.unknownAttributes = v.unknownAttributes
-        return bunch
-    #@+node:ekr.20050415170812.1: *5* u.createTnodeUndoInfo
-    def createTnodeUndoInfo(self, v):
-        """Create a bunch containing all info needed to recreate a VNode."""
-        bunch = g.Bunch(
-            v=v,
-            headString=v.h,
-            bodyString=v.b,
-            statusBits=v.statusBits,
+    #@+node:ekr.20050415170737.1: *5* u.createUndoInfo
+    def createUndoInfo(self, v):
+        """Create a tuple containing all info needed to restore a VNode for undo."""
+        return (
+            v, v.h, v.b, v.statusBits, tuple(v.parents), tuple(v.children),
+            getattr(v, 'unknownAttributes', None),
         )
-        if hasattr(v, 'unknownAttributes'):
-            bunch.unknownAttributes = v.unknownAttributes
-        return bunch
     #@+node:ekr.20050525151449: *4* u.trace
     def trace(self):
         ivars = ('kind', 'undoType')
@@ -511,7 +581,7 @@ class Undoer(object):
         # Set by beforeChangeTree: changed, oldSel, oldText, oldTree, p
         bunch.newSel = w.getSelectionRange()
         bunch.newText = w.getAllText()
-        bunch.newTree = u.saveTree(p)
+        bunch.newTree = u.saveTree(p, oldTree=bunch.oldTree)
         u.pushBead(bunch)
     #@+node:ekr.20050424161505: *5* u.afterClearRecentFiles
     def afterClearRecentFiles(self, bunch):
@@ -918,11 +988,15 @@ class Undoer(object):
             u.setIvarsFromBunch(v.undo_info)
     #@+node:ekr.20031218072017.1490: *4* u.setUndoTypingParams
     def setUndoTypingParams(self, p, undo_type, oldText, newText,
-        oldSel=None, newSel=None, oldYview=None,
+        oldSel=None, newSel=None, oldYview=None, span=None,
     ):
         '''
         Save enough information to undo or redo typing operation.
 
+        span is the span (i, j, k) of the changed text, as reported by the
+        body wrapper: oldText[i:j] became newText[i:k]. When span is None,
+        this method compares oldText and newText to compute the span.
+
         Do nothing when called from the undo/redo logic because the Undo
         and Redo commands merely reset the bead pointer.
         '''
@@ -951,51 +1025,24 @@ class Undoer(object):
         u.undoType = undo_type
         u.p = p.copy()
         #@-<< init the undo params >>
-        #@+<< compute leading, middle & trailing  lines >>
-        #@+node:ekr.20031218072017.1491: *5* << compute leading, middle & trailing  lines >>
-        #@+at Incremental undo typing is similar to incremental syntax coloring. We compute
-        # the number of leading and trailing lines that match, and save both the old and
-        # new middle lines. NB: the number of old and new middle lines may be different.
+        #@+<< compute the changed span >>
+        #@+node:dev.20261018270000.3: *5* << compute the changed span >>
+        #@+at Incremental undo typing is similar to incremental syntax coloring.
+        # The undo data is just the offset of the change, the removed text and
+        # the inserted text, so the work done here is proportional to the size
+        # of the change, not the size of the body.
         #@@c
-        old_lines = oldText.split('\n')
-        new_lines = newText.split('\n')
-        new_len = len(new_lines)
-        old_len = len(old_lines)
-        min_len = min(old_len, new_len)
-        i = 0
-        while i < min_len:
-            if old_lines[i] != new_lines[i]:
-                break
-            i += 1
-        leading = i
-        if leading == new_len:
-            # This happens when we remove lines from the end.
-            # The new text is simply the leading lines from the old text.
-            trailing = 0
-        else:
-            i = 0
-            while i < min_len - leading:
-                if old_lines[old_len - i - 1] != new_lines[new_len - i - 1]:
-                    break
-                i += 1
-            trailing = i
-        # NB: the number of old and new middle lines may be different.
-        if trailing == 0:
-            old_middle_lines = old_lines[leading:]
-            new_middle_lines = new_lines[leading:]
-        else:
-            old_middle_lines = old_lines[leading: -trailing]
-            new_middle_lines = new_lines[leading: -trailing]
-        # Remember how many trailing newlines in the old and new text.
-        i = len(oldText) - 1; old_newlines = 0
-        while i >= 0 and oldText[i] == '\n':
-            old_newlines += 1
-            i -= 1
-        i = len(newText) - 1; new_newlines = 0
-        while i >= 0 and newText[i] == '\n':
-            new_newlines += 1
-            i -= 1
-        #@-<< compute leading, middle & trailing  lines >>
+        if span:
+            i, j, k = span
+            if not (
+                0 <= i <= j <= len(oldText) and i <= k <= len(newText) and
+                len(oldText) - j == len(newText) - k
+            ):
+                span = None
+        if not span:
+            span = g.computeChangeSpan(oldText, newText)
+        i, j, k = span
+        #@-<< compute the changed span >>
         #@+<< save undo text info >>
         #@+node:ekr.20031218072017.1492: *5* << save undo text info >>
         #@+at This is the start of the incremental undo algorithm.
@@ -1014,18 +1061,13 @@ class Undoer(object):
             # Compute statistics comparing old and new ways...
             # The old doesn't often store the old text, so don't count it here.
             u.old_mem += len(newText)
-            s1 = '\n'.join(old_middle_lines)
-            s2 = '\n'.join(new_middle_lines)
-            u.new_mem += len(s1) + len(s2)
+            u.new_mem += (j - i) + (k - i)
         else:
             u.oldText = None
             u.newText = None
-        u.leading = leading
-        u.trailing = trailing
-        u.oldMiddleLines = old_middle_lines
-        u.newMiddleLines = new_middle_lines
-        u.oldNewlines = old_newlines
-        u.newNewlines = new_newlines
+        u.offset = i
+        u.oldMiddle = oldText[i: j]
+        u.newMiddle = newText[i: k]
         #@-<< save undo text info >>
         #@+<< save the selection and scrolling position >>
         #@+node:ekr.20040324061854.2: *5* << save the selection and scrolling position >>
@@ -1070,10 +1112,13 @@ class Undoer(object):
             newBead = False # Always replace previous bead.
         else:
             assert granularity in ('line', 'word')
-            # Replace the previous bead if only the middle lines have changed.
+            # Replace the previous bead if this change touches the previous
+            # change, and neither change spans lines.
+            old_i = old_d.offset
+            old_k = old_i + len(old_d.newMiddle)
             newBead = (
-                old_d.get('leading', 0) != u.leading or
-                old_d.get('trailing', 0) != u.trailing
+                i > old_k or j < old_i or
+                '\n' in old_d.oldMiddle or '\n' in old_d.newMiddle
             )
             if granularity == 'word' and not newBead:
                 # Protect the method that may be changed by the user
@@ -1092,11 +1137,19 @@ class Undoer(object):
                         newBead = True
                     else:
                         # 2011/04/01: Patch by Sam Hartsfield
-                        old_row, old_col = g.convertPythonIndexToRowCol(oldText, old_start)
-                        new_row, new_col = g.convertPythonIndexToRowCol(newText, new_start)
-                        prev_row, prev_col = g.convertPythonIndexToRowCol(oldText, prev_start)
-                        old_lines = g.splitLines(oldText)
-                        new_lines = g.splitLines(newText)
+                        # oldText and newText match up to i, so count the
+                        # newlines before the first index just once.
+                        base = max(0, min(i, old_start, new_start, prev_start))
+                        base_row = oldText.count('\n', 0, base)
+
+                        def row_col(s, index):
+                            index = max(0, min(index, len(s)))
+                            row = base_row + s.count('\n', base, index)
+                            return row, index - s.rfind('\n', 0, index) - 1
+
+                        old_row, old_col = row_col(oldText, old_start)
+                        new_row, new_col = row_col(newText, new_start)
+                        prev_row, prev_col = row_col(oldText, prev_start)
                         # Recognize backspace, del, etc. as contiguous.
                         if old_row != new_row or abs(old_col - new_col) != 1:
                             # The new and old characters are not contiguous.
@@ -1107,21 +1160,19 @@ class Undoer(object):
                             # TODO this is not true, we might as well just have entered a
                             # char at the beginning of an existing line
                             pass # We have just inserted a line.
+                        # New in 4.3b2:
+                        # Guard against invalid oldSel or newSel params.
+                        elif old_start - 1 >= len(oldText) or new_start - 1 >= len(newText):
+                            newBead = True
                         else:
-                            # 2011/04/01: Patch by Sam Hartsfield
-                            old_s = old_lines[old_row]
-                            new_s = new_lines[new_row]
-                            # New in 4.3b2:
-                            # Guard against invalid oldSel or newSel params.
-                            if old_col - 1 >= len(old_s) or new_col - 1 >= len(new_s):
-                                newBead = True
-                            else:
-                                old_ch = old_s[old_col - 1]
-                                new_ch = new_s[new_col - 1]
-                                newBead = self.recognizeStartOfTypingWord(
-                                    old_lines, old_row, old_col, old_ch,
-                                    new_lines, new_row, new_col, new_ch,
-                                    prev_row, prev_col)
+                            old_ch = oldText[old_start - 1]
+                            new_ch = newText[new_start - 1]
+                            # Splitting the text into lines would make typing
+                            # O(body size), so old_lines and new_lines are None.
+                            newBead = self.recognizeStartOfTypingWord(
+                                None, old_row, old_col, old_ch,
+                                None, new_row, new_col, new_ch,
+                                prev_row, prev_col)
                     #@-<< set newBead if the change does not continue a word >>
                 except Exception:
                     g.error('Unexpected exception...')
@@ -1140,19 +1191,26 @@ class Undoer(object):
                 redoHelper=u.redoTyping,
                 oldText=u.oldText,
                 oldSel=u.oldSel,
-                oldNewlines=u.oldNewlines,
-                oldMiddleLines=u.oldMiddleLines,
+                offset=u.offset,
+                oldMiddle=u.oldMiddle,
+                newMiddle=u.newMiddle,
             )
             u.pushBead(bunch)
         else:
+            # Merge this change into the previous change.
+            # oldText is the text resulting from the previous change.
             bunch = old_d
+            old_i = bunch.offset
+            old_k = old_i + len(bunch.newMiddle)
+            start, end = min(old_i, i), max(old_k, j)
+            bunch.offset = u.offset = start
+            bunch.oldMiddle = u.oldMiddle = (
+                oldText[start: old_i] + bunch.oldMiddle + oldText[old_k: end])
+            bunch.newMiddle = u.newMiddle = newText[start: end + k - j]
+            bunch.beadSize = None # Recompute the size.
         bunch.dirtyVnodeList = p.setAllAncestorAtFileNodesDirty()
         # Bug fix: Leo 4.4.6: always add p to the list.
         bunch.dirtyVnodeList.append(p.copy())
-        bunch.leading = u.leading
-        bunch.trailing = u.trailing
-        bunch.newNewlines = u.newNewlines
-        bunch.newMiddleLines = u.newMiddleLines
         bunch.newSel = u.newSel
         bunch.newText = u.newText
         bunch.yview = u.yview
@@ -1266,6 +1324,8 @@ class Undoer(object):
         for v in u.followingSibs:
             v.parents.remove(parent_v)
             v.parents.append(u.p.v)
+        parent_v.childrenModified()
+        u.p.v.childrenModified()
         c.setCurrentPosition(u.p)
     #@+node:ekr.20050318085432.6: *4* u.redoGroup
     def redoGroup(self):
@@ -1353,6 +1413,8 @@ class Undoer(object):
         parent_v.children.insert(u.newN, v)
         v.parents.append(u.newParent_v)
         v.parents.remove(u.oldParent_v)
+        u.oldParent_v.childrenModified()
+        u.newParent_v.childrenModified()
         u.updateMarks('new')
         for v in u.dirtyVnodeList:
             v.setDirty()
@@ -1396,12 +1458,15 @@ class Undoer(object):
         for child in u.children:
             child.parents.remove(u.p.v)
             child.parents.append(parent_v)
+        u.p.v.childrenModified()
+        parent_v.childrenModified()
         c.setCurrentPosition(u.p)
     #@+node:ekr.20080425060424.4: *4* u.redoSort
     def redoSort(self):
         u = self; c = u.c
         parent_v = u.p._parentVnode()
         parent_v.children = u.newChildren
+        parent_v.childrenModified()
         p = c.setPositionAfterSort(u.sortChildren)
         c.setCurrentPosition(p)
     #@+node:ekr.20050318085432.8: *4* u.redoTree
@@ -1421,9 +1486,7 @@ class Undoer(object):
         if current != u.p:
             c.selectPosition(u.p)
         self.undoRedoText(
-            u.p, u.leading, u.trailing,
-            u.newMiddleLines, u.oldMiddleLines,
-            u.newNewlines, u.oldNewlines,
+            u.p, u.offset, u.newMiddle, u.oldMiddle,
             tag="redo", undoType=u.undoType)
         u.updateMarks('new')
         for v in u.dirtyVnodeList:
@@ -1435,6 +1498,20 @@ class Undoer(object):
         if u.yview:
             c.bodyWantsFocus()
             w.setYScrollPosition(u.yview)
+    #@+node:dev.20261018280000.2: *3* u.showUndoStats
+    @cmd('show-undo-stats')
+    def showUndoStats(self, event=None):
+        """Print the size of the undo stack and its largest beads."""
+        u = self
+        sizes = [(u.getBeadSize(z), i, z) for i, z in enumerate(u.beads)]
+        total = sum(size for size, i, z in sizes)
+        budget = '%s MB' % u.max_undo_memory if u.max_undo_memory > 0 else 'unlimited'
+        g.es_print('undo beads: %s, current bead: %s' % (len(u.beads), u.bead))
+        g.es_print('undo memory: %4.2f MB, budget: %s, evicted beads: %s' % (
+            float(total) / (1024 * 1024), budget, u.evictedBeads))
+        for size, i, bunch in sorted(sizes, key=lambda z: (-z[0], z[1]))[:5]:
+            g.es_print('%6s KB bead %s: %s' % (
+                size // 1024, i, bunch.get('undoType') or bunch.get('kind')))
     #@+node:ekr.20031218072017.2039: *3* u.undo
     @cmd('undo')
     def undo(self, event=None):
@@ -1554,6 +1631,8 @@ class Undoer(object):
         for sib in u.followingSibs:
             sib.parents.remove(u.p.v)
             sib.parents.append(parent_v)
+        u.p.v.childrenModified()
+        parent_v.childrenModified()
         c.setCurrentPosition(u.p)
     #@+node:ekr.20050318085713: *4* u.undoGroup
     def undoGroup(self):
@@ -1641,6 +1720,8 @@ class Undoer(object):
         # Recompute the parent links.
         v.parents.append(u.oldParent_v)
         v.parents.remove(u.newParent_v)
+        u.oldParent_v.childrenModified()
+        u.newParent_v.childrenModified()
         u.updateMarks('old')
         for v in u.dirtyVnodeList:
             v.setDirty()
@@ -1685,39 +1766,24 @@ class Undoer(object):
         for child in u.children:
             child.parents.remove(parent_v)
             child.parents.append(u.p.v)
+        parent_v.childrenModified()
+        u.p.v.childrenModified()
         c.setCurrentPosition(u.p)
     #@+node:ekr.20031218072017.1493: *4* u.undoRedoText
     def undoRedoText(self, p,
-        leading, trailing, # Number of matching leading & trailing lines.
-        oldMidLines, newMidLines, # Lists of unmatched lines.
-        oldNewlines, newNewlines, # Number of trailing newlines.
+        offset, # The offset of the change.
+        oldMiddle, newMiddle, # The text before and after the change.
         tag="undo", # "undo" or "redo"
         undoType=None
     ):
         '''Handle text undo and redo: converts _new_ text into _old_ text.'''
-        # newNewlines is unused, but it has symmetry.
         u = self; c = u.c; w = c.frame.body.wrapper
         #@+<< Compute the result using p's body text >>
         #@+node:ekr.20061106105812.1: *5* << Compute the result using p's body text >>
         # Recreate the text using the present body text.
         body = p.b
         body = g.toUnicode(body)
-        body_lines = body.split('\n')
-        s = []
-        if leading > 0:
-            s.extend(body_lines[: leading])
-        if oldMidLines:
-            s.extend(oldMidLines)
-        if trailing > 0:
-            s.extend(body_lines[-trailing:])
-        s = '\n'.join(s)
-        # Remove trailing newlines in s.
-        while s and s[-1] == '\n':
-            s = s[: -1]
-        # Add oldNewlines newlines.
-        if oldNewlines > 0:
-            s = s + '\n' * oldNewlines
-        result = s
+        result = body[: offset] + oldMiddle + body[offset + len(newMiddle):]
         if u.debug_print:
             g.pr("body:  ", body)
             g.pr("result:", result)
@@ -1739,7 +1805,8 @@ class Undoer(object):
             # This is the first time we have undone the operation.
             # Put the new data in the bead.
             bunch = u.beads[u.bead]
-            bunch.newTree = u.saveTree(p.copy())
+            bunch.newTree = u.saveTree(p.copy(), oldTree=old_data)
+            bunch.beadSize = None # Recompute the size.
             u.beads[u.bead] = bunch
         # Replace data in tree with old data.
         u.restoreTree(old_data)
@@ -1750,6 +1817,7 @@ class Undoer(object):
         u = self; c = u.c
         parent_v = u.p._parentVnode()
         parent_v.children = u.oldChildren
+        parent_v.childrenModified()
         p = c.setPositionAfterSort(u.sortChildren)
         c.setCurrentPosition(p)
     #@+node:ekr.20050318085713.2: *4* u.undoTree
@@ -1769,9 +1837,7 @@ class Undoer(object):
         if current != u.p:
             c.selectPosition(u.p)
         self.undoRedoText(
-            u.p, u.leading, u.trailing,
-            u.oldMiddleLines, u.newMiddleLines,
-            u.oldNewlines, u.newNewlines,
+            u.p, u.offset, u.oldMiddle, u.newMiddle,
             tag="undo", undoType=u.undoType)
         u.updateMarks('old')
         for v in u.dirtyVnodeList:
@@ -14,7 +14,7 @@ the following API::
 
     tc = c.theTagController
     tc.get_all_tags()
-        return a list of all tags used in the current outline,
+        return a sorted list of all tags used in the current outline,
         automatically updated to be consistent
     tc.get_tagged_nodes('foo')
         return a list of positions tagged 'foo'
@@ -27,6 +27,8 @@ the following API::
         remove the tag 'baz' from p if it is in the tag list
 
 Internally, tags are stored in `p.v.unknownAttributes['__node_tags']` as a set.
+The controller keeps an index from tags to the gnx's of tagged nodes, so
+searches do not traverse the outline.
 
 UI
 ==
@@ -96,6 +98,7 @@ whitespace (calling .strip()).
 #@+node:peckj.20140804103733.9241: ** << imports >>
 import leo.core.leoGlobals as g
 import leo.core.leoNodes as leoNodes
+import bisect
 import re
 from leo.core.leoQt import QtWidgets, QtCore
 #@-<< imports >>
@@ -131,6 +134,11 @@ class TagController(object):
         self.TAG_LIST_KEY = '__node_tags'
         self.c = c
         self.taglist = []
+            # A sorted list of all tags.
+        self.tag_dict = {}
+            # Keys are tags, values are sets of gnx's of nodes with that tag.
+        self.regex_dict = {}
+            # Keys are search strings, values are compiled regexes.
         self.initialize_taglist()
         c.theTagController = self
         self.ui = LeoTagWidget(c)
@@ -138,48 +146,121 @@ class TagController(object):
         self.ui.update_all()
     #@+node:peckj.20140804103733.9263: *5* initialize_taglist
     def initialize_taglist(self):
-        taglist = []
-        for p in self.c.all_unique_positions():
-            for tag in self.get_tags(p):
-                if tag not in taglist:
-                    taglist.append(tag)
-        self.taglist = taglist
+        '''Create the tag index by scanning the entire outline.'''
+        self.tag_dict = {}
+        for v in self.c.all_unique_nodes():
+            for tag in v.u.get(self.TAG_LIST_KEY, []):
+                self.tag_dict.setdefault(tag, set()).add(v.gnx)
+        self.taglist = sorted(self.tag_dict)
+    #@+node:dev.20261018240000.1: *5* index_node & unindex_node
+    def index_node(self, v, tag):
+        '''Add v to the index of tag.'''
+        gnxs = self.tag_dict.get(tag)
+        if gnxs is None:
+            gnxs = self.tag_dict[tag] = set()
+            bisect.insort(self.taglist, tag)
+        gnxs.add(v.gnx)
+
+    def unindex_node(self, gnx, tag):
+        '''Remove the node with the given gnx from the index of tag.'''
+        gnxs = self.tag_dict.get(tag)
+        if gnxs is not None:
+            gnxs.discard(gnx)
+            if not gnxs:
+                del self.tag_dict[tag]
+                i = bisect.bisect_left(self.taglist, tag)
+                if i < len(self.taglist) and self.taglist[i] == tag:
+                    del self.taglist[i]
+    #@+node:dev.20261018240000.2: *5* update_index
+    def update_index(self, p):
+        '''
+        Update the index after pasting, deleting or restoring nodes.
+
+        Remove tagged nodes that are no longer in the outline, then index the
+        nodes of p's tree. Undo and paste select the restored or pasted tree.
+        '''
+        c = self.c
+        gnxDict = c.fileCommands.gnxDict
+        in_outline = {c.hiddenRootNode: True}
+
+        def contains(v):
+            # True if v is reachable from the hidden root.
+            val = in_outline.get(v)
+            if val is None:
+                in_outline[v] = False # Break cycles.
+                val = in_outline[v] = any(contains(parent) for parent in v.parents)
+            return val
+
+        for tag, gnxs in list(self.tag_dict.items()):
+            for gnx in list(gnxs):
+                v = gnxDict.get(gnx)
+                if not v or tag not in v.u.get(self.TAG_LIST_KEY, []) or not contains(v):
+                    self.unindex_node(gnx, tag)
+        if p and c.positionExists(p):
+            for p2 in p.self_and_subtree(copy=False):
+                for tag in p2.v.u.get(self.TAG_LIST_KEY, []):
+                    self.index_node(p2.v, tag)
     #@+node:peckj.20140804103733.9264: *3* outline-level
     #@+node:peckj.20140804103733.9268: *4* get_all_tags
     def get_all_tags(self):
-        ''' return a list of all tags in the outline '''
+        ''' return a sorted list of all tags in the outline '''
         return self.taglist
     #@+node:peckj.20140804103733.9267: *4* update_taglist
     def update_taglist(self, tag):
         ''' ensures the outline's taglist is consistent with the state of the nodes in the outline '''
-        if tag not in self.taglist:
-            self.taglist.append(tag)
-        nodelist = self.get_tagged_nodes(tag)
-        if not nodelist:
-            self.taglist.remove(tag)
+        if not self.tag_dict.get(tag):
+            self.tag_dict.pop(tag, None)
+            if tag in self.taglist:
+                self.taglist.remove(tag)
         self.ui.update_all()
     #@+node:peckj.20140804103733.9258: *4* get_tagged_nodes
     def get_tagged_nodes(self, tag):
         ''' return a list of *positions* of nodes containing the tag, with * as a wildcard '''
+        c = self.c
+        gnxDict = c.fileCommands.gnxDict
         nodelist = []
-        # replace * with .* for regex compatibility
-        tag = tag.replace('*', '.*')
-        regex = re.compile(tag)
-        for p in self.c.all_unique_positions():
-            for tag in self.get_tags(p):
-                if regex.match(tag):
-                    nodelist.append(p.copy())
-                    break
+        for gnx in self.get_tagged_gnxes(tag):
+            v = gnxDict.get(gnx)
+            p = v and c.vnode2position(v)
+            if p:
+                nodelist.append(p)
+        # List the nodes in outline order.
+        nodelist.sort(key=lambda p: p.sort_key(p))
         return nodelist
     #@+node:vitalije.20170811150914.1: *4* get_tagged_gnxes
     def get_tagged_gnxes(self, tag):
-        c = self.c
-        tag = tag.replace('*', '.*')
-        regex = re.compile(tag)
-        for p in c.all_unique_positions():
-            for t in self.get_tags(p):
-                if regex.match(t):
-                    yield p.v.gnx
+        ''' return the set of gnx's of nodes containing the tag, with * as a wildcard '''
+        regex = self.regex_dict.get(tag)
+        if not regex:
+            # replace * with .* for regex compatibility
+            regex = self.regex_dict[tag] = re.compile(tag.replace('*', '.*'))
+        # All matching tags start with the literal prefix of the search string.
+        prefix = self.literal_prefix(regex.pattern)
+        result = set()
+        taglist = self.taglist
+        i = bisect.bisect_left(taglist, prefix)
+        while i < len(taglist) and taglist[i].startswith(prefix):
+            t = taglist[i]
+            if regex.match(t):
+                result.update(self.tag_dict[t])
+            i += 1
+        return result
+    #@+node:dev.20261018240000.3: *5* literal_prefix
+    def literal_prefix(self, pattern):
+        '''Return the prefix of all tags that match the regex pattern.'''
+        if '|' in pattern:
+            return ''
+        prefix = []
+        for ch in pattern:
+            if ch in '*+?{':
+                # The previous character is optional or repeated.
+                if prefix:
+                    prefix.pop()
+                break
+            if ch in '.^$[]()\\':
+                break
+            prefix.append(ch)
+        return ''.join(prefix)
     #@+node:peckj.20140804103733.9265: *3* individual nodes
     #@+node:peckj.20140804103733.9259: *4* get_tags
     def get_tags(self, p):
@@ -196,6 +277,7 @@ class TagController(object):
         tags = set(p.v.u.get(self.TAG_LIST_KEY, set([])))
         tags.add(tag)
         p.v.u[self.TAG_LIST_KEY] = tags
+        self.index_node(p.v, tag)
         self.c.setChanged(True)
         self.update_taglist(tag)
     #@+node:peckj.20140804103733.9261: *4* remove_tag
@@ -211,6 +293,7 @@ class TagController(object):
         else:
             del v.u[self.TAG_LIST_KEY]
             # prevent a few corner cases, and conserve disk space
+        self.unindex_node(v.gnx, tag)
         self.c.setChanged(True)
         self.update_taglist(tag)
     #@-others
@@ -428,11 +511,12 @@ class LeoTagWidget(QtWidgets.QWidget):
 
     #@+node:peckj.20140806101020.14006: *4* command2_hook
     def command2_hook(self, tag, keywords):
-        paste_cmds = ['paste-node',
-                      'pasteOutlineRetainingClones', # strange that this one isn't canonicalized
-                      'paste-retaining-clones']
-        if keywords.get('label') in paste_cmds:
-            self.tc.initialize_taglist()
+        outline_cmds = ['paste-node',
+                        'pasteOutlineRetainingClones', # strange that this one isn't canonicalized
+                        'paste-retaining-clones',
+                        'cut-node', 'delete-node', 'undo', 'redo']
+        if keywords.get('label') in outline_cmds:
+            self.tc.update_index(self.c.p)
             self.update_all()
     #@+node:tbnorth.20170313095036.1: *5* sf.find_setting
     #Plugins:2-->User interface:21-->@file settings_finder.py:11-->class SettingsFinder:2-->sf.find_setting:5
@@ -28,7 +28,8 @@ def patch_colorizer(c):
     mode = colorizer.modes.get('python_main')
     d = mode.get('rulesDict')
     aList = d.get('G', [])
-    aList.insert(0, python_rule_global)
+    if python_rule_global not in aList:
+        aList.insert(0, python_rule_global)
     d['G'] = aList
     # g.printObj(rulesDict.get('G'))
     # Force a full recolor.
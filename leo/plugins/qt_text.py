@@ -16,6 +16,7 @@ class QTextMixin(object):
     def __init__(self, c=None):
         '''Ctor for QTextMixin class'''
         self.c = c
+        self.changeSpan = None # See getChangeSpan.
         self.changingText = False # A lockout for onTextChanged.
         self.enabled = True
         self.supportsHighLevelInterface = True
@@ -93,6 +94,8 @@ class QTextMixin(object):
         oldSel = (i, i + j)
         oldYview = None
         undoType = 'Typing'
+        # Qt made this change, so the span does not describe it.
+        w.getChangeSpan()
         c.undoer.setUndoTypingParams(p, undoType,
             oldText=oldText, newText=newText,
             oldSel=oldSel, newSel=newSel, oldYview=oldYview)
@@ -173,6 +176,18 @@ class QTextMixin(object):
         i = self.toPythonIndex(i)
         j = self.toPythonIndex(j)
         return s[i: j]
+    #@+node:dev.20261018270000.5: *5* qtm.getChangeSpan
+    def getChangeSpan(self):
+        '''
+        Return the span (i, j, k) of the text changed since the last call:
+        s[i:j] of the old text became s[i:k]. Return None if the change is
+        unknown.
+
+        Only subclasses that record the changes made by insert and delete
+        ever return a span.
+        '''
+        span, self.changeSpan = self.changeSpan, ()
+        return span or None
     #@+node:ekr.20140901062324.18704: *5* qtm.getLastPosition & getLength
     def getLastPosition(self, s=None):
         '''QTextMixin'''
@@ -1214,6 +1229,7 @@ class QTextEditWrapper(QTextMixin):
                 cursor.movePosition(cursor.Right, cursor.KeepAnchor, moveCount)
                 w.setTextCursor(cursor) # Bug fix: 2010/01/27
                 cursor.removeSelectedText()
+            self.changeSpan = g.mergeChangeSpan(self.changeSpan, i, j, i)
         finally:
             self.changingText = False
         sb.setSliderPosition(pos)
@@ -1311,6 +1327,7 @@ class QTextEditWrapper(QTextMixin):
             cursor.setPosition(i)
             cursor.insertText(s)
             w.setTextCursor(cursor) # Bug fix: 2010/01/27
+            self.changeSpan = g.mergeChangeSpan(self.changeSpan, i, i, i + len(s))
         finally:
             self.changingText = False
     #@+node:ekr.20110605121601.18077: *4* qtew.leoMoveCursorHelper & helper
@@ -1442,6 +1459,7 @@ class QTextEditWrapper(QTextMixin):
             self.changingText = True # Disable onTextChanged.
             w.setReadOnly(False)
             w.setPlainText(s)
+            self.changeSpan = None
         finally:
             self.changingText = False
     #@+node:ekr.20110605121601.18095: *4* qtew.setInsertPoint
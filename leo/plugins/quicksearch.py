@@ -9,6 +9,10 @@ Quicksearch searches node headlines only, *not* body text
 
 Just load the plugin, activate "Nav" tab, enter search text and press enter.
 
+Searches use an index of the three-letter substrings of all headlines and
+bodies, so only nodes that might match are examined. Live search runs in
+short time slices, and typing another character cancels it.
+
 Usage
 =====
 
@@ -79,7 +83,7 @@ This plugin defines the following commands that can be bound to keys:
 #@+<< imports >>
 #@+node:ville.20090314215508.7: ** << imports >>
 import leo.core.leoGlobals as g
-import itertools
+import array
 from collections import OrderedDict
 # Fail gracefully if the gui is not qt.
 g.assertUi('qt')
@@ -89,6 +93,7 @@ from leo.core import leoNodes
     # Uses leoNodes.PosList.
 import fnmatch
 import re
+import time
 from leo.plugins import threadutil
     # Bug fix. See: https://groups.google.com/forum/?fromgroups=#!topic/leo-editor/PAZloEsuk7g
 from leo.plugins import qt_quicksearch_sub as qt_quicksearch
@@ -100,6 +105,8 @@ def init ():
     ok = g.app.gui.guiName() == "qt"
     if ok:
         g.registerHandler('after-create-leo-frame',onCreate)
+        g.registerHandler(('contentModified', 'childrenModified', 'headkey2'),
+            onNodesChanged)
         g.plugin_signon(__name__)
     return ok
 
@@ -362,7 +369,7 @@ class LeoQuickSearchWidget(QtWidgets.QWidget):
             self.scon.doShowMarked()
             return
 
-        self.scon.worker.set_input(t)
+        self.scon.liveSearch(t)
 
 
 
@@ -378,6 +385,192 @@ def matchlines(b, miter):
         res.append((li, (m.start(), m.end() )))
     return res
 
+#@+node:dev.20261018250000.1: ** get_trigram_index
+def get_trigram_index(c, kind):
+    '''Return c's TrigramIndex of headlines (kind 'h') or bodies (kind 'b').'''
+    d = getattr(c, 'quickSearchIndices', None)
+    if d is None:
+        d = c.quickSearchIndices = {}
+    index = d.get(kind)
+    if index is None:
+        index = d[kind] = TrigramIndex(c, kind)
+    return index
+#@+node:dev.20261018290000.11: ** onNodesChanged
+def onNodesChanged(tag, keys):
+    '''Tell the trigram indices which nodes may have changed.'''
+    if tag == 'headkey2':
+        p = keys.get('p')
+        nodes = [p.v] if p else []
+    else:
+        nodes = keys.get('nodes') or []
+    for v in nodes:
+        d = getattr(v.context, 'quickSearchIndices', None) or {}
+        for index in d.values():
+            index.note(v, moved=tag == 'childrenModified')
+#@+node:dev.20261018250000.2: ** fnmatch_literals
+def fnmatch_literals(pat):
+    '''Return the parts of an fnmatch pattern that match literally.'''
+    # As in fnmatch.translate, a ']' just after '[' or '[!' is part of the
+    # set, and an unclosed '[' matches itself.
+    return [s for s in re.split(
+        r'\*|\?|\[(?:!\]|!(?!\])|\]|(?![!\]]))[^\]]*\]', pat) if s]
+#@+node:dev.20261018250000.3: ** class TrigramIndex
+class TrigramIndex(object):
+    '''
+    An index of the three-character substrings of the lowercased headlines
+    or bodies of all the nodes of an outline.
+
+    The index is a filter: it may return nodes that do not match, but it
+    never misses a node that does. Changed nodes are reindexed by removing
+    the postings of trigrams they no longer contain.
+
+    The contentModified, headkey2 and childrenModified hooks tell the index
+    which nodes to check. See onNodesChanged.
+    '''
+    #@+others
+    #@+node:dev.20261018250000.4: *3*  ctor (TrigramIndex)
+    def __init__(self, c, kind):
+        self.c = c
+        self.kind = kind
+            # 'h' for headlines, 'b' for bodies.
+        self.changed = set()
+            # Vnodes whose text may have changed.
+        self.free = []
+            # Unused indices into self.nodes.
+        self.generation = 0
+            # Incremented whenever a node is indexed.
+        self.numbers = {}
+            # Keys are the indexed vnodes, values are indices into self.nodes.
+        self.numGnxs = 0
+            # The size of c.fileCommands.gnxDict when last checked.
+        self.nodes = []
+            # The indexed vnodes, or None for unused entries.
+        self.scanned = None
+            # The value of self.structure when all nodes were last checked.
+        self.structure = 0
+            # Incremented whenever the outline's structure may have changed.
+        self.postings = {}
+            # Keys are trigrams, values are arrays of indices into self.nodes.
+        self.texts = []
+            # The string that was indexed for each node.
+    #@+node:dev.20261018250000.5: *3* candidates
+    def candidates(self, literals):
+        '''
+        Return the set of vnodes whose text may contain all the literals,
+        or None if the literals are too short to narrow the search.
+        '''
+        trigrams = set()
+        for s in literals:
+            trigrams.update(self.trigrams(s))
+        if not trigrams:
+            return None
+        postings = sorted((self.postings.get(t, ()) for t in trigrams), key=len)
+        result = set(postings[0])
+        for numbers in postings[1:]:
+            if len(numbers) > 8 * len(result):
+                break # Checking the remaining candidates is faster.
+            result.intersection_update(numbers)
+        nodes = self.nodes
+        return set(nodes[i] for i in result)
+    #@+node:dev.20261018290000.7: *3* note
+    def note(self, v, moved=False):
+        '''
+        Remember that the text of v may have changed,
+        or if moved is True, that the children of v may have changed.
+        '''
+        if moved:
+            self.structure += 1
+        else:
+            self.changed.add(v)
+    #@+node:dev.20261018250000.6: *3* update & update_iter
+    def update(self):
+        '''Index all new and changed nodes.'''
+        for z in self.update_iter():
+            pass
+
+    def update_iter(self):
+        '''
+        Index all new and changed nodes, yielding periodically.
+
+        After the outline's structure changes, check all nodes of the
+        outline and forget the nodes no longer in it. Otherwise, check only
+        the noted nodes and the dirty nodes.
+        '''
+        c = self.c
+        n = len(c.fileCommands.gnxDict)
+        if n != self.numGnxs:
+            # Vnodes have been created without calling v.childrenModified.
+            self.numGnxs = n
+            self.structure += 1
+        if self.scanned != self.structure:
+            structure = self.structure
+            self.changed.clear()
+            vnodes = list(c.all_unique_nodes())
+            for i, v in enumerate(vnodes):
+                self.index_vnode(v)
+                if i % 5000 == 4999:
+                    yield
+            for v in set(self.numbers) - set(vnodes):
+                self.remove_vnode(v)
+            self.scanned = structure
+        else:
+            todo = self.changed
+            todo.update(c.dirtyVnodes)
+            while todo:
+                v = todo.pop()
+                if v in self.numbers:
+                    self.index_vnode(v)
+    #@+node:dev.20261018290000.10: *3* index_vnode & remove_vnode
+    def index_vnode(self, v):
+        '''Index v if it is new or its text has changed.'''
+        s = getattr(v, '_headString' if self.kind == 'h' else '_bodyString')
+        n = self.numbers.get(v)
+        if n is None:
+            if self.free:
+                n = self.free.pop()
+                self.nodes[n], self.texts[n] = v, s
+            else:
+                n = len(self.nodes)
+                self.nodes.append(v)
+                self.texts.append(s)
+            self.numbers[v] = n
+            self.index_node(n, s)
+        elif self.texts[n] is not s:
+            self.index_node(n, s, old=self.texts[n])
+            self.texts[n] = s
+
+    def remove_vnode(self, v):
+        '''Forget v, a vnode that is no longer in the outline.'''
+        n = self.numbers.pop(v)
+        self.index_node(n, '', old=self.texts[n])
+        self.nodes[n], self.texts[n] = None, ''
+        self.free.append(n)
+    #@+node:dev.20261018250000.7: *3* index_node
+    def index_node(self, n, s, old=None):
+        '''
+        Add node number n to the postings of all trigrams of s.
+        Remove it from the postings of trigrams only in the old text.
+        '''
+        self.generation += 1
+        postings = self.postings
+        new_trigrams, old_trigrams = self.trigrams(s), self.trigrams(old or '')
+        for t in old_trigrams - new_trigrams:
+            numbers = postings[t]
+            numbers.remove(n)
+            if not numbers:
+                del postings[t]
+        for t in new_trigrams - old_trigrams:
+            numbers = postings.get(t)
+            if numbers is None:
+                postings[t] = array.array('i', [n])
+            else:
+                numbers.append(n)
+    #@+node:dev.20261018250000.13: *3* trigrams
+    def trigrams(self, s):
+        '''Return the set of trigrams of the lowercased string s.'''
+        s = s.lower()
+        return set(s[i:i+3] for i in range(len(s)-2))
+    #@-others
 #@+node:ville.20090314215508.12: ** class QuickSearchController
 class QuickSearchController(object):
 
@@ -387,7 +580,6 @@ class QuickSearchController(object):
         self.c = c
         self.lw = w = listWidget # A QListWidget.
         self.its = {} # Keys are id(w),values are tuples (p,pos)
-        self.worker = threadutil.UnitWorker()
         self.widgetUI = ui
         self.fileDirectives = ["@clean", "@file", "@asis", "@edit",
                                "@auto", "@auto-md", "@auto-org",
@@ -395,41 +587,12 @@ class QuickSearchController(object):
 
         self.frozen = False
         self._search_patterns = []
-        def searcher(inp):
-            #print("searcher", inp)
-            if self.frozen:
-                return
-            exp = inp.replace(" ", "*")
-            res =  self.bgSearch(exp)
-            return res
-
-        def dumper():
-            # always run on ui thread
-            if self.frozen:
-                return
-            out = self.worker.output
-            #print("dumper")
-            self.throttler.add(out)
-
-        def throttledDump(lst):
-            """ dumps the last output """
-            #print "Throttled dump"
-            # we do get called with empty list on occasion
-            if not lst:
-                return
-            if self.frozen:
-                return
-            hm,bm = lst[-1]
-            self.clear()
-            self.addHeadlineMatches(hm)
-            self.addBodyMatches(bm)
-
-        self.throttler = threadutil.NowOrLater(throttledDump)
-
-        self.worker.set_worker(searcher)
-        #self.worker.set_output_f(dumper)
-        self.worker.resultReady.connect(dumper)
-        self.worker.start()
+        self.liveJob = None
+            # The generator doing the live search, or None.
+        self.liveResults = None
+            # A g.Bunch describing the last completed live search.
+        self.timeSlice = 0.02
+            # The time in seconds a live search runs before handling events.
         if 1: # Compatible with PyQt5
             # we want both single-clicks and activations (press enter)
             w.itemActivated.connect(self.onActivated)
@@ -449,6 +612,8 @@ class QuickSearchController(object):
     #@+node:ville.20121120225024.3636: *3* freeze
     def freeze(self, val = True):
         self.frozen = val
+        if val:
+            self.liveJob = None # Cancel any live search.
 
     #@+node:vitalije.20170705203722.1: *3* addItem
     def addItem(self, it, val):
@@ -511,7 +676,7 @@ class QuickSearchController(object):
             f = it.font()
             f.setBold(True)
             it.setFont(f)
-            if self.addItem(it, (p, None)): return
+            if self.addItem(it, (p, None)): return True
     #@+node:ekr.20111015194452.15691: *3* clear
     def clear(self):
 
@@ -570,10 +735,12 @@ class QuickSearchController(object):
             # only \Z
             bpat = bpat.replace(r'\Z', '')
             flags = re.IGNORECASE
+            literals = fnmatch_literals(pat)
         else:
             hpat = pat[2:]
             bpat = pat[2:]
             flags = 0
+            literals = []
         combo = self.widgetUI.comboBox.currentText()
         if combo == "All":
             hNodes = self.c.all_positions()
@@ -624,8 +791,8 @@ class QuickSearchController(object):
             bNodes = [self.c.p]
 
         if not hitBase:
-            hm = self.find_h(hpat, hNodes, flags)
-            bm = self.find_b(bpat, bNodes, flags)
+            hm = self.find_h(hpat, self.filterNodes(hNodes, 'h', literals), flags)
+            bm = self.find_b(bpat, self.filterNodes(bNodes, 'b', literals), flags)
             bm_keys = [match.key() for match in bm]
             numOfHm = len(hm) #do this before trim to get accurate count
             hm = [match for match in hm if match.key() not in bm_keys]
@@ -649,35 +816,122 @@ class QuickSearchController(object):
             if combo == "File":
                 self.lw.insertItem(0, "External file directive not found "+
                                       "during search")
-    #@+node:ville.20121118193144.3620: *3* bgSearch
-    def bgSearch(self, pat):
-
-        #self.clear()
-
-        if self.frozen:
+    #@+node:dev.20261018250000.8: *3* filterNodes
+    def filterNodes(self, nodes, kind, literals):
+        '''
+        Yield the positions in nodes whose headline (kind 'h') or body
+        (kind 'b') may contain all the literals.
+        '''
+        index = get_trigram_index(self.c, kind)
+        index.update()
+        candidates = index.candidates(literals)
+        for p in nodes:
+            if candidates is None or p.v in candidates:
+                yield p
+    #@+node:dev.20261018250000.9: *3* Live search
+    #@+node:dev.20261018250000.10: *4* liveSearch & runLiveSearch
+    def liveSearch(self, t):
+        '''Start a live search for t, cancelling any search in progress.'''
+        self.liveJob = job = self.liveSearchIter(t.replace(" ", "*"))
+        QtCore.QTimer.singleShot(0, lambda: self.runLiveSearch(job))
+
+    def runLiveSearch(self, job):
+        '''Run job for one time slice, then let Qt handle pending events.'''
+        if job is not self.liveJob or self.frozen:
+            return # The search has been cancelled.
+        t1 = time.time()
+        try:
+            while time.time() - t1 < self.timeSlice:
+                next(job)
+        except StopIteration:
+            self.liveJob = None
             return
-
-        if not pat.startswith('r:'):
-            hpat = fnmatch.translate('*'+ pat + '*').replace(r"\Z(?ms)","")
-            # bpat = fnmatch.translate(pat).rstrip('$').replace(r"\Z(?ms)","")
-            flags = re.IGNORECASE
+        except Exception:
+            self.liveJob = None
+            g.es_exception()
+            return
+        QtCore.QTimer.singleShot(0, lambda: self.runLiveSearch(job))
+    #@+node:dev.20261018250000.11: *4* liveSearchIter
+    def liveSearchIter(self, pat):
+        '''
+        A generator that searches headlines for pat, yielding periodically.
+
+        When pat extends the pattern of the previous search, only the nodes
+        found by that search are searched. Hits are added to the list widget
+        in batches.
+        '''
+        c = self.c
+        if pat.startswith('r:'):
+            hpat, flags, literals = pat[2:], 0, []
         else:
-            hpat = pat[2:]
-            # bpat = pat[2:]
-            flags = 0
+            hpat = fnmatch.translate('*'+ pat + '*').replace(r"\Z(?ms)","")
+            flags, literals = re.IGNORECASE, fnmatch_literals(pat)
+        try:
+            regex = re.compile(hpat, flags)
+        except Exception:
+            return
         combo = self.widgetUI.comboBox.currentText()
+        index = get_trigram_index(c, 'h')
+        for z in index.update_iter():
+            yield
+        candidates = index.candidates(literals)
+        prev = self.liveResults
+        if (
+            prev and flags and prev.flags and
+            prev.generation == index.generation and
+            prev.structure == index.structure and
+            prev.combo == combo and prev.root == c.p.v and
+            pat.startswith(prev.pat) and '[' not in prev.pat
+        ):
+            # Every match of pat is a match of prev.pat.
+            if candidates is None:
+                candidates = prev.vnodes
+            else:
+                candidates &= prev.vnodes
+        vnodes, positions = set(), []
         if combo == "All":
-            hNodes = self.c.all_positions()
-        elif combo == "Subtree":
-            hNodes = self.c.p.self_and_subtree()
+            for i, v in enumerate(list(index.numbers) if candidates is None else candidates):
+                if regex.match(v._headString):
+                    vnodes.add(v)
+                if i % 2000 == 1999:
+                    yield
+            for v in vnodes:
+                p = self.vnode2position(v)
+                if p:
+                    positions.append(p)
+            # Show the hits in outline order.
+            positions.sort(key=lambda p: [n for v, n in p.stack] + [p._childIndex])
         else:
-            hNodes = [self.c.p]
-        hm = self.find_h(hpat, hNodes, flags)
-        # self.addHeadlineMatches(hm)
-        # bm = self.c.find_b(bpat, flags)
-        # self.addBodyMatches(bm)
-        return hm, []
-        # self.lw.insertItem(0, "%d hits"%self.lw.count())
+            nodes = c.p.self_and_subtree() if combo == "Subtree" else [c.p]
+            for i, p in enumerate(nodes):
+                if (candidates is None or p.v in candidates) and regex.match(p.h):
+                    vnodes.add(p.v)
+                    positions.append(p.copy())
+                if i % 2000 == 1999:
+                    yield
+        self.liveResults = g.Bunch(pat=pat, flags=flags, combo=combo,
+            root=c.p.v, generation=index.generation, structure=index.structure,
+            vnodes=vnodes)
+        self.clear()
+        for i in range(0, len(positions), 100):
+            if self.addHeadlineMatches(positions[i:i+100]):
+                break
+            yield
+    #@+node:dev.20261018250000.12: *4* vnode2position
+    def vnode2position(self, v):
+        '''Return the first position of v, or None if v is not in the outline.'''
+        stack = []
+        while v.parents:
+            parent = v.parents[0]
+            if v not in parent.children:
+                return None
+            stack.append((v, parent.children.index(v)))
+            v = parent
+        if v is not self.c.hiddenRootNode or not stack:
+            return None
+        stack.reverse()
+        v, n = stack.pop()
+        return leoNodes.Position(v, n, stack)
     #@+node:jlunz.20150826091415.1: *3* find_h
     def find_h(self, regex, nodes, flags=re.IGNORECASE):
         """ Return list (a PosList) of all nodes where zero or more characters at
@@ -707,18 +961,10 @@ class QuickSearchController(object):
         except Exception:
             return res
         for p in nodes:
-            m = re.finditer(pat, p.b)
-            t1, t2 = itertools.tee(m, 2)
-            try:
-                if g.isPython3:
-                    t1.__next__()
-                else:
-                    t1.next()
-            except StopIteration:
-                continue
-            pc = p.copy()
-            pc.matchiter = t2
-            res.append(pc)
+            if pat.search(p.b):
+                pc = p.copy()
+                pc.matchiter = pat.finditer(p.b)
+                res.append(pc)
         return res
     #@+node:ekr.20111015194452.15687: *3* doShowMarked
     def doShowMarked(self):
@@ -724,7 +724,7 @@ if QtWidgets: # NOQA
             # return '%s\n%s\n%s\n\n' % (ch*n,s,ch*n)
             return '%s\n%s\n\n' % (s, ch * n)
         #@+node:ekr.20101112195628.5426: *3* vr.update & helpers
-        # Must have this signature: called by leoPlugins.callTagHandler.
+        # Must have this signature: called by leoPlugins.doHandlersForTag.
 
         def update(self, tag, keywords):
             '''Update the vr pane.'''
@@ -1496,7 +1496,7 @@ class ViewRenderedController(QtWidgets.QWidget):
         # return '%s\n%s\n%s\n\n' % (ch*n,s,ch*n)
         return '%s\n%s\n\n' % (s, ch * n)
     #@+node:ekr.20140226074510.4220: *3* vr2.update & helpers
-    # Must have this signature: called by leoPlugins.callTagHandler.
+    # Must have this signature: called by leoPlugins.doHandlersForTag.
 
     def update(self, tag, keywords):
         pc = self
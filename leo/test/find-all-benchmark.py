@@ -0,0 +1,144 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018260000.1: * @file ../test/find-all-benchmark.py
+'''
+Time find-all, clone-find-all and replace-all on a generated outline
+containing many clones.
+
+Run from the leo-editor directory:
+
+    python leo/test/find-all-benchmark.py [number of nodes]
+
+The "findNextMatch loop" line times the position-by-position search
+that the batch commands used before they searched each vnode once.
+'''
+import os
+import sys
+import time
+
+# Switches...
+n_nodes = 50000         # The number of nodes in the generated outline.
+fanout = 10             # The number of children of each organizer node.
+n_clones = 5            # The number of extra clones of each cloned subtree.
+clone_every = 20        # Clone every clone_every'th top-level subtree.
+trace_sys_path = False  # True: trace imports here.
+
+# Import stuff...
+dir_ = os.path.abspath('.')
+if dir_ not in sys.path:
+    if trace_sys_path: print('appending %s to sys.path' % dir_)
+    sys.path.append(dir_)
+import leo.core.leoBridge as leoBridge
+import leo.core.leoNodes as leoNodes
+
+#@+others
+#@+node:dev.20261018260000.2: ** make_outline
+def make_outline(c, n):
+    '''
+    Replace c's outline with a generated outline of n nodes, then clone
+    some of its subtrees n_clones times. Return the number of positions.
+    '''
+    hidden = c.hiddenRootNode
+    for v in hidden.children:
+        v.parents.remove(hidden)
+    hidden.children = []
+    parents = [hidden]
+    for i in range(n):
+        v = leoNodes.VNode(context=c)
+        v._headString = 'node %s' % i
+        v._bodyString = ''.join(
+            'line %s of node %s: %s\n' % (j, i, 'spam eggs' if (i + j) % 7 == 0 else 'eggs')
+                for j in range(10))
+        parent = parents[i // fanout]
+        parent.children.append(v)
+        v.parents.append(parent)
+        parents.append(v)
+    root = hidden.children[0]
+    clones = leoNodes.VNode(context=c)
+    clones._headString = 'clones'
+    hidden.children.append(clones)
+    clones.parents.append(hidden)
+    for i, v in enumerate(root.children):
+        if i % clone_every == 0:
+            for j in range(n_clones):
+                clones.children.append(v)
+                v.parents.append(clones)
+    c.setRootPosition(leoNodes.Position(root))
+    c.selectPosition(c.rootPosition())
+    return sum(1 for p in c.all_positions(copy=False))
+#@+node:dev.20261018260000.3: ** FindTabManager
+class FindTabManager(object):
+    '''A stand-in for the Find tab.'''
+
+    def __init__(self, find_text, change_text):
+        self.entry_focus = None
+        self.find_text = find_text
+        self.change_text = change_text
+
+    def getFindText(self):
+        return self.find_text
+
+    def getReplaceText(self):
+        return self.change_text
+#@+node:dev.20261018260000.4: ** setup
+def setup(c, find_text, change_text=''):
+    '''Init the find settings of c.'''
+    fc = c.findCommands
+    fc.ftm = FindTabManager(find_text, change_text)
+    for ivar in ('ignore_case', 'mark_changes', 'mark_finds', 'node_only',
+        'pattern_match', 'reverse', 'suboutline_only', 'whole_word', 'wrap',
+    ):
+        setattr(fc, ivar, False)
+    fc.search_headline = fc.search_body = True
+    fc.setup_command()
+    return fc
+#@+node:dev.20261018260000.5: ** benchmarks
+def find_next_match_loop(c):
+    fc = setup(c, 'spam')
+    fc.initInHeadline()
+    fc.initBatchCommands()
+    count = 0
+    while 1:
+        pos, newpos = fc.findNextMatch()
+        if pos is None:
+            return count
+        count += 1
+
+def find_all(c):
+    return setup(c, 'spam').findAll()
+
+def clone_find_all(c):
+    return setup(c, 'spam').findAll(clone_find_all=True)
+
+def clone_find_all_flattened(c):
+    return setup(c, 'spam').findAll(clone_find_all_flattened=True)
+
+def replace_all(c):
+    fc = setup(c, 'spam', 'ham')
+    fc.changeAll()
+    return sum(p.b.count('ham') for p in c.all_unique_positions())
+#@+node:dev.20261018260000.6: ** main
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else n_nodes
+    controller = leoBridge.controller(gui='nullGui',
+        loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    g = controller.globals()
+    g.es = g.es_print = lambda *args, **keys: None
+    c = g.app.newCommander(fileName=None)
+    for name, f in (
+        ('findNextMatch loop', find_next_match_loop),
+        ('find-all', find_all),
+        ('clone-find-all', clone_find_all),
+        ('clone-find-all-flattened', clone_find_all_flattened),
+        ('replace-all', replace_all),
+    ):
+        n_positions = make_outline(c, n)
+        t1 = time.time()
+        result = f(c)
+        t2 = time.time()
+        print('%-26s %6.2f sec. result: %s' % (name, t2 - t1, result))
+    print('%s nodes, %s positions' % (n, n_positions))
+#@-others
+
+if __name__ == '__main__':
+    main()
+#@-leo
@@ -0,0 +1,120 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018320000.6: * @file ../test/leo-reader-benchmark.py
+'''
+Compare the time and peak memory used to read a large .leo file
+with and without @bool stream-leo-file-reads.
+
+Run from the leo-editor directory:
+
+    python leo/test/leo-reader-benchmark.py [number of nodes]
+
+The default outline makes a .leo file of over 100 MB.
+
+Each read runs in a separate process, so that the peak resident set
+sizes are independent. Peak memory is measured only on Unix.
+'''
+import os
+import subprocess
+import sys
+import tempfile
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Switches...
+n_nodes = 50000         # The number of nodes in the generated outline.
+body_size = 2000        # The number of characters in each body.
+fanout = 10             # The number of children of each organizer node.
+trace_sys_path = False  # True: trace imports here.
+
+# Import stuff...
+dir_ = os.path.abspath('.')
+if dir_ not in sys.path:
+    if trace_sys_path: print('appending %s to sys.path' % dir_)
+    sys.path.append(dir_)
+
+#@+others
+#@+node:dev.20261018320000.7: ** make_outline
+def make_outline(c, n):
+    '''Replace c's outline with a generated outline of n nodes.'''
+    import leo.core.leoNodes as leoNodes
+    hidden = c.hiddenRootNode
+    for v in hidden.children:
+        v.parents.remove(hidden)
+    hidden.children = []
+    parents = [hidden]
+    line = 'A line of body text & <markup>.\n'
+    body = line * (body_size // len(line))
+    for i in range(n):
+        v = leoNodes.VNode(context=c)
+        v._headString = 'node %s' % i
+        v._bodyString = body
+        parent = parents[i // fanout]
+        parent.children.append(v)
+        v.parents.append(parent)
+        parents.append(v)
+    c.setRootPosition(leoNodes.Position(hidden.children[0]))
+#@+node:dev.20261018320000.8: ** max_rss
+def max_rss():
+    '''Return the peak resident set size of this process in MB, or 0.'''
+    if not resource:
+        return 0
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        kb = kb // 1024 # ru_maxrss is in bytes on MacOS.
+    return kb / 1024.0
+#@+node:dev.20261018320000.9: ** child
+def child(mode, n, fileName):
+    '''
+    Write a generated outline of n nodes to the .leo file or read the .leo
+    file. Runs in a separate process.
+    '''
+    import leo.core.leoBridge as leoBridge
+    import leo.core.leoFileCommands as leoFileCommands
+    controller = leoBridge.controller(gui='nullGui',
+        loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    g = controller.globals()
+    c = g.app.newCommander(fileName=None)
+    if mode == 'write':
+        make_outline(c, n)
+        ok = c.fileCommands.write_Leo_file(fileName, outlineOnlyFlag=True)
+        assert ok, fileName
+        return
+    c.config.set(None, 'bool', 'stream-leo-file-reads', mode == 'stream')
+    rss1 = max_rss()
+    t1 = time.time()
+    hidden_v = leoFileCommands.FastRead(c, {}).readFile(fileName)
+    t2 = time.time()
+    rss2 = max_rss()
+    assert hidden_v, fileName
+    print('%s %s %s' % (t2 - t1, rss1, rss2))
+#@+node:dev.20261018320000.10: ** main
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else n_nodes
+    fd, fileName = tempfile.mkstemp(suffix='.leo')
+    os.close(fd)
+    try:
+        # Writing the file in this process would raise the peak RSS of the children.
+        subprocess.check_call([sys.executable, __file__, '--child', 'write', str(n), fileName])
+        size = os.path.getsize(fileName) / 1e6
+        results = {}
+        for mode in ('tree', 'stream'):
+            out = subprocess.check_output([sys.executable, __file__, '--child', mode, str(n), fileName])
+            t, rss1, rss2 = [float(z) for z in out.split()[-3:]]
+            results[mode] = t, rss2 - rss1
+    finally:
+        os.remove(fileName)
+    print('%s nodes, %3.1f MB .leo file' % (n, size))
+    for mode in ('tree', 'stream'):
+        t, rss = results[mode]
+        print('%-6s %6.2f sec. peak RSS increase: %6.1f MB' % (mode, t, rss))
+#@-others
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
+#@-leo
@@ -0,0 +1,75 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018210000.8: * @file ../test/plugin-manifest-benchmark.py
+'''
+Compare the time used to create the importer and writer data
+with and without the cached plugin manifest.
+
+Run from the leo-editor directory:
+
+    python leo/test/plugin-manifest-benchmark.py
+
+Each measurement runs in a separate process, so that no plugin
+modules have been imported when the measurement starts.
+'''
+import os
+import subprocess
+import sys
+import time
+
+# Switches...
+repeat = 5              # Report the best of this many runs.
+trace_sys_path = False  # True: trace imports here.
+
+# Import stuff...
+dir_ = os.path.abspath('.')
+if dir_ not in sys.path:
+    if trace_sys_path: print('appending %s to sys.path' % dir_)
+    sys.path.append(dir_)
+
+#@+others
+#@+node:dev.20261018210000.9: ** child
+def child(mode):
+    '''Create the importer and writer data. Runs in a separate process.'''
+    import leo.core.leoBridge as leoBridge
+    controller = leoBridge.controller(gui='nullGui',
+        loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    g = controller.globals()
+    lm = g.app.loadManager
+    if mode == 'import':
+        g.app.db = None # Disable the manifest.
+    t1 = time.time()
+    lm.createAllImporetersData()
+    t2 = time.time()
+    prefixes = ('leo.plugins.importers.', 'leo.plugins.writers.')
+    n = len([z for z in sys.modules if z.startswith(prefixes)])
+    print('%s %s' % (t2 - t1, n))
+#@+node:dev.20261018210000.10: ** run_child
+def run_child(mode):
+    '''Return the time and number of imported plugin modules of a child process.'''
+    out = subprocess.check_output([sys.executable, __file__, '--child', mode])
+    t, n = out.split()[-2:]
+    return float(t), int(n)
+#@+node:dev.20261018210000.11: ** main
+def main():
+    run_child('manifest') # Write the manifest.
+    print('best of %s' % repeat)
+    results = {}
+    for mode in ('import', 'manifest'):
+        times, n = [], 0
+        for i in range(repeat):
+            t, n = run_child(mode)
+            times.append(t)
+        results[mode] = min(times), n
+    t0 = results['import'][0]
+    for mode in ('import', 'manifest'):
+        t, n = results[mode]
+        print('%-8s %6.3f sec. (%4.1fx) %2s plugin modules imported' % (
+            mode, t, t0 / t if t else 0, n))
+#@-others
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+    else:
+        main()
+#@-leo
@@ -0,0 +1,7 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20090529115704.4565: * @shadow unittest/read_test.py
+#@@language python
+#@@tabwidth -4
+#@+others
+#@-others
+#@-leo
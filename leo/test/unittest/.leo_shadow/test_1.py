@@ -0,0 +1,5 @@
+#@+leo-ver=5-thin
+#@+node:ekr.20090529115704.4568: * @shadow unittest/test_1.py
+# body of @shadow test node
+# The last line.
+#@-leo
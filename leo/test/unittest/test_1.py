@@ -0,0 +1,2 @@
+# body of @shadow test node
+# The last line.
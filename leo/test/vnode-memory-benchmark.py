@@ -0,0 +1,116 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018130000.3: * @file ../test/vnode-memory-benchmark.py
+'''
+Compare the memory used by slotted vnodes with the memory used by the
+previous dict-based VNode layout.
+
+Run from the leo-editor directory:
+
+    python leo/test/vnode-memory-benchmark.py [number of nodes]
+
+Requires Python 3.4 or later (tracemalloc).
+'''
+import gc
+import os
+import sys
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Switches...
+n_nodes = 100000        # The number of nodes in the generated outline.
+fanout = 10             # The number of children of each organizer node.
+trace_sys_path = False  # True: trace imports here.
+
+# Import stuff...
+dir_ = os.path.abspath('.')
+if dir_ not in sys.path:
+    if trace_sys_path: print('appending %s to sys.path' % dir_)
+    sys.path.append(dir_)
+import leo.core.leoBridge as leoBridge
+import leo.core.leoNodes as leoNodes
+
+#@+others
+#@+node:dev.20261018130000.4: ** class LegacyVNode
+class LegacyVNode(object):
+    '''
+    A stand-in for the VNode layout used by Leo 5.8 and earlier:
+    all ivars live in the node's __dict__.
+    '''
+
+    def __init__(self, context, gnx):
+        self._headString = 'newHeadline'
+        self._bodyString = ''
+        self.children = []
+        self.parents = []
+        self.fileIndex = gnx
+        self.iconVal = 0
+        self.statusBits = 0
+        self.context = context
+        self.expandedPositions = []
+        self.insertSpot = None
+        self.scrollBarSpot = None
+        self.selectionLength = 0
+        self.selectionStart = 0
+#@+node:dev.20261018130000.5: ** make_outline
+def make_outline(c, factory, n):
+    '''
+    Create n vnodes using factory(c, gnx), linked into a tree of the given fanout.
+    Return the list of all vnodes.
+    '''
+    vnodes = []
+    parent_stack = []
+    for i in range(n):
+        v = factory(c, 'bench.%s' % i)
+        v._headString = 'node %s' % i
+        v._bodyString = 'body of node %s\n' % i
+        if parent_stack:
+            parent = parent_stack[len(vnodes) // fanout % len(parent_stack)]
+            parent.children.append(v)
+            v.parents.append(parent)
+        if i % fanout == 0:
+            parent_stack.append(v)
+        vnodes.append(v)
+    return vnodes
+#@+node:dev.20261018130000.6: ** measure
+def measure(c, factory, n):
+    '''Return the number of bytes allocated while creating an outline of n nodes.'''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        vnodes = make_outline(c, factory, n)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(vnodes) == n
+    return after - before
+#@+node:dev.20261018130000.7: ** new_vnode
+def new_vnode(c, gnx):
+    '''Create a VNode without registering it in c.fileCommands.gnxDict.'''
+    v = leoNodes.VNode(context=c, gnx=gnx)
+    c.fileCommands.gnxDict.pop(gnx, None)
+    return v
+#@+node:dev.20261018130000.8: ** main
+def main():
+    if not tracemalloc:
+        print('tracemalloc is not available')
+        return
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else n_nodes
+    controller = leoBridge.controller(gui='nullGui',
+        loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    g = controller.globals()
+    c = g.app.newCommander(fileName=None)
+    slotted = measure(c, new_vnode, n)
+    legacy = measure(c, LegacyVNode, n)
+    print('%s nodes' % n)
+    print('dict layout:    %8.1f MB %5.0f bytes/node' % (legacy / 1e6, float(legacy) / n))
+    print('slotted layout: %8.1f MB %5.0f bytes/node' % (slotted / 1e6, float(slotted) / n))
+    print('saved:          %8.1f MB (%2.0f%%)' % (
+        (legacy - slotted) / 1e6, 100.0 * (legacy - slotted) / legacy))
+#@-others
+
+if __name__ == '__main__':
+    main()
+#@-leo
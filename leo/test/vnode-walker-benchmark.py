@@ -0,0 +1,115 @@
+#@+leo-ver=5-thin
+#@+node:dev.20261018140000.8: * @file ../test/vnode-walker-benchmark.py
+'''
+Compare the speed of the VNodeWalker with the position generators.
+
+Run from the leo-editor directory:
+
+    python leo/test/vnode-walker-benchmark.py [number of nodes]
+'''
+import os
+import re
+import sys
+import time
+
+# Switches...
+n_nodes = 100000        # The number of nodes in the generated outline.
+fanout = 10             # The number of children of each organizer node.
+repeat = 3              # Report the best of this many runs.
+trace_sys_path = False  # True: trace imports here.
+
+# Import stuff...
+dir_ = os.path.abspath('.')
+if dir_ not in sys.path:
+    if trace_sys_path: print('appending %s to sys.path' % dir_)
+    sys.path.append(dir_)
+import leo.core.leoBridge as leoBridge
+import leo.core.leoNodes as leoNodes
+
+#@+others
+#@+node:dev.20261018140000.9: ** make_outline
+def make_outline(c, n):
+    '''Replace c's outline with a generated outline of n nodes.'''
+    hidden = c.hiddenRootNode
+    for v in hidden.children:
+        v.parents.remove(hidden)
+    hidden.children = []
+    parents = [hidden]
+    for i in range(n):
+        v = leoNodes.VNode(context=c)
+        v._headString = 'node %s' % i
+        v._bodyString = 'body of node %s\n' % i
+        parent = parents[i // fanout]
+        parent.children.append(v)
+        v.parents.append(parent)
+        parents.append(v)
+    c.setRootPosition(leoNodes.Position(hidden.children[0]))
+#@+node:dev.20261018140000.10: ** best_time
+def best_time(f):
+    '''Return the best time of repeat calls to f, and f's result.'''
+    times = []
+    for i in range(repeat):
+        t1 = time.time()
+        result = f()
+        times.append(time.time() - t1)
+    return min(times), result
+#@+node:dev.20261018140000.11: ** benchmarks
+def all_positions_copy(c):
+    return sum(1 for p in c.all_positions())
+
+def all_positions_no_copy(c):
+    return sum(1 for p in c.all_positions(copy=False))
+
+def walk_all_nodes(c):
+    return sum(1 for data in c.walk_all_nodes())
+
+def subtree_copy(c):
+    return sum(1 for p in c.rootPosition().self_and_subtree())
+
+def subtree_no_copy(c):
+    return sum(1 for p in c.rootPosition().self_and_subtree(copy=False))
+
+def walk_self_and_subtree(c):
+    return sum(1 for data in c.rootPosition().walk_self_and_subtree())
+
+find_h_pattern = re.compile('.*77$')
+
+def find_h_positions(c):
+    # The c.find_h loop prior to the VNodeWalker.
+    return [p.copy() for p in c.all_positions() if find_h_pattern.match(p.h)]
+
+def find_h_walker(c):
+    return c.find_h('.*77$')
+#@+node:dev.20261018140000.12: ** main
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else n_nodes
+    controller = leoBridge.controller(gui='nullGui',
+        loadPlugins=False, readSettings=False, silent=True, verbose=False)
+    g = controller.globals()
+    c = g.app.newCommander(fileName=None)
+    make_outline(c, n)
+    print('%s nodes, fanout %s, best of %s' % (n, fanout, repeat))
+    for name, f, base in (
+        ('c.all_positions()', all_positions_copy, None),
+        ('c.all_positions(copy=False)', all_positions_no_copy, None),
+        ('c.walk_all_nodes()', walk_all_nodes, all_positions_no_copy),
+        ('p.self_and_subtree()', subtree_copy, None),
+        ('p.self_and_subtree(copy=False)', subtree_no_copy, None),
+        ('p.walk_self_and_subtree()', walk_self_and_subtree, subtree_no_copy),
+        ('find_h using positions', find_h_positions, None),
+        ('c.find_h', find_h_walker, find_h_positions),
+    ):
+        t, result = best_time(lambda: f(c))
+        if base:
+            t0, result0 = best_time(lambda: base(c))
+            if isinstance(result, list):
+                result, result0 = len(result), len(result0)
+            assert result == result0, (name, result, result0)
+            print('%-32s %6.3f sec. (%4.1fx)' % (name, t, t0 / t if t else 0))
+        else:
+            print('%-32s %6.3f sec.' % (name, t))
+#@-others
+
+if __name__ == '__main__':
+    main()
+#@-leo